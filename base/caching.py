@@ -1,7 +1,8 @@
 #5
 from __future__ import annotations
+import asyncio
 import logging
-from typing import Callable, Generic, Iterable, Self, Sequence, cast, overload, TypeVar, ParamSpec, TypeVarTuple
+from typing import Awaitable, Callable, Generic, Iterable, Self, Sequence, cast, overload, TypeVar, ParamSpec, TypeVarTuple
 from base import dates
 from base.algos import binary_search, lower_whole, upper_whole
 from base.key_series_storage import KeySeriesStorage
@@ -27,7 +28,7 @@ class CachedScalarDescriptor(Generic[S, *Args, T]):
         self.get_storage = get_storage
         self.get_refresh_interval = get_refresh_interval
     
-    def cached_method(self, instance: S, *args: *Args) -> T:
+    def _lookup(self, instance: S, *args: *Args) -> tuple[str, KeyValueStorage, T|None, bool]:
         key = self.get_key(instance, *args)
         assert not key.endswith(_LAST_FETCH)
         storage = self.get_storage(instance, *args)
@@ -35,13 +36,27 @@ class CachedScalarDescriptor(Generic[S, *Args, T]):
         try:
             data = storage.get(key)
             unix_time = storage.get(f"{key}{_LAST_FETCH}")
-            if unix_time + refresh_interval > dates.unix(): return data
+            if unix_time + refresh_interval > dates.unix(): return key, storage, data, True
         except NotFoundError:
             pass
-        result = self.func(instance, *args)
+        return key, storage, None, False
+    def _store(self, storage: KeyValueStorage, key: str, result: T) -> T:
         storage.set(key, result)
         storage.set(f"{key}{_LAST_FETCH}", dates.unix())
         return result
+
+    def cached_method(self, instance: S, *args: *Args) -> T:
+        key, storage, data, hit = self._lookup(instance, *args)
+        if hit: return cast(T, data)
+        return self._store(storage, key, self.func(instance, *args))
+    
+    async def cached_method_async(self, instance: S, fetch: Callable[[*Args], Awaitable[T]], *args: *Args) -> T:
+        """
+        Same as cached_method, but the value is fetched by awaiting fetch(*args) instead of calling the decorated method.
+        """
+        key, storage, data, hit = self._lookup(instance, *args)
+        if hit: return cast(T, data)
+        return self._store(storage, key, await fetch(*args))
     
     @overload
     def __get__(self, instance: None, owner: type[S]) -> Self: ...
@@ -80,6 +95,7 @@ class CachedSeriesDescriptor(Generic[S, *Args, T]):
         get_max_chunk: Callable[[S, *Args], float|None],
         get_delay: Callable[[S, *Args], float],
         should_refresh: Callable[[S, float, float, *Args], bool],  
+        get_max_batch: Callable[[S, *Args], float|None] = lambda self, *args: None
     ):
         self.func = func
         self.get_key = get_key
@@ -89,38 +105,94 @@ class CachedSeriesDescriptor(Generic[S, *Args, T]):
         self.get_max_chunk = get_max_chunk
         self.get_delay = get_delay
         self.should_refresh = should_refresh
+        self.get_max_batch = get_max_batch
+        self.inflight: dict[tuple[int, str, float, float], asyncio.Future[Sequence[T]]] = {}
     
-    def cached_method(self, instance: S, unix_from: float, unix_to: float, *args: *Args) -> Sequence[T]:
+    def _plan(self, instance: S, unix_from: float, unix_to: float, *args: *Args) -> tuple[str, float, float, list[tuple[float,float]], list[list[tuple[float, float]]]]:
+        """
+        Returns the key, the clipped query span, the currently covered spans and the chunks that should be fetched,
+        grouped into batches that are fetched with a single call.
+        """
         key = self.get_key(instance, *args)
         kv_storage = self.get_kv_storage(instance)
-        ks_storage = self.get_ks_storage(instance)
         min_chunk = self.get_min_chunk(instance, *args)
         max_chunk = self.get_max_chunk(instance, *args)
         unix_now = dates.unix() - self.get_delay(instance, *args)
 
         unix_to = min(unix_to, unix_now)
         unix_from = min(unix_from, unix_to)
-        if unix_to == unix_from: return []
+        if unix_to == unix_from: return key, unix_from, unix_to, [], []
         
         # Extend scope
         if min_chunk: target = (lower_whole(unix_from, min_chunk), min(upper_whole(unix_to, min_chunk), unix_now))
         else: target = (unix_from, unix_to)
         
         spans = kv_storage.get_or_set(key, [], list[tuple[float, float]])
-        covered: tuple[float,float]|None = None
-        for span_from, span_to in CachedSeriesDescriptor.missing_spans(spans, target): #get unfilled spans
-            for start, end in CachedSeriesDescriptor.break_span((span_from, span_to), max_chunk): #break based on max chunk
-                if end < unix_now or self.should_refresh(instance, start, end, *args):
-                    ks_storage.set(key, self.func(instance, start, end, *args))
-                    covered = (covered[0], end) if covered else (start, end)
-        
-        if covered:
+        chunks = [
+            (start, end)
+            for span in CachedSeriesDescriptor.missing_spans(spans, target) #get unfilled spans
+            for start, end in CachedSeriesDescriptor.break_span(span, max_chunk) #break based on max chunk
+            if end < unix_now or self.should_refresh(instance, start, end, *args)
+        ]
+        return key, unix_from, unix_to, spans, CachedSeriesDescriptor.batch_chunks(chunks, self.get_max_batch(instance, *args))
+    
+    def _store(self, instance: S, key: str, batch: list[tuple[float,float]], data: Sequence[T]):
+        """Stores the data of a batch, one chunk at a time."""
+        ks_storage = self.get_ks_storage(instance)
+        if len(batch) == 1:
+            ks_storage.set(key, data)
+            return
+        for start, end in batch:
+            i = binary_search(data, start, key=ks_storage.timestamp, side='GT')
+            j = binary_search(data, end, key=ks_storage.timestamp, side='GT')
+            ks_storage.set(key, data[i:j])
+
+    def _commit(self, instance: S, key: str, spans: list[tuple[float,float]], batches: list[list[tuple[float,float]]]):
+        if not batches: return
+        kv_storage = self.get_kv_storage(instance)
+        covered = (batches[0][0][0], batches[-1][-1][1])
+        newspans = self.cover_spans(spans, covered)
+        while spans != newspans and not kv_storage.compare_and_set(key, newspans, spans):
+            spans = kv_storage.get(key, list[tuple[float,float]])
             newspans = self.cover_spans(spans, covered)
-            while spans != newspans and not kv_storage.compare_and_set(key, newspans, spans):
-                spans = kv_storage.get(key, list[tuple[float,float]])
-                newspans = self.cover_spans(spans, covered)
-        
-        return ks_storage.get(key, unix_from, unix_to)
+
+    def cached_method(self, instance: S, unix_from: float, unix_to: float, *args: *Args) -> Sequence[T]:
+        key, unix_from, unix_to, spans, batches = self._plan(instance, unix_from, unix_to, *args)
+        if unix_to == unix_from: return []
+        for batch in batches:
+            self._store(instance, key, batch, self.func(instance, batch[0][0], batch[-1][1], *args))
+        self._commit(instance, key, spans, batches)
+        return self.get_ks_storage(instance).get(key, unix_from, unix_to)
+    
+    async def cached_method_async(
+        self,
+        instance: S,
+        fetch: Callable[[float, float, *Args], Awaitable[Sequence[T]]],
+        unix_from: float,
+        unix_to: float,
+        *args: *Args
+    ) -> Sequence[T]:
+        """
+        Same as cached_method, but the missing batches are fetched concurrently by awaiting fetch(start, end, *args)
+        instead of calling the decorated method.
+        Concurrent calls that need the same batch share a single fetch.
+        If any of the batches fails, nothing is stored and the first exception is propagated.
+        """
+        key, unix_from, unix_to, spans, batches = self._plan(instance, unix_from, unix_to, *args)
+        if unix_to == unix_from: return []
+        loop = asyncio.get_running_loop()
+        def get_future(start: float, end: float) -> asyncio.Future[Sequence[T]]:
+            inflight_key = (id(instance), key, start, end)
+            future = self.inflight.get(inflight_key)
+            if future is None or future.get_loop() is not loop:
+                future = asyncio.ensure_future(fetch(start, end, *args))
+                self.inflight[inflight_key] = future
+                future.add_done_callback(lambda it: self.inflight.pop(inflight_key) if self.inflight.get(inflight_key) is it else None)
+            return asyncio.shield(future)
+        results = await asyncio.gather(*(get_future(batch[0][0], batch[-1][1]) for batch in batches))
+        for batch, result in zip(batches, results): self._store(instance, key, batch, result)
+        self._commit(instance, key, spans, batches)
+        return self.get_ks_storage(instance).get(key, unix_from, unix_to)
     
     def _invalidate(self, instance: S, unix_from: float, unix_to: float, key: str):
         kv_storage = self.get_kv_storage(instance)
@@ -174,6 +246,16 @@ class CachedSeriesDescriptor(Generic[S, *Args, T]):
         if start < target[1]:
             yield (start, target[1])
     
+    @staticmethod
+    def batch_chunks(chunks: Sequence[tuple[float,float]], max_batch: float|None) -> list[list[tuple[float,float]]]:
+        """Groups adjacent chunks into batches spanning at most max_batch (or single chunks if max_batch is None)."""
+        batches: list[list[tuple[float,float]]] = []
+        for chunk in chunks:
+            if max_batch and batches and batches[-1][-1][1] == chunk[0] and chunk[1] - batches[-1][0][0] <= max_batch:
+                batches[-1].append(chunk)
+            else: batches.append([chunk])
+        return batches
+
     @staticmethod
     def cover_spans(existing: Sequence[tuple[float,float]], covered: tuple[float,float]) -> list[tuple[float,float]]:
         if covered[0] >= covered[1]: return list(existing)
@@ -209,6 +291,7 @@ def cached_series(
     max_chunk: float | None | Callable[[S, *Args], float|None] = None,
     live_delay: float | None | Callable[[S, *Args], float] = None,
     should_refresh: float | Callable[[S, float, float, *Args], bool] = 0,
+    max_batch: float | None | Callable[[S, *Args], float|None] = None
 ) -> Callable[[Callable[[S, float, float, *Args], Sequence[T]]], CachedSeriesDescriptor[S, *Args, T]]:
     def decorate(func: Callable[[S, float, float, *Args], Sequence[T]]) -> CachedSeriesDescriptor[S, *Args, T]:
         return CachedSeriesDescriptor(
@@ -219,6 +302,7 @@ def cached_series(
             min_chunk if callable(min_chunk) else (lambda self, *args: cast(float|None, min_chunk)),
             max_chunk if callable(max_chunk) else (lambda self, *args: cast(float|None, max_chunk)),
             live_delay if callable(live_delay) else (lambda self, *args: -1.0e10) if live_delay is None else (lambda self, *args: cast(float, live_delay)),
-            should_refresh if callable(should_refresh) else lambda self, fetch, now, *args: now-fetch > cast(float, should_refresh)
+            should_refresh if callable(should_refresh) else lambda self, fetch, now, *args: now-fetch > cast(float, should_refresh),
+            max_batch if callable(max_batch) else (lambda self, *args: cast(float|None, max_batch))
         )
     return decorate
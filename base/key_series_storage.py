@@ -14,6 +14,7 @@ from base.serialization import Serializer, GenericSerializer
 T = TypeVar('T')
 
 class KeySeriesStorage(Generic[T]):
+    timestamp: Callable[[T], float]
     def get(self, key: str, start: float, end: float) -> Sequence[T]: ...
     def set(self, key: str, data: Sequence[T]):
         """Upsert data (based on key+timestamp). Ensures no duplicates."""
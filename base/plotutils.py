@@ -1,7 +1,7 @@
-#1
-import matplotlib
-from matplotlib import pyplot as plt
-import matplotlib.figure
+#2
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING: import matplotlib.figure
 
 
 COLORS = ['red', 'blue', 'green', 'orange', 'purple', 'black']
@@ -5,9 +5,20 @@ import sys
 import os
 from pathlib import Path
 from types import ModuleType
-from typing import Callable, Iterable
+from typing import Any, Callable, Iterable
 from base.utils import cached
 
+class LazyModule(ModuleType):
+    """Proxy for a module that is only imported on first attribute access."""
+    def __getattr__(self, name: str) -> Any:
+        return getattr(importlib.import_module(self.__name__), name)
+def lazy_import(name: str) -> ModuleType:
+    """
+    Use this for heavy modules that are not needed by all code paths.
+    For type checking, import the module under TYPE_CHECKING instead.
+    """
+    return sys.modules.get(name) or LazyModule(name)
+
 def get_full_classname(obj_or_cls: object) -> str:
     if not isinstance(obj_or_cls, type): cls = type(obj_or_cls)
     else: cls = obj_or_cls
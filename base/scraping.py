@@ -1,5 +1,14 @@
 #2
+from __future__ import annotations
 from numbers import Number
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import functools
+import hashlib
+import inspect
+import random
+import zlib
 import requests
 import logging
 import json
@@ -7,9 +16,13 @@ import re
 import time
 import config
 from typing import Callable, Any, override
+from urllib import parse
+from pathlib import Path
 from http import HTTPStatus
-from enum import Flag, auto
+from enum import Enum, Flag, auto
 from base import text, dates
+from base.key_value_storage import KeyValueStorage, SqlKVStorage, NotFoundError
+from base.db import sqlite_engine
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +109,202 @@ class BrowserImpersonator(Scraper):
         if check_response: assert_response(url, response)
         return response
     
-scraper = BrowserImpersonator()
+class CassetteMissException(Exception):
+    def __init__(self, method: str, url: str):
+        super().__init__()
+        self.method = method
+        self.url = url
+    def __str__(self) -> str:
+        return f"No recorded response for {self.method} {self.url}."
+
+class Cassette:
+    """
+    Stores responses keyed by the normalized request (method, url with query params, and body).
+    Cookies and headers are not part of the key. Response contents are compressed.
+    """
+    def __init__(self, storage: KeyValueStorage):
+        self.storage = storage
+    
+    @staticmethod
+    def at(path: Path|str) -> Cassette:
+        """Returns a cassette backed by an sqlite file, safe to use from multiple threads."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        return Cassette(SqlKVStorage(sqlite_engine(path), "cassette"))
+
+    @staticmethod
+    def get_key(method: str, url: str, params: dict|None, body: Any = None) -> str:
+        parts = parse.urlsplit(url)
+        query = parse.parse_qsl(parts.query, keep_blank_values=True)
+        for key, value in (params or {}).items():
+            for it in (value if isinstance(value, (list, tuple)) else [value]): query.append((str(key), str(it)))
+        normalized = {
+            'method': method.upper(),
+            'url': f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path}",
+            'query': sorted(query),
+            'body': body
+        }
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key: str) -> requests.Response|None:
+        try:
+            data = self.storage.get(key, dict)
+        except NotFoundError:
+            return None
+        response = requests.Response()
+        response.status_code = data['status']
+        response.url = data['url']
+        response.encoding = data['encoding']
+        response.headers.update(data['headers'])
+        response._content = zlib.decompress(base64.b64decode(data['content']))
+        return response
+    
+    def get_time(self) -> float|None:
+        """The time of the recording, if set, so that replays can run at the same time."""
+        try:
+            return float(self.storage.get('time'))
+        except NotFoundError:
+            return None
+    def set_time(self, unix_time: float):
+        self.storage.set('time', unix_time)
+
+    def save(self, key: str, response: requests.Response):
+        self.storage.set(key, {
+            'status': response.status_code,
+            'url': response.url,
+            'encoding': response.encoding,
+            'headers': {'Content-Type': response.headers['Content-Type']} if 'Content-Type' in response.headers else {},
+            'content': base64.b64encode(zlib.compress(response.content, 9)).decode()
+        })
+
+class ScraperMode(Enum):
+    LIVE = auto()
+    RECORD = auto()
+    REPLAY = auto()
+
+class CassetteScraper(Scraper):
+    """
+    Wraps a scraper, optionally recording its responses to a cassette (RECORD),
+    or serving them from a cassette instead (REPLAY), without touching the network.
+    Replayed responses go through the same response checks.
+    Args:
+        latency: The delay of each replayed response, in seconds.
+            Either a fixed value or a (min, max) range to sample uniformly from.
+    """
+    def __init__(
+        self,
+        scraper: Scraper,
+        mode: ScraperMode = ScraperMode.LIVE,
+        cassette: Cassette|None = None,
+        latency: float|tuple[float, float] = 0,
+        seed: int|None = None
+    ):
+        self.scraper = scraper
+        self.random = random.Random(seed)
+        self.set_mode(mode, cassette, latency)
+    
+    def set_mode(self, mode: ScraperMode, cassette: Cassette|None = None, latency: float|tuple[float, float] = 0):
+        if mode != ScraperMode.LIVE and not cassette: raise Exception(f"A cassette is required for {mode}.")
+        self.mode = mode
+        self.cassette = cassette
+        self.latency = latency
+    def live(self): self.set_mode(ScraperMode.LIVE)
+    def record(self, cassette: Cassette): self.set_mode(ScraperMode.RECORD, cassette)
+    def replay(self, cassette: Cassette, latency: float|tuple[float, float] = 0): self.set_mode(ScraperMode.REPLAY, cassette, latency)
+
+    def _replay(self, method: str, url: str, key: str, check_response: bool) -> requests.Response:
+        assert self.cassette
+        response = self.cassette.load(key)
+        if response is None: raise CassetteMissException(method, url)
+        latency = self.random.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency
+        if latency > 0: time.sleep(latency)
+        logger.info(f"REPLAY {method} {url} -> {response.status_code}")
+        if check_response: assert_response(url, response)
+        return response
+    def _record(self, url: str, key: str, response: requests.Response, check_response: bool) -> requests.Response:
+        assert self.cassette
+        self.cassette.save(key, response)
+        if check_response: assert_response(url, response)
+        return response
+
+    @override
+    def get(self, url: str, *, cookies: dict = {}, headers: dict = {}, params: dict | None = None, origin: str | None = None, check_response: bool = True) -> requests.Response:
+        if self.mode == ScraperMode.LIVE:
+            return self.scraper.get(url, cookies=cookies, headers=headers, params=params, origin=origin, check_response=check_response)
+        key = Cassette.get_key('GET', url, params)
+        if self.mode == ScraperMode.REPLAY: return self._replay('GET', url, key, check_response)
+        response = self.scraper.get(url, cookies=cookies, headers=headers, params=params, origin=origin, check_response=False)
+        return self._record(url, key, response, check_response)
+    @override
+    def post(self, url: str, body: dict|list|str|Number|bool|None, *, cookies: dict = {}, headers: dict = {}, params: dict | None = None, origin: str | None = None, check_response: bool = True) -> requests.Response:
+        if self.mode == ScraperMode.LIVE:
+            return self.scraper.post(url, body, cookies=cookies, headers=headers, params=params, origin=origin, check_response=check_response)
+        key = Cassette.get_key('POST', url, params, body)
+        if self.mode == ScraperMode.REPLAY: return self._replay('POST', url, key, check_response)
+        response = self.scraper.post(url, body, cookies=cookies, headers=headers, params=params, origin=origin, check_response=False)
+        return self._record(url, key, response, check_response)
+
+    def call(self, name: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Records or replays the json result of a request made outside of the scraper,
+        e.g. by a third party client with its own session, under a url-like name.
+        """
+        if self.mode == ScraperMode.LIVE: return fetch()
+        key = Cassette.get_key('CALL', name, None)
+        if self.mode == ScraperMode.REPLAY: return self._replay('CALL', name, key, False).json()
+        result = fetch()
+        response = requests.Response()
+        response.status_code = HTTPStatus.OK
+        response.url = name
+        response.encoding = 'utf-8'
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(result).encode()
+        self._record(name, key, response, False)
+        return result
+
+scraper = CassetteScraper(BrowserImpersonator())
+
+class AsyncScraper:
+    async def get(
+        self,
+        url: str,
+        *, 
+        cookies: dict = {}, 
+        headers: dict = {}, 
+        params: dict|None = None, 
+        origin: str|None = None, 
+        check_response: bool = True
+    ) -> requests.Response: ...
+    async def post(
+        self,
+        url: str,
+        body: dict|list|str|Number|bool|None,
+        *,
+        cookies: dict = {}, 
+        headers: dict = {}, 
+        params: dict|None = None, 
+        origin: str|None = None, 
+        check_response: bool = True
+    ) -> requests.Response: ...
+
+class ThreadedAsyncScraper(AsyncScraper):
+    """
+    Runs the requests of a blocking scraper on a dedicated thread pool,
+    so that many requests can be awaited concurrently.
+    Logging and response checks are those of the wrapped scraper.
+    """
+    def __init__(self, scraper: Scraper = scraper, max_concurrency: int = 64):
+        self.scraper = scraper
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="scraper")
+    @override
+    async def get(self, url: str, *, cookies: dict = {}, headers: dict = {}, params: dict | None = None, origin: str | None = None, check_response: bool = True) -> requests.Response:
+        call = functools.partial(self.scraper.get, url, cookies=cookies, headers=headers, params=params, origin=origin, check_response=check_response)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+    @override
+    async def post(self, url: str, body: dict|list|str|Number|bool|None, *, cookies: dict = {}, headers: dict = {}, params: dict | None = None, origin: str | None = None, check_response: bool = True) -> requests.Response:
+        call = functools.partial(self.scraper.post, url, body, cookies=cookies, headers=headers, params=params, origin=origin, check_response=check_response)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+async_scraper = ThreadedAsyncScraper()
 
 class BackupBehavior(Flag):
     DEFAULT = 0
@@ -115,41 +323,65 @@ def backup_timeout[T: Callable](
     base_timeout: float = 30.0,
     backoff_factor: float = 2.0
 ) -> Callable[[T], T]:
+    """
+    The backup state is shared by all functions decorated with the same decorator instance,
+    so sync and async variants of a fetch can be backed up together.
+    """
     last_break: float|None = None
     last_exception: Exception|None = None
     last_timeout: float|None = None
+    def backup_time() -> float:
+        if last_break and last_exception and last_timeout: return last_break + last_timeout - dates.unix()
+        return 0
+    def on_backed_up(behavior: BackupBehavior):
+        assert last_exception
+        if BackupBehavior.RERAISE in behavior:
+            last_exception.__traceback__ = None
+            raise BackupException(backup_time()) from last_exception
+    def start() -> float:
+        nonlocal last_break
+        nonlocal last_exception
+        nonlocal last_timeout
+        last_break = None
+        last_exception = None
+        timeout = last_timeout*backoff_factor if last_timeout else base_timeout
+        last_timeout = None
+        return timeout
+    def on_exception(func: Callable, ex: Exception, timeout: float, behavior: BackupBehavior) -> None:
+        nonlocal last_break
+        nonlocal last_exception
+        nonlocal last_timeout
+        if isinstance(ex, exc_type):
+            last_break = dates.unix()
+            last_exception = ex
+            last_timeout = timeout
+            logger.error(f"Timing {func.__name__} out for {timeout} with behavior {behavior}.", exc_info = True)
+            if BackupBehavior.RERAISE in behavior:
+                raise BackupException(timeout) from ex
+            else:
+                return None
+        raise ex
     def decorate(func: T) -> T:
         def wrapper(*args: Any, **kwargs: Any) -> Any:
             behavior: BackupBehavior = default_behavior
-            nonlocal last_break
-            nonlocal last_exception
-            nonlocal last_timeout
-            if last_break and last_exception and last_timeout:
-                backup_time = last_break + last_timeout - dates.unix()
-                if backup_time > 0:
-                    if BackupBehavior.SLEEP in behavior:
-                        time.sleep(backup_time)
-                    elif BackupBehavior.RERAISE in behavior:
-                        last_exception.__traceback__ = None
-                        raise BackupException(backup_time) from last_exception
-                    else:
-                        return None
-            last_break = None
-            last_exception = None
-            timeout = last_timeout*backoff_factor if last_timeout else base_timeout
-            last_timeout = None
+            if backup_time() > 0:
+                if BackupBehavior.SLEEP in behavior: time.sleep(backup_time())
+                else: return on_backed_up(behavior)
+            timeout = start()
             try:
                 return func(*args, **kwargs)
             except Exception as ex:
-                if isinstance(ex, exc_type):
-                    last_break = dates.unix()
-                    last_exception = ex
-                    last_timeout = timeout
-                    logger.error(f"Timing {func.__name__} out for {timeout} with behavior {behavior}.", exc_info = True)
-                    if BackupBehavior.RERAISE in behavior:
-                        raise BackupException(timeout) from ex
-                    else:
-                        return None
-                raise
-        return wrapper # type: ignore
+                return on_exception(func, ex, timeout, behavior)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            behavior: BackupBehavior = default_behavior
+            if backup_time() > 0:
+                if BackupBehavior.SLEEP in behavior: await asyncio.sleep(backup_time())
+                else: return on_backed_up(behavior)
+            timeout = start()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as ex:
+                return on_exception(func, ex, timeout, behavior)
+        if inspect.iscoroutinefunction(func): return functools.wraps(func)(async_wrapper) # type: ignore
+        return functools.wraps(func)(wrapper) # type: ignore
     return decorate
\ No newline at end of file
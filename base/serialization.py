@@ -14,6 +14,7 @@ from base.reflection import get_full_classname, get_class_by_full_classname, get
 type json_type = None|bool|int|float|str|list|dict
 
 class Serializable:
+    __slots__ = ()
     def to_json(self) -> json_type:
         skips = get_trainsent(type(self))
         return {key:self.__dict__[key] for key in self.__dict__ if key not in skips}
@@ -0,0 +1,29 @@
+#1
+import math
+import threading
+
+class LatencyStats:
+    """
+    Exponentially weighted latency and success rate of a repeated operation, e.g. a provider method.
+    """
+    def __init__(self, alpha: float = 0.2, prior_latency: float = 1.0):
+        self.alpha = alpha
+        self.latency = prior_latency
+        self.latency_var = (prior_latency/2)**2
+        self.success = 1.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, success: bool):
+        with self.lock:
+            deviation = latency - self.latency
+            self.latency += self.alpha*deviation
+            self.latency_var = (1-self.alpha)*(self.latency_var + self.alpha*deviation**2)
+            self.success += self.alpha*(float(success) - self.success)
+            self.count += 1
+    def p95(self) -> float:
+        """An estimate of the 95th latency percentile, assuming normally distributed latencies."""
+        return self.latency + 1.645*math.sqrt(self.latency_var)
+    def score(self) -> float:
+        """The expected time until a successful response. Lower is better."""
+        return self.latency/max(self.success, 0.01)
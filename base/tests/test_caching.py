@@ -1,4 +1,5 @@
 from __future__ import annotations
+import asyncio
 from unittest import skip
 from parameterized import parameterized
 from base import dates
@@ -24,23 +25,26 @@ class SimpleScalarProvider:
         return A(dates.unix(), key)
 
 class SimpleProvider:
-    def __init__(self, kv_storage: KeyValueStorage, ks_storage: KeySeriesStorage[A], min_chunk: float|None = 10, max_chunk: float|None = None):
+    def __init__(self, kv_storage: KeyValueStorage, ks_storage: KeySeriesStorage[A], min_chunk: float|None = 10, max_chunk: float|None = None, max_batch: float|None = None):
         self.kv_storage = kv_storage
         self.ks_storage = ks_storage
         self.min_chunk = min_chunk
         self.max_chunk = max_chunk
+        self.max_batch = max_batch
         self.invocations = 0
     def _key_fn(self) -> str: return ""
     def _kv_storage(self) -> KeyValueStorage: return self.kv_storage
     def _ks_storage(self) -> KeySeriesStorage[A]: return self.ks_storage
     def _min_chunk(self) -> float|None: return self.min_chunk
     def _max_chunk(self) -> float|None: return self.max_chunk
+    def _max_batch(self) -> float|None: return self.max_batch
     @cached_series(
         key=_key_fn,
         ks_storage=_ks_storage,
         kv_storage=_kv_storage,
         min_chunk=_min_chunk,
-        max_chunk=_max_chunk
+        max_chunk=_max_chunk,
+        max_batch=_max_batch
     )
     def get_series(self, unix_from: float, unix_to: float) -> list[A]:
         self.invocations += 1
@@ -144,6 +148,13 @@ class TestCaching(TestPersistence):
             result = list(CachedSeriesDescriptor.break_span(target, max_chunk))
             self.assertEqual(expect, result)
 
+    def test_batch_chunks(self):
+        chunks = [(0,10),(10,20),(20,30),(40,50),(50,60)]
+        self.assertEqual([[it] for it in chunks], CachedSeriesDescriptor.batch_chunks(chunks, None))
+        self.assertEqual([[(0,10),(10,20)],[(20,30)],[(40,50),(50,60)]], CachedSeriesDescriptor.batch_chunks(chunks, 20))
+        self.assertEqual([[(0,10),(10,20),(20,30)],[(40,50),(50,60)]], CachedSeriesDescriptor.batch_chunks(chunks, float('inf')))
+        self.assertEqual([], CachedSeriesDescriptor.batch_chunks([], 20))
+
     def test_cover_spans(self):
         examples: list[tuple[list[tuple[float,float]], tuple[float,float], list[tuple[float,float]]]] = [
             ([(5,10), (15,20), (25, 30), (35, 40), (45, 50)], (17, 38), [(5,10),(15,40),(45,50)]),
@@ -199,6 +210,44 @@ class TestCaching(TestPersistence):
             test(start, end, min_chunk)
             self.tearDown()
     
+    @parameterized.expand(ks_types)
+    def test_cached_series_async(self, storage_type: storage_type):
+        provider = SimpleProvider(self.get_kv_storage(storage_type), self.get_ks_storage(storage_type), min_chunk=10, max_chunk=10)
+        fetched: list[tuple[float, float]] = []
+        async def fetch(unix_from: float, unix_to: float) -> list[A]:
+            fetched.append((unix_from, unix_to))
+            await asyncio.sleep(0)
+            return [A(it) for it in range(int(unix_from)+1, int(unix_to)+1)]
+        descriptor = SimpleProvider.get_series
+        data = asyncio.run(descriptor.cached_method_async(provider, fetch, 15, 42))
+        self.assertEqual([A(it) for it in range(16, 43)], data)
+        self.assertEqual([(10, 20), (20, 30), (30, 40), (40, 50)], fetched)
+        self.assertEqual(data, provider.get_series(15, 42))
+        self.assertEqual(0, provider.invocations)
+        asyncio.run(descriptor.cached_method_async(provider, fetch, 0, 42))
+        self.assertEqual(5, len(fetched))
+
+    @parameterized.expand(kv_types)
+    def test_cached_scalar_async(self, storage_type: storage_type):
+        provider = SimpleScalarProvider(self.get_kv_storage(storage_type))
+        async def fetch(key: str) -> A:
+            return A(1, key)
+        self.assertEqual(A(1, "key"), asyncio.run(SimpleScalarProvider.get_data.cached_method_async(provider, fetch, "key")))
+        self.assertEqual(A(1, "key"), provider.get_data("key"))
+        self.assertEqual(0, provider.invocations)
+
+    @parameterized.expand(ks_types)
+    def test_cached_series_batched(self, storage_type: storage_type):
+        provider = SimpleProvider(self.get_kv_storage(storage_type), self.get_ks_storage(storage_type), min_chunk=10, max_chunk=10, max_batch=30)
+        self.assertEqual([A(it) for it in range(16, 43)], provider.get_series(15, 42))
+        self.assertEqual(2, provider.invocations)
+        provider.get_series(65, 72)
+        self.assertEqual(3, provider.invocations)
+        self.assertEqual([A(it) for it in range(1, 81)], provider.get_series(0, 80))
+        self.assertEqual(5, provider.invocations)
+        self.assertEqual([A(it) for it in range(1, 81)], provider.get_series(0, 80))
+        self.assertEqual(5, provider.invocations)
+
     @parameterized.expand(ks_types)
     def test_cached_series(self, storage_type: storage_type):
         KEY1 = "k1"
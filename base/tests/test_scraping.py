@@ -1,6 +1,25 @@
 import unittest
+import asyncio
+import threading
 import time
-from base.scraping import backup_timeout, BackupBehavior, BackupException
+import requests
+from base.key_value_storage import MemoryKVStorage
+from base.scraping import Scraper, ThreadedAsyncScraper, Cassette, CassetteScraper, CassetteMissException, ScraperMode, TooManyRequestsException, backup_timeout, BackupBehavior, BackupException
+
+class EchoScraper(Scraper):
+    def __init__(self):
+        self.invocations = 0
+    def _respond(self, status: int, text: str) -> requests.Response:
+        self.invocations += 1
+        response = requests.Response()
+        response.status_code = status
+        response.encoding = 'utf-8'
+        response._content = text.encode()
+        return response
+    def get(self, url, *, cookies = {}, headers = {}, params = None, origin = None, check_response = True):
+        return self._respond(429 if 'limited' in url else 200, f"GET {url} {params}")
+    def post(self, url, body, *, cookies = {}, headers = {}, params = None, origin = None, check_response = True):
+        return self._respond(200, f"POST {url} {body}")
 
 class TestHttputils(unittest.TestCase):
     def test_backup_timeout_decorator(self):
@@ -64,4 +83,99 @@ class TestHttputils(unittest.TestCase):
         self.assertRaises(BackupException, test_method) #invocation 1
         self.assertRaises(BackupException, test_method) #sleep + invocation 2
         self.assertRaises(BackupException, test_method) #sleep + invocation 3
-        self.assertEqual('Success', test_method())
\ No newline at end of file
+        self.assertEqual('Success', test_method())
+
+    def test_backup_timeout_async(self):
+        class TestException(Exception):
+            pass
+        base_timeout = 0.05
+        invocations = 0
+        backup = backup_timeout(exc_type=TestException, default_behavior=BackupBehavior.RERAISE, base_timeout=base_timeout, backoff_factor=2)
+        @backup
+        async def test_method_async():
+            nonlocal invocations
+            invocations += 1
+            if invocations > 1:
+                return 'Success'
+            raise TestException()
+        @backup
+        def test_method():
+            return 'Success'
+        
+        self.assertRaises(BackupException, asyncio.run, test_method_async())
+        self.assertRaises(BackupException, test_method) #shared backup state
+        time.sleep(base_timeout)
+        self.assertEqual('Success', asyncio.run(test_method_async()))
+        self.assertEqual('Success', test_method())
+    
+    def test_threaded_async_scraper(self):
+        delay = 0.2
+        class SlowScraper(Scraper):
+            def __init__(self):
+                self.threads: set[int] = set()
+            def get(self, url, *, cookies = {}, headers = {}, params = None, origin = None, check_response = True):
+                self.threads.add(threading.get_ident())
+                time.sleep(delay)
+                response = requests.Response()
+                response.status_code = 200
+                response._content = url.encode()
+                return response
+        scraper = SlowScraper()
+        async_scraper = ThreadedAsyncScraper(scraper, max_concurrency=10)
+        async def fetch_all():
+            return await asyncio.gather(*(async_scraper.get(f"url{i}") for i in range(10)))
+        start = time.time()
+        responses = asyncio.run(fetch_all())
+        self.assertLess(time.time() - start, 5*delay)
+        self.assertEqual([f"url{i}" for i in range(10)], [it.text for it in responses])
+        self.assertEqual(10, len(scraper.threads))
+
+    def test_cassette_key(self):
+        key = Cassette.get_key('GET', "https://Example.com/path?b=2&a=1", None)
+        self.assertEqual(key, Cassette.get_key('get', "https://example.com/path", {'a': 1, 'b': '2'}))
+        self.assertEqual(key, Cassette.get_key('GET', "https://example.com/path?a=1", {'b': 2}))
+        self.assertNotEqual(key, Cassette.get_key('GET', "https://example.com/path?a=1", {'b': 3}))
+        self.assertNotEqual(key, Cassette.get_key('POST', "https://example.com/path?a=1&b=2", None))
+        body_key = Cassette.get_key('POST', "https://example.com/path", None, {'x': 1, 'y': [1,2]})
+        self.assertEqual(body_key, Cassette.get_key('POST', "https://example.com/path", None, {'y': [1,2], 'x': 1}))
+        self.assertNotEqual(body_key, Cassette.get_key('POST', "https://example.com/path", None, {'y': [2,1], 'x': 1}))
+
+    def test_cassette_scraper(self):
+        echo = EchoScraper()
+        cassette = Cassette(MemoryKVStorage())
+        scraper = CassetteScraper(echo, ScraperMode.RECORD, cassette)
+        get = scraper.get("https://example.com/get", params={'q': 'abc'}).text
+        post = scraper.post("https://example.com/post", {'a': [1, 2]}).text
+        self.assertRaises(TooManyRequestsException, lambda: scraper.get("https://example.com/limited"))
+        self.assertEqual(3, echo.invocations)
+
+        latency = 0.1
+        scraper.replay(cassette, latency)
+        start = time.time()
+        self.assertEqual(get, scraper.get("https://example.com/get", params={'q': 'abc'}, cookies={'c': 'd'}).text)
+        self.assertEqual(post, scraper.post("https://example.com/post", {'a': [1, 2]}).text)
+        self.assertGreaterEqual(time.time() - start, 2*latency)
+        self.assertRaises(TooManyRequestsException, lambda: scraper.get("https://example.com/limited"))
+        self.assertEqual(429, scraper.get("https://example.com/limited", check_response=False).status_code)
+        self.assertRaises(CassetteMissException, lambda: scraper.get("https://example.com/get", params={'q': 'other'}))
+        self.assertEqual(3, echo.invocations)
+
+        scraper.live()
+        scraper.get("https://example.com/get")
+        self.assertEqual(4, echo.invocations)
+
+    def test_cassette_call(self):
+        cassette = Cassette(MemoryKVStorage())
+        scraper = CassetteScraper(EchoScraper(), ScraperMode.RECORD, cassette)
+        calls: list[str] = []
+        def fetch(): 
+            calls.append('fetch')
+            return {'a': [1, 2], 'b': 'c'}
+        self.assertEqual({'a': [1, 2], 'b': 'c'}, scraper.call("client://info/abc", fetch))
+        scraper.replay(cassette)
+        self.assertEqual({'a': [1, 2], 'b': 'c'}, scraper.call("client://info/abc", fetch))
+        self.assertEqual(['fetch'], calls)
+        self.assertRaises(CassetteMissException, lambda: scraper.call("client://info/other", fetch))
+        self.assertIsNone(cassette.get_time())
+        cassette.set_time(100)
+        self.assertEqual(100, cassette.get_time())
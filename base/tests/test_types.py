@@ -1,12 +1,19 @@
 import unittest
 from base.reflection import transient
 from base.serialization import GenericSerializer
-from base.types import Cloneable, Equatable, ReadonlyDict, Singleton
+from base.types import Cloneable, Equatable, Flyweight, ReadonlyDict, Singleton
 
 class TestSingleton(Singleton):
     def __init__(self):
         pass
 
+class TestFlyweight(Flyweight):
+    __slots__ = ('key', 'value')
+    def __init__(self, key: str, value: int):
+        self.key = key
+        self.value = value
+    def intern_key(self): return self.key
+
 class TestTypes(unittest.TestCase):
     def test_equatable(self):
         @transient('a')
@@ -85,3 +92,25 @@ class TestTypes(unittest.TestCase):
         self.assertIs(TestSingleton.instance, TestSingleton.instance)
         obj = serializer.deserialize(serializer.serialize(TestSingleton.instance), TestSingleton)
         self.assertIs(TestSingleton.instance, obj)
+
+    def test_flyweight(self):
+        a = TestFlyweight('a', 1)
+        self.assertIs(a, TestFlyweight('a', 1))
+        self.assertIs(a, TestFlyweight.restore({'key': 'a', 'value': 1}))
+        self.assertEqual({'key': 'a', 'value': 1}, a.get_state())
+        self.assertEqual(1, len({a, TestFlyweight('a', 1)}))
+        with self.assertRaises(Exception): a.value = 2
+        # a different (e.g. stale) state leaves the interned instance unchanged
+        b = TestFlyweight('a', 2)
+        self.assertIs(a, b)
+        self.assertEqual(1, a.value)
+        self.assertEqual(1, {a: 1}[b])
+        self.assertIs(a, TestFlyweight.restore({'key': 'a', 'value': 3}))
+        self.assertEqual(1, a.value)
+        # unless refreshed explicitly
+        with Flyweight.refreshing():
+            self.assertIs(a, TestFlyweight.restore({'key': 'a', 'value': 3}))
+        self.assertEqual(3, a.value)
+        self.assertIs(a, TestFlyweight('a', 4))
+        self.assertEqual(3, a.value)
+        self.assertIsNot(a, TestFlyweight('b', 3))
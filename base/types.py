@@ -1,5 +1,7 @@
 #4
-from typing import Callable, Iterable, Self, override
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterable, Iterator, Self, override
 from base.reflection import get_no_args_cnst, get_trainsent
 from base.serialization import Serializable, json_type
 
@@ -22,12 +24,82 @@ class Equatable:
             ret ^= hash(self.__dict__[key])
         return ret
     
+_interned: dict[tuple[type, Hashable], 'Flyweight'] = {}
+_interned_lock = threading.Lock()
+_refreshing = threading.local()
+class FlyweightMeta(type):
+    def __call__(cls, *args, **kwargs):
+        return Flyweight._intern(super().__call__(*args, **kwargs))
+class Flyweight(metaclass=FlyweightMeta):
+    """
+    Immutable objects with identity based equality and a hash computed once.
+    Instances are frozen after construction and interned by type and intern_key,
+    so constructing (or restoring) an object with the same key returns the existing instance, unchanged,
+    and there is never more than one live instance per key.
+    Only an authoritative source of the state (e.g. a newer listing) may update an interned instance, see refreshing.
+    """
+    __slots__ = ('_hash',)
+    def intern_key(self) -> Hashable:
+        raise NotImplementedError()
+
+    def get_state(self) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        for cls in reversed(type(self).__mro__):
+            for key in cls.__dict__.get('__slots__', ()):
+                if key not in ('_hash', '__weakref__', '__dict__'): result[key] = getattr(self, key)
+        if hasattr(self, '__dict__'): result.update(self.__dict__)
+        return result
+    @classmethod
+    def restore(cls, state: dict[str, Any]) -> Self:
+        """Creates an instance from its state, without calling __init__."""
+        result = object.__new__(cls)
+        for key, value in state.items(): object.__setattr__(result, key, value)
+        return Flyweight._intern(result)
+    @staticmethod
+    def _intern[T: Flyweight](obj: T) -> T:
+        key = (type(obj), obj.intern_key())
+        object.__setattr__(obj, '_hash', hash(key))
+        with _interned_lock:
+            existing = _interned.get(key)
+            if existing is None:
+                _interned[key] = obj
+                return obj
+            if getattr(_refreshing, 'value', False):
+                state = obj.get_state()
+                if existing.get_state() != state:
+                    for name, value in state.items(): object.__setattr__(existing, name, value)
+            return existing # type: ignore
+    @staticmethod
+    @contextmanager
+    def refreshing() -> Iterator[None]:
+        """
+        Within the context, objects constructed (or restored) by the current thread with an interned key
+        update the state of the interned instance, instead of being discarded.
+        Only for authoritative sources of the state, e.g. SecurityRegistry loading a listing.
+        """
+        previous = getattr(_refreshing, 'value', False)
+        _refreshing.value = True
+        try: yield
+        finally: _refreshing.value = previous
+
+    def __setattr__(self, name: str, value: Any):
+        if hasattr(self, '_hash'): raise Exception(f"{type(self).__name__} is immutable.")
+        object.__setattr__(self, name, value)
+    def __delattr__(self, name: str):
+        raise Exception(f"{type(self).__name__} is immutable.")
+    def __eq__(self, other) -> bool: return self is other
+    def __hash__(self) -> int: return self._hash
+    def __reduce__(self): return (type(self).restore, (self.get_state(),))
+    def __copy__(self) -> Self: return self
+    def __deepcopy__(self, memo) -> Self: return self
+
 class InstanceDescriptor:
     def __get__(self, obj, cls):
         if not hasattr(cls, '_instance'):
             cls._instance = cls()
         return cls._instance
 class Singleton(Serializable):
+    __slots__ = ()
     instance: Self
     instance = InstanceDescriptor() #type: ignore
     @override
@@ -37,6 +109,7 @@ class Singleton(Serializable):
     def from_json(cls: type[Self], data: json_type) -> Self:
         assert data is None
         return cls.instance
+    def __reduce__(self): return (getattr, (type(self), 'instance'))
 
 class ClassDict[T]:
     def __init__(self, key: Callable[[str], str] = lambda x:x):
@@ -8,6 +8,7 @@ class models:
 
 class storage:
     location: Literal['folder', 'db', 'mem'] = 'db'
+    backend: Literal['memory', 'sqlite', 'mongo'] = 'mongo' # See injection
     local_root_path = "storage/prod"
     local_root_path_tmp = "storage/tmp"
     local_db_path = "storage/prod.db"
@@ -18,6 +19,7 @@ class storage:
 
 class providers:
     live_time_frame = 5*24*3600.0
+    adaptive = False # See AggregateProvider
 
 class http:
     type loglevel = Literal['none', 'short', 'long']
@@ -1,12 +1,104 @@
-from pymongo import MongoClient
-from sqlalchemy import create_engine
+"""
+Shared resources, created lazily.
+Importing this module connects to nothing. Engines, clients and registered providers
+are created on first use, and storages are created according to the backend profile:
+    memory: Everything is kept in memory. Nothing persists between runs.
+    sqlite: Everything is kept in the local sqlite database. The remote tier of two tier caches gets its own remote_ tables,
+        so that the tiers stay independent (as with mongo) instead of reading and writing the same table twice.
+    mongo: Shared (remote) data is kept in mongo, and the rest in the local sqlite database.
+The profile defaults to config.storage.backend (or mongo), and can be changed with set_backend before the storages are created.
+The resources are also available as module attributes (e.g. injection.local_db), for compatibility.
+"""
+import threading
+from typing import Any, Callable, Literal, overload
 import config
-import dns.resolver
-dns.resolver.get_default_resolver().nameservers = ["8.8.8.8"]
+from base.db import sqlite_engine
+from base.key_value_storage import KeyValueStorage, MemoryKVStorage, SqlKVStorage, MongoKVStorage
+from base.key_series_storage import KeySeriesStorage, MemoryKSStorage, SqlKSStorage, MongoKSStorage
 
-local_db = create_engine(f"sqlite:///{config.storage.local_db_path}")
-local_db_tmp = create_engine(f"sqlite:///{config.storage.local_db_path_tmp}")
+type Backend = Literal['memory', 'sqlite', 'mongo']
 
-mongo_client = MongoClient(config.storage.mongo_uri)
-mongo_db = mongo_client["trading"]
-mongo_db_tmp = mongo_client["trading_tmp"]
+class Container:
+    """Thread safe registry of lazily created singletons."""
+    def __init__(self):
+        self.factories: dict[str, Callable[[], Any]] = {}
+        self.instances: dict[str, Any] = {}
+        self.lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        with self.lock:
+            self.factories[name] = factory
+            self.instances.pop(name, None)
+    def set(self, name: str, instance: Any):
+        """Overrides the instance, e.g. with a stub in tests."""
+        with self.lock:
+            self.instances[name] = instance
+    def get(self, name: str) -> Any:
+        if name in self.instances: return self.instances[name]
+        with self.lock:
+            if name not in self.instances:
+                if name not in self.factories: raise Exception(f"Unknown dependency {name}.")
+                self.instances[name] = self.factories[name]()
+            return self.instances[name]
+    def is_created(self, name: str) -> bool:
+        return name in self.instances
+    def reset(self):
+        """Drops all created instances, so that they are recreated on next use."""
+        with self.lock:
+            self.instances.clear()
+    def __contains__(self, name: str) -> bool:
+        return name in self.factories or name in self.instances
+
+class Dependency[T]:
+    """A class attribute resolved from the container on each access."""
+    def __init__(self, name: str):
+        self.name = name
+    @overload
+    def __get__(self, instance: None, owner: type) -> T: ...
+    @overload
+    def __get__(self, instance: object, owner: type) -> T: ...
+    def __get__(self, instance: object|None, owner: type) -> T:
+        return container.get(self.name)
+
+container = Container()
+_backend: Backend|None = None
+
+def get_backend() -> Backend:
+    return _backend or getattr(config.storage, 'backend', 'mongo')
+def set_backend(backend: Backend):
+    global _backend
+    _backend = backend
+
+def _mongo_client():
+    from pymongo import MongoClient
+    import dns.resolver
+    dns.resolver.get_default_resolver().nameservers = ["8.8.8.8"]
+    return MongoClient(config.storage.mongo_uri)
+
+container.register('local_db', lambda: sqlite_engine(config.storage.local_db_path))
+container.register('local_db_tmp', lambda: sqlite_engine(config.storage.local_db_path_tmp))
+container.register('mongo_client', _mongo_client)
+container.register('mongo_db', lambda: container.get('mongo_client')[config.storage.mongo_db_name])
+container.register('mongo_db_tmp', lambda: container.get('mongo_client')[config.storage.mongo_db_name_tmp])
+
+def kv_storage(name: str, *, remote: bool = False, memory: bool = False) -> KeyValueStorage:
+    """
+    Creates a key value storage for the table/collection name, based on the backend profile.
+    Args:
+        remote: If true, the data is shared between machines when the backend supports it.
+        memory: If true, the storage is kept in memory regardless of the backend.
+    """
+    backend = get_backend()
+    if memory or backend == 'memory': return MemoryKVStorage()
+    if remote and backend == 'mongo': return MongoKVStorage(container.get('mongo_db')[name])
+    return SqlKVStorage(container.get('local_db'), f"remote_{name}" if remote else name)
+def ks_storage[T](name: str, timestamp: Callable[[T], float], *, remote: bool = False, memory: bool = False) -> KeySeriesStorage[T]:
+    """The key series counterpart of kv_storage."""
+    backend = get_backend()
+    if memory or backend == 'memory': return MemoryKSStorage[T](timestamp)
+    if remote and backend == 'mongo': return MongoKSStorage[T](container.get('mongo_db')[name], timestamp)
+    return SqlKSStorage[T](container.get('local_db'), f"remote_{name}" if remote else name, timestamp)
+
+def __getattr__(name: str) -> Any:
+    if name in container: return container.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
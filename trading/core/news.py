@@ -1,11 +1,12 @@
 #2
+import asyncio
+from functools import cached_property
 from typing import Sequence, overload, override
-from base.key_value_storage import SqlKVStorage, KeyValueStorage, MongoKVStorage
-from base.key_series_storage import SqlKSStorage, KeySeriesStorage, MongoKSStorage
+from base.key_value_storage import KeyValueStorage
+from base.key_series_storage import KeySeriesStorage
 from base.caching import cached_series
 from base.serialization import Serializable
 import injection
-from trading.core.pricing import MongoKVStorage
 from trading.core.securities import Security
 
 class News(Serializable):
@@ -30,16 +31,38 @@ class NewsProvider:
         security: Security
     ) -> Sequence[News]:
         raise NotImplementedError()
+    async def get_news_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        """
+        Awaitable version of get_news.
+        By default, get_news is offloaded to a worker thread.
+        """
+        return await asyncio.to_thread(self.get_news, unix_from, unix_to, security)
 
 class BaseNewsProvider(NewsProvider):
-    def __init__(self):
-        name = type(self).__name__.lower()
-        self.local_news_storage = (SqlKVStorage(injection.local_db, f"{name}_news_span"), SqlKSStorage[News](injection.local_db, f"{name}_news", lambda it: it.unix_time))
-        self.remote_news_storage = (MongoKVStorage(injection.mongo_db[f"{name}_news_span"]), MongoKSStorage[News](injection.mongo_db[f"{name}_news"], lambda it: it.unix_time))
+    def __init__(self, local: bool = False):
+        self.name = type(self).__name__.lower()
+        self.local = local
+
+    # The storages are created on first use, see injection
+    @cached_property
+    def local_news_storage(self) -> tuple[KeyValueStorage, KeySeriesStorage[News]]:
+        return (
+            injection.kv_storage(f"{self.name}_news_span", memory=self.local),
+            injection.ks_storage(f"{self.name}_news", lambda it: it.unix_time, memory=self.local)
+        )
+    @cached_property
+    def remote_news_storage(self) -> tuple[KeyValueStorage, KeySeriesStorage[News]]:
+        return (
+            injection.kv_storage(f"{self.name}_news_span", remote=True, memory=self.local),
+            injection.ks_storage(f"{self.name}_news", lambda it: it.unix_time, remote=True, memory=self.local)
+        )
 
     @override
     def get_news(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
         return self._get_news(unix_from, unix_to, security)
+    @override
+    async def get_news_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        return await self._get_news_async(unix_from, unix_to, security)
 
     def _get_news_key(self, security: Security) -> str: return f"{security.exchange.mic}_{security.symbol}"
     def _get_news_local_kv(self) -> KeyValueStorage: return self.local_news_storage[0]
@@ -65,6 +88,10 @@ class BaseNewsProvider(NewsProvider):
     )
     def _get_news(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
         return self._get_news_remote(unix_from, unix_to, security)
+    async def _get_news_remote_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        return await BaseNewsProvider._get_news_remote.cached_method_async(self, self.get_news_raw_async, unix_from, unix_to, security)
+    async def _get_news_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        return await BaseNewsProvider._get_news.cached_method_async(self, self._get_news_remote_async, unix_from, unix_to, security)
     
     @overload
     def invalidate_news(self, unix_from: float, unix_to: float): ...
@@ -80,4 +107,7 @@ class BaseNewsProvider(NewsProvider):
 
     #region Abstract
     def get_news_raw(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]: raise NotImplementedError()
+    async def get_news_raw_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        """By default, get_news_raw is offloaded to a worker thread."""
+        return await asyncio.to_thread(self.get_news_raw, unix_from, unix_to, security)
     #endregion
\ No newline at end of file
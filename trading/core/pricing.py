@@ -1,9 +1,14 @@
 #2
 from __future__ import annotations
+import asyncio
+import logging
 import math
-from typing import Iterable, Mapping, Sequence, overload, override
-from base.key_value_storage import SqlKVStorage, MongoKVStorage, MemoryKVStorage
-from base.key_series_storage import SqlKSStorage, MongoKSStorage, MemoryKSStorage
+from functools import cached_property
+import numpy as np
+from typing import Iterable, Mapping, Self, Sequence, overload, override
+from base import dates
+from base.key_value_storage import KeyValueStorage
+from base.key_series_storage import KeySeriesStorage
 from base.algos import interpolate
 from base.types import Equatable
 from base.serialization import Serializable
@@ -12,6 +17,8 @@ import injection
 from trading.core import Interval
 from trading.core.securities import Security
 
+logger = logging.getLogger(__name__)
+
 class OHLCV(Equatable, Serializable):
     def __init__(self, t: float, o: float, h: float, l: float, c: float, v: float):
         self.t = t
@@ -54,6 +61,73 @@ class OHLCV(Equatable, Serializable):
         }
         return [OHLCV(timestamps[i], *(result[key][i] for key in 'ohlcv')) for i in range(len(timestamps))]
 
+class AdjustmentEvent(Equatable, Serializable):
+    """
+    A split or dividend taking effect at time t.
+    Prices of all bars at or before t should be multiplied by factor, and their volumes divided by it.
+    """
+    def __init__(self, t: float, factor: float, split: bool = False):
+        self.t = t
+        self.factor = factor
+        self.split = split
+
+    def __repr__(self) -> str:
+        return f"AdjustmentEvent(t={self.t},factor={self.factor},split={self.split})"
+
+def adjust_pricing(data: Sequence[OHLCV], events: Sequence[AdjustmentEvent]) -> list[OHLCV]:
+    """
+    Adjusts each bar by the product of the factors of all events at or after it.
+    Returns new objects, leaving the passed data untouched.
+    Args:
+        events: Sorted by time.
+    """
+    if not data or not events: return list(data)
+    factors = np.append(np.cumprod([it.factor for it in reversed(events)])[::-1], 1.0)
+    cumulative = factors[np.searchsorted([it.t for it in events], [it.t for it in data], side='left')]
+    values = np.array([[it.o, it.h, it.l, it.c, it.v] for it in data], dtype=np.float64)
+    values[:, :4] *= cumulative[:, None]
+    values[:, 4] /= cumulative
+    return [OHLCV(it.t, *row) for it, row in zip(data, values.tolist())]
+
+class PricingSeries:
+    """
+    Pricing interpolated once onto a grid of timestamps (e.g. all calendar timestamps of an interval within a range),
+    from which the window of any example is cut as a view, without fetching or interpolating again.
+    Rows are (o, h, l, c, v). Bars missing at the edges of a window are interpolated from the bars around it,
+    which are known here, instead of extrapolated as when fetching the window alone.
+    Args:
+        data: The known bars, sorted by time.
+        timestamps: The grid, sorted.
+        unix_from: The start of the grid range (exclusive).
+    """
+    def __init__(self, data: Sequence[OHLCV], timestamps: Sequence[float], unix_from: float):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        known = np.array([it.t for it in data], dtype=np.float64)
+        if len(data):
+            values = np.array([[it.o, it.h, it.l, it.c, it.v] for it in data], dtype=np.float64)
+            self.values = np.stack([np.interp(self.timestamps, known, values[:,k]) for k in range(5)], axis=1)
+        else:
+            self.values = np.full((len(self.timestamps), 5), np.nan)
+        # the number of known bars up to each grid timestamp, and up to the start
+        self.known = np.searchsorted(known, self.timestamps, side='right')
+        self.known_start = int(np.searchsorted(known, unix_from, side='right'))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _cut(self, start: int, count: int, max_fill_ratio: float) -> np.ndarray:
+        if start < 0 or start + count > len(self.timestamps) or count <= 0:
+            raise Exception(f"Window of {count} entries starting at {start} is out of the series range of {len(self.timestamps)}.")
+        known = self.known[start+count-1] - (self.known[start-1] if start else self.known_start)
+        if not known: raise Exception(f"No known entries within the window of {count} entries starting at {start}.")
+        fill_ratio = (count - known)/count
+        if fill_ratio > max_fill_ratio:
+            raise Exception(f"Fill ratio {fill_ratio} is larger than the maximum {max_fill_ratio}.")
+        return self.values[start:start+count]
+    def window(self, end_time: float, count: int, max_fill_ratio: float = 1) -> np.ndarray:
+        """Returns the last count entries at or before end_time, as a view of shape (count, 5)."""
+        return self._cut(int(np.searchsorted(self.timestamps, end_time, side='right')) - count, count, max_fill_ratio)
+
 class PricingProvider:
     """
     Pricing providers will:
@@ -97,6 +171,91 @@ class PricingProvider:
         p = self.get_pricing(unix_from, unix_time, security, interval, interpolate=True)[-1]
         return (p.o+p.c)/2
 
+    async def get_pricing_async(
+        self,
+        unix_from: float,
+        unix_to: float,
+        security: Security,
+        interval: Interval,
+        *,
+        interpolate: bool = False,
+        max_fill_ratio: float = 1
+    ) -> Sequence[OHLCV]:
+        """
+        Awaitable version of get_pricing.
+        By default, get_pricing is offloaded to a worker thread.
+        """
+        return await asyncio.to_thread(self.get_pricing, unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+    
+    async def get_pricing_many_async(
+        self,
+        unix_from: float,
+        unix_to: float,
+        securities: Iterable[Security],
+        interval: Interval,
+        *,
+        interpolate: bool = False,
+        max_fill_ratio: float = 1
+    ) -> dict[Security, Sequence[OHLCV]]:
+        """
+        Fetches pricing data for all securities concurrently.
+        Securities for which the fetch fails are logged and left out of the result.
+        """
+        securities = list(securities)
+        results = await asyncio.gather(
+            *(self.get_pricing_async(unix_from, unix_to, it, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio) for it in securities),
+            return_exceptions=True
+        )
+        ret: dict[Security, Sequence[OHLCV]] = {}
+        for security, result in zip(securities, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to fetch {interval} pricing for {security.symbol}.", exc_info=result)
+            else: ret[security] = result
+        return ret
+    def get_pricing_many(
+        self,
+        unix_from: float,
+        unix_to: float,
+        securities: Iterable[Security],
+        interval: Interval,
+        *,
+        interpolate: bool = False,
+        max_fill_ratio: float = 1
+    ) -> dict[Security, Sequence[OHLCV]]:
+        """
+        Blocking version of get_pricing_many_async. Must not be called from a running event loop.
+        """
+        return asyncio.run(self.get_pricing_many_async(unix_from, unix_to, securities, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio))
+
+class PriceIndex:
+    """
+    Point in time (as of) prices of securities. The series of each security is loaded once for a range,
+    and prices at any times within it are found by binary search, e.g. to value positions at many times.
+    The price at a time is the average of the open and close of the last bar at or before it, as in PricingProvider.get_pricing_at.
+    """
+    def __init__(self, provider: PricingProvider, interval: Interval = Interval.M1):
+        self.provider = provider
+        self.interval = interval
+        self.series: dict[Security, tuple[np.ndarray, np.ndarray]] = {}
+
+    def load(self, securities: Iterable[Security], unix_from: float, unix_to: float) -> Self:
+        """Loads the series of the securities, covering the prices at times within [unix_from, unix_to]."""
+        for security in securities:
+            start = security.exchange.calendar.add_intervals(unix_from, self.interval, -1)
+            data = self.provider.get_pricing(start, unix_to, security, self.interval, interpolate=True)
+            self.series[security] = np.array([it.t for it in data], dtype=np.float64), np.array([(it.o+it.c)/2 for it in data], dtype=np.float64)
+        return self
+
+    def prices_at(self, security: Security, unix_times: Sequence[float]|np.ndarray) -> np.ndarray:
+        if security not in self.series: raise Exception(f"The series of {security.symbol} is not loaded.")
+        timestamps, prices = self.series[security]
+        indices = np.searchsorted(timestamps, unix_times, side='right') - 1
+        if len(indices) and indices.min() < 0:
+            raise Exception(f"No {self.interval.name} pricing for {security.symbol} at {np.asarray(unix_times)[indices.argmin()]}.")
+        return prices[indices]
+    def price_at(self, security: Security, unix_time: float) -> float:
+        return float(self.prices_at(security, [unix_time])[0])
+
 def merge_pricing(
     data: Sequence[OHLCV],
     unix_from: float,
@@ -147,23 +306,48 @@ class BasePricingProvider(PricingProvider):
         """
         self.native = set(native)
         self.merge = merge
-        name = type(self).__name__.lower()
-        if local:
-            self.local_pricing_storage = (MemoryKVStorage(), MemoryKSStorage[OHLCV](lambda it: it.t))
-            self.remote_pricing_storage = (MemoryKVStorage(), MemoryKSStorage[OHLCV](lambda it: it.t))
-        else:
-            self.local_pricing_storage = (SqlKVStorage(injection.local_db, f"{name}_pricing_span"), SqlKSStorage[OHLCV](injection.local_db, f"{name}_pricing", lambda it: it.t))
-            self.remote_pricing_storage = (MongoKVStorage(injection.mongo_db[f"{name}_pricing_span"]), MongoKSStorage[OHLCV](injection.mongo_db[f"{name}_pricing"], lambda it: it.t))
+        self.name = type(self).__name__.lower()
+        self.local = local
+    
+    # The storages are created on first use, see injection
+    @cached_property
+    def local_pricing_storage(self) -> tuple[KeyValueStorage, KeySeriesStorage[OHLCV]]:
+        return (
+            injection.kv_storage(f"{self.name}_pricing_span", memory=self.local),
+            injection.ks_storage(f"{self.name}_pricing", lambda it: it.t, memory=self.local)
+        )
+    @cached_property
+    def remote_pricing_storage(self) -> tuple[KeyValueStorage, KeySeriesStorage[OHLCV]]:
+        return (
+            injection.kv_storage(f"{self.name}_pricing_span", remote=True, memory=self.local),
+            injection.ks_storage(f"{self.name}_pricing", lambda it: it.t, remote=True, memory=self.local)
+        )
+    @cached_property
+    def adjustment_storage(self) -> tuple[KeyValueStorage, KeySeriesStorage[AdjustmentEvent]]:
+        return (
+            injection.kv_storage(f"{self.name}_adjustment_span", memory=self.local),
+            injection.ks_storage(f"{self.name}_adjustment", lambda it: it.t, memory=self.local)
+        )
     
+    def _interpolate(self, data: Sequence[OHLCV], unix_from: float, unix_to: float, security: Security, interval: Interval, max_fill_ratio: float) -> Sequence[OHLCV]:
+        timestamps = security.exchange.calendar.get_timestamps(unix_from, unix_to, interval)
+        fill_ratio = (len(timestamps)-len(data))/len(timestamps) if timestamps else 0
+        if fill_ratio > max_fill_ratio:
+            raise Exception(f"Fill ratio {fill_ratio} is larger than the maximum {max_fill_ratio}.")
+        return OHLCV.interpolate(data, timestamps)
     @override
     def get_pricing(self, unix_from, unix_to, security, interval, *, interpolate = False, max_fill_ratio = 1) -> Sequence[OHLCV]:
         data = self._get_pricing(unix_from, unix_to, security, interval)
-        if interpolate:
-            timestamps = security.exchange.calendar.get_timestamps(unix_from, unix_to, interval)
-            fill_ratio = (len(timestamps)-len(data))/len(timestamps) if timestamps else 0
-            if fill_ratio > max_fill_ratio:
-                raise Exception(f"Fill ratio {fill_ratio} is larger than the maximum {max_fill_ratio}.")
-            data = OHLCV.interpolate(data, timestamps)
+        if data and interval in self.get_adjusted_intervals():
+            data = adjust_pricing(data, self._get_adjustments(data[0].t-1, dates.unix(), security))
+        if interpolate: data = self._interpolate(data, unix_from, unix_to, security, interval, max_fill_ratio)
+        return data
+    @override
+    async def get_pricing_async(self, unix_from, unix_to, security, interval, *, interpolate = False, max_fill_ratio = 1) -> Sequence[OHLCV]:
+        data = await self._get_pricing_async(unix_from, unix_to, security, interval)
+        if data and interval in self.get_adjusted_intervals():
+            data = adjust_pricing(data, await self._get_adjustments_async(data[0].t-1, dates.unix(), security))
+        if interpolate: data = self._interpolate(data, unix_from, unix_to, security, interval, max_fill_ratio)
         return data
     @override
     def get_intervals(self) -> set[Interval]:
@@ -171,7 +355,9 @@ class BasePricingProvider(PricingProvider):
 
     #region caching
     def _get_pricing_key(self, security: Security, interval: Interval) -> str:
-        return f"{security.exchange.mic}_{security.symbol}_{interval.name}"
+        # adjusted intervals are stored raw, under their own keys, so that the adjusted bars stored by earlier versions are never read as raw
+        suffix = "_raw" if interval in self.get_adjusted_intervals() else ""
+        return f"{security.exchange.mic}_{security.symbol}_{interval.name}{suffix}"
     def _get_pricing_local_kv(self): return self.local_pricing_storage[0]
     def _get_pricing_local_ks(self): return self.local_pricing_storage[1]
     def _get_pricing_remote_kv(self): return self.remote_pricing_storage[0]
@@ -190,6 +376,8 @@ class BasePricingProvider(PricingProvider):
         return self.get_pricing_delay(security, interval)
     def _get_pricing_should_refresh(self, fetch: float, now: float, security: Security, interval: Interval) -> bool:
         return security.exchange.calendar.get_next_timestamp(fetch, interval) < now and now-fetch > 3600
+    def _get_pricing_max_batch(self, security: Security, interval: Interval) -> float|None:
+        return self.get_pricing_max_batch(security, interval)
     @cached_series(
         key=_get_pricing_key,
         kv_storage=_get_pricing_remote_kv,
@@ -197,7 +385,8 @@ class BasePricingProvider(PricingProvider):
         min_chunk=_get_pricing_min_chunk,
         max_chunk=_get_pricing_min_chunk,
         live_delay=_get_pricing_live_delay,
-        should_refresh=_get_pricing_should_refresh
+        should_refresh=_get_pricing_should_refresh,
+        max_batch=_get_pricing_max_batch
     )
     def _get_pricing_remote(
         self,
@@ -228,6 +417,36 @@ class BasePricingProvider(PricingProvider):
     ) -> Sequence[OHLCV]:
         return self._get_pricing_remote(unix_from, unix_to, security, interval)
     
+    async def _fetch_pricing_remote_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> Sequence[OHLCV]:
+        if interval not in self.native and interval not in self.merge:
+            raise Exception(f"Unsupported interval {interval}. Supported intervals are {self.native.union(self.merge.keys())}.")
+        if interval in self.merge and not(interval in self.native and unix_from < self.get_interval_start(self.merge[interval])):
+            data = await self._get_pricing_async(security.exchange.calendar.add_intervals(unix_from, interval, -1), unix_to, security, self.merge[interval])
+            return merge_pricing(data, unix_from, unix_to, interval, security)
+        else:
+            return await self.get_pricing_raw_async(unix_from, unix_to, security, interval)
+    async def _get_pricing_remote_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> Sequence[OHLCV]:
+        return await BasePricingProvider._get_pricing_remote.cached_method_async(self, self._fetch_pricing_remote_async, unix_from, unix_to, security, interval)
+    async def _get_pricing_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> Sequence[OHLCV]:
+        return await BasePricingProvider._get_pricing.cached_method_async(self, self._get_pricing_remote_async, unix_from, unix_to, security, interval)
+    
+    def _get_adjustments_key(self, security: Security) -> str:
+        return f"{security.exchange.mic}_{security.symbol}"
+    def _get_adjustments_kv(self): return self.adjustment_storage[0]
+    def _get_adjustments_ks(self): return self.adjustment_storage[1]
+    @cached_series(
+        key=_get_adjustments_key,
+        kv_storage=_get_adjustments_kv,
+        ks_storage=_get_adjustments_ks,
+        min_chunk=50000000,
+        live_delay=0,
+        should_refresh=3600
+    )
+    def _get_adjustments(self, unix_from: float, unix_to: float, security: Security) -> Sequence[AdjustmentEvent]:
+        return self.get_adjustments_raw(unix_from, unix_to, security)
+    async def _get_adjustments_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[AdjustmentEvent]:
+        return await BasePricingProvider._get_adjustments.cached_method_async(self, self.get_adjustments_raw_async, unix_from, unix_to, security)
+    
     @overload
     def invalidate_pricing(self, unix_from: float, unix_to: float): ...
     @overload
@@ -241,6 +460,20 @@ class BasePricingProvider(PricingProvider):
             BasePricingProvider._get_pricing_remote.invalidate_all(self, unix_from, unix_to)
     #endregion
 
+    def get_adjusted_intervals(self) -> set[Interval]:
+        """
+        Override this to have the pricing data of these intervals cached raw,
+        and adjusted by the events from get_adjustments_raw when read.
+        By default, the data is returned as fetched.
+        """
+        return set()
+    def get_pricing_max_batch(self, security: Security, interval: Interval) -> float|None:
+        """
+        Override this to fetch adjacent missing chunks with a single get_pricing_raw call, spanning at most the returned time.
+        By default, each chunk is fetched separately.
+        """
+        return None
+
     #region Abstract
     def get_pricing_delay(self, security: Security, interval: Interval) -> float: raise NotImplementedError()
     def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> Sequence[OHLCV]:
@@ -249,4 +482,18 @@ class BasePricingProvider(PricingProvider):
         The dict keys should be tohlcv.
         """
         raise NotImplementedError()
+    async def get_pricing_raw_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> Sequence[OHLCV]:
+        """
+        Override this with a non-blocking implementation where possible.
+        By default, get_pricing_raw is offloaded to a worker thread.
+        """
+        return await asyncio.to_thread(self.get_pricing_raw, unix_from, unix_to, security, interval)
+    def get_adjustments_raw(self, unix_from: float, unix_to: float, security: Security) -> Sequence[AdjustmentEvent]:
+        """
+        Implement this so that it fetches the adjustment events within (unix_from, unix_to], sorted by time.
+        Only needed if get_adjusted_intervals is not empty.
+        """
+        raise NotImplementedError()
+    async def get_adjustments_raw_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[AdjustmentEvent]:
+        return await asyncio.to_thread(self.get_adjustments_raw, unix_from, unix_to, security)
     #endregion
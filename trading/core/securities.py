@@ -1,15 +1,23 @@
 #1
 from __future__ import annotations
-from typing import Sequence
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Hashable, Self, Sequence, override
 from enum import Enum, auto
 
-from base.reflection import get_classes
-from base.types import Equatable, Singleton
+import config
+from base.reflection import get_full_classname, get_class_by_full_classname
+from base.types import Flyweight, Singleton
 from base.utils import cached
-from base.serialization import Serializable
+from base.serialization import Serializable, BasicSerializer, GenericSerializer, json_type
+from base.key_value_storage import KeyValueStorage, FolderKVStorage
 from trading.core.work_calendar import WorkCalendar
 
-class Exchange(Singleton):
+logger = logging.getLogger(__name__)
+
+class Exchange(Singleton, Flyweight):
+    __slots__ = ('mic', 'segment_mic', 'operating_mic', 'name', 'calendar')
     def __init__(
         self,
         mic: str,
@@ -24,31 +32,74 @@ class Exchange(Singleton):
         self.name = name
         self.calendar = calendar
     
-    def securities(self) -> Sequence[Security]: ...
-    
+    @override
+    def intern_key(self) -> Hashable: return self.segment_mic
+    def is_primary(self) -> bool:
+        """The primary exchange of a mic lists the securities of all its segments."""
+        return self.segment_mic == self.mic
+    def securities(self) -> Sequence[Security]:
+        if self.is_primary(): return SecurityRegistry.instance.for_mic(self.mic)
+        return SecurityRegistry.instance.for_segment_mic(self.segment_mic)
     def get_security(self, symbol: str) -> Security:
-        sec = [it for it in self.securities() if it.symbol == symbol]
-        return sec[0]
+        result = SecurityRegistry.instance.get(self.mic, symbol)
+        if not self.is_primary() and result.exchange is not self:
+            raise Exception(f"Security {symbol} is not listed on {self}.")
+        return result
+
+    #region Listing
+    def get_listing(self) -> Sequence[Security]:
+        """
+        Implement this in the primary exchange of each mic, so that it returns all the listed securities.
+        Called only when the listing changes, with the result persisted by the SecurityRegistry.
+        """
+        raise NotImplementedError()
+    def get_listing_hash(self) -> str|None:
+        """
+        Override this to return a hash of the raw listing that get_listing parses, cheaper to get than the listing itself.
+        If None, the listing is parsed on each startup.
+        """
+        return None
+    #endregion
     
     def __repr__(self) -> str: return f"{type(self).__name__}()"
-    _exchanges: dict[str, Exchange]|None = None
+    _exchanges: dict[str, dict[str, Exchange]]|None = None
 
+    # All supported exchanges, imported on first use
+    REGISTRY = [
+        'trading.providers.nasdaq.Nasdaq',
+        'trading.providers.nasdaq.NasdaqGS',
+        'trading.providers.nasdaq.NasdaqMS',
+        'trading.providers.nasdaq.NasdaqCM',
+        'trading.providers.nyse.NYSE',
+        'trading.providers.nyse.NYSEAmerican',
+        'trading.providers.nyse.NYSEArca',
+        'trading.providers.forex.Forex'
+    ]
     @staticmethod
     @cached
     def all() -> set[Exchange]:
-        return set(it.instance for it in get_classes("trading.providers", recursive=False, base=Exchange))
+        return set(get_class_by_full_classname(it).instance for it in Exchange.REGISTRY)
+    @staticmethod
+    def _get_index(kind: str) -> dict[str, Exchange]:
+        if Exchange._exchanges is None:
+            exchanges = sorted(Exchange.all(), key=lambda it: not it.is_primary())
+            index: dict[str, dict[str, Exchange]] = {'mic': {}, 'segment_mic': {}, 'operating_mic': {}}
+            for it in exchanges:
+                index['mic'].setdefault(it.mic, it)
+                index['segment_mic'].setdefault(it.segment_mic, it)
+                index['operating_mic'].setdefault(it.operating_mic, it)
+            Exchange._exchanges = index
+        return Exchange._exchanges[kind]
     @staticmethod
-    @cached
     def for_mic(mic: str) -> Exchange:
-        return [it for it in Exchange.all() if it.mic == mic][0]
+        """Returns the primary exchange of the mic."""
+        return Exchange._get_index('mic')[mic]
     @staticmethod
-    @cached
     def for_segment_mic(mic: str) -> Exchange:
-        return [it for it in Exchange.all() if it.segment_mic == mic][0]
+        return Exchange._get_index('segment_mic')[mic]
     @staticmethod
-    @cached
     def for_operating_mic(mic: str) -> Exchange:
-        return [it for it in Exchange.all() if it.operating_mic == mic][0]
+        return Exchange._get_index('operating_mic')[mic]
 
 
 class SecurityType(Enum):
@@ -58,7 +109,12 @@ class SecurityType(Enum):
     FX = auto()
     TEST = auto()
 
-class Security(Equatable, Serializable):
+class Security(Serializable, Flyweight):
+    """
+    Securities are interned, so there is a single instance per exchange and symbol,
+    compared by identity and hashed once.
+    """
+    __slots__ = ('symbol', 'name', 'type', 'exchange')
     def __init__(
         self,
         symbol: str,
@@ -71,12 +127,111 @@ class Security(Equatable, Serializable):
         self.type = type
         self.exchange = exchange
     
+    @override
+    def intern_key(self) -> Hashable: return (self.exchange, self.symbol)
+    @override
+    def to_json(self) -> json_type: return self.get_state()
+    @override
+    @classmethod
+    def from_json(cls, data: json_type) -> Self:
+        assert isinstance(data, dict)
+        return cls.restore(data)
+
     def __str__(self) -> str:
         return f"{self.exchange.segment_mic}/{self.type.name}/{self.symbol}"
     
     def __repr__(self) -> str:
         return str(self)
 
+class SecurityRegistry(Singleton):
+    """
+    Indexes the securities of all exchanges by (mic, symbol), segment mic and type.
+    The listing of each mic is loaded once, on first use, from a snapshot keyed by the listing hash,
+    and parsed only if the snapshot is missing or stale.
+    Thread safe.
+    """
+    def __init__(self, storage: KeyValueStorage|None = None):
+        self.storage = storage or FolderKVStorage(Path(config.storage.local_root_path)/"registry", BasicSerializer())
+        self.lock = threading.RLock()
+        self.by_symbol: dict[tuple[str, str], Security] = {}
+        self.by_mic: dict[str, list[Security]] = {}
+        self.by_segment_mic: dict[str, list[Security]] = {}
+        self.by_type: dict[SecurityType, list[Security]] = {}
+        self.loaded_all = False
+
+    @staticmethod
+    def _to_snapshot(listing_hash: str, securities: Sequence[Security]) -> dict:
+        """
+        Stores each security as a row of its field values, in the field order of its class.
+        Strings are stored inline, and all other values as indexes into a table of distinct serialized values.
+        """
+        serializer = GenericSerializer()
+        classes: dict[str, list[str]] = {}
+        values: dict[str, int] = {}
+        rows: list[list] = []
+        for it in securities:
+            state = it.get_state()
+            fields = classes.setdefault(get_full_classname(it), list(state.keys()))
+            row: list = [list(classes.keys()).index(get_full_classname(it))]
+            for field in fields:
+                value = state[field]
+                row.append(value if isinstance(value, str) else values.setdefault(serializer.serialize(value), len(values)))
+            rows.append(row)
+        return {'hash': listing_hash, 'classes': list(classes.items()), 'values': list(values.keys()), 'rows': rows}
+    @staticmethod
+    def _from_snapshot(snapshot: dict) -> list[Security]:
+        serializer = GenericSerializer()
+        classes: list[tuple[type[Security], list[str]]] = [(get_class_by_full_classname(name), fields) for name, fields in snapshot['classes']]
+        values = [serializer.deserialize(it) for it in snapshot['values']]
+        result: list[Security] = []
+        for row in snapshot['rows']:
+            cls, fields = classes[row[0]]
+            result.append(cls.restore(dict(zip(fields, (it if isinstance(it, str) else values[it] for it in row[1:])))))
+        return result
+    def _load_listing(self, exchange: Exchange) -> Sequence[Security]:
+        # the listing is authoritative, so it refreshes the state of securities interned earlier (e.g. from a stale portfolio)
+        with Flyweight.refreshing():
+            return self._read_listing(exchange)
+    def _read_listing(self, exchange: Exchange) -> Sequence[Security]:
+        listing_hash = exchange.get_listing_hash()
+        if listing_hash is None: return exchange.get_listing()
+        snapshot = self.storage.try_get(exchange.mic, dict)
+        if snapshot and snapshot['hash'] == listing_hash:
+            return self._from_snapshot(snapshot)
+        securities = exchange.get_listing()
+        self.storage.set(exchange.mic, self._to_snapshot(listing_hash, securities))
+        logger.info(f"Saved a snapshot of {len(securities)} {exchange.mic} securities.")
+        return securities
+    def _load(self, mic: str) -> list[Security]:
+        if mic in self.by_mic: return self.by_mic[mic]
+        with self.lock:
+            if mic in self.by_mic: return self.by_mic[mic]
+            securities = list(self._load_listing(Exchange.for_mic(mic)))
+            for it in securities:
+                self.by_symbol[(mic, it.symbol)] = it
+                self.by_segment_mic.setdefault(it.exchange.segment_mic, []).append(it)
+                self.by_type.setdefault(it.type, []).append(it)
+            self.by_mic[mic] = securities
+            return securities
+    def _load_all(self):
+        if self.loaded_all: return
+        with self.lock:
+            for it in sorted({it.mic for it in Exchange.all()}): self._load(it)
+            self.loaded_all = True
+
+    def get(self, mic: str, symbol: str) -> Security:
+        self._load(mic)
+        if (mic, symbol) not in self.by_symbol: raise Exception(f"Unknown security {symbol} on {mic}.")
+        return self.by_symbol[(mic, symbol)]
+    def for_mic(self, mic: str) -> Sequence[Security]:
+        return self._load(mic)
+    def for_segment_mic(self, segment_mic: str) -> Sequence[Security]:
+        self._load(Exchange.for_segment_mic(segment_mic).mic)
+        return self.by_segment_mic.get(segment_mic, [])
+    def for_type(self, type: SecurityType) -> Sequence[Security]:
+        self._load_all()
+        return self.by_type.get(type, [])
+
 class DataProvider:
     """
     Data providers will:
@@ -1,7 +1,7 @@
-from typing import cast
+from typing import cast, override
 import unittest
 from base import dates
-from trading.core.pricing import OHLCV, PricingProvider, merge_pricing
+from trading.core.pricing import OHLCV, AdjustmentEvent, BasePricingProvider, PriceIndex, PricingProvider, PricingSeries, adjust_pricing, merge_pricing
 from trading.core import Interval
 from trading.core.securities import Exchange, Security, SecurityType
 from trading.core.work_calendar import BasicWorkCalendar, Hours, WorkSchedule
@@ -37,6 +37,32 @@ class TestOHLCV(unittest.TestCase):
         self.assertFalse(OHLCV(1,float('inf'),1,1,1,1).is_valid())
         self.assertFalse(OHLCV(1,float('nan'),1,1,1,1).is_valid())
 
+class TestPricingSeries(unittest.TestCase):
+    def test_window(self):
+        data = [OHLCV(t, x, x, x, x, x) for t,x in zip([1,2,5,7,8],[1,2,5,7,8])]
+        series = PricingSeries(data, [1,2,3,4,5,6,7,8], 0)
+        self.assertEqual([[3]*5, [4]*5, [5]*5], series.window(5.5, 3).tolist())
+        self.assertEqual([OHLCV(t, t, t, t, t, t) for t in [1,2,3]], [OHLCV(t, *row) for t, row in zip([1,2,3], series.window(3, 3).tolist())])
+        self.assertEqual(OHLCV.interpolate(data, [5,6,7]), [OHLCV(t, *row) for t, row in zip([5,6,7], series.window(7, 3).tolist())])
+        series.window(8, 3, max_fill_ratio=1/3)
+        self.assertRaises(Exception, lambda: series.window(8, 3, max_fill_ratio=0.3))
+        self.assertRaises(Exception, lambda: series.window(2, 3))
+        self.assertRaises(Exception, lambda: PricingSeries([], [1,2], 0).window(2, 1))
+
+class TestPriceIndex(unittest.TestCase):
+    def test_price_at(self):
+        from trading.providers.synthetic import SyntheticPricingProvider
+        provider = SyntheticPricingProvider(local=True)
+        start = calendar.str_to_unix('2025-01-10 15:00:00')
+        times = [start + i*1234.5 for i in range(100)]
+        index = PriceIndex(provider).load([security], times[0], times[-1])
+        prices = index.prices_at(security, times)
+        for unix_time, price in zip(times, prices):
+            self.assertAlmostEqual(provider.get_pricing_at(unix_time, security), price)
+        self.assertEqual(prices[3], index.price_at(security, times[3]))
+        self.assertRaises(Exception, lambda: index.price_at(security, times[0] - 24*3600))
+        self.assertRaises(Exception, lambda: PriceIndex(provider).price_at(security, times[0]))
+
 class TestMerge(unittest.TestCase):
     def test_merge(self):
         start = calendar.str_to_unix('2025-01-10 10:30:00')
@@ -78,6 +104,35 @@ class TestMerge(unittest.TestCase):
         result = merge_pricing(input, t1, t2+5400, Interval.H1, security)
         self.assertEqual(expect, result)
 
+class TestAdjust(unittest.TestCase):
+    def test_adjust_pricing(self):
+        data = [OHLCV(t, 12, 12, 12, 12, 12) for t in range(1, 7)]
+        events = [AdjustmentEvent(2, 0.5, True), AdjustmentEvent(4, 0.5)]
+        expect = [
+            OHLCV(1, 3, 3, 3, 3, 48),
+            OHLCV(2, 3, 3, 3, 3, 48),
+            OHLCV(3, 6, 6, 6, 6, 24),
+            OHLCV(4, 6, 6, 6, 6, 24),
+            OHLCV(5, 12, 12, 12, 12, 12),
+            OHLCV(6, 12, 12, 12, 12, 12)
+        ]
+        result = adjust_pricing(data, events)
+        self.assertEqual(expect, result)
+        self.assertEqual(OHLCV(1, 12, 12, 12, 12, 12), data[0])
+        self.assertEqual(data, adjust_pricing(data, []))
+
+class AdjustedProvider(BasePricingProvider):
+    @override
+    def get_adjusted_intervals(self) -> set[Interval]: return {Interval.H1}
+
+class TestBasePricingProvider(unittest.TestCase):
+    def test_pricing_key(self):
+        # only the adjusted intervals are stored under new keys, the others keep their cached bars
+        provider = AdjustedProvider(native=[Interval.H1, Interval.D1], local=True)
+        self.assertEqual('XTST_NVDA_H1_raw', provider._get_pricing_key(security, Interval.H1))
+        self.assertEqual('XTST_NVDA_D1', provider._get_pricing_key(security, Interval.D1))
+        self.assertEqual('XTST_NVDA_H1', BasePricingProvider(native=[Interval.H1], local=True)._get_pricing_key(security, Interval.H1))
+
 class TestPricingProvider(unittest.TestCase):
     def get_provider(self) -> PricingProvider: ...
     def get_securities(self) -> list[tuple[Security, float]]: ...
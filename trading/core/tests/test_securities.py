@@ -0,0 +1,90 @@
+import copy
+import pickle
+import unittest
+from typing import Sequence, override
+from base import dates
+from base.key_value_storage import MemoryKVStorage
+from base.reflection import get_classes
+from base.serialization import GenericSerializer
+from base.types import Flyweight
+from trading.core.securities import Exchange, Security, SecurityRegistry, SecurityType
+from trading.core.work_calendar import BasicWorkCalendar, Hours, WorkSchedule
+
+calendar = BasicWorkCalendar(tz=dates.ET, work_schedule=WorkSchedule.Builder(Hours(9, 16, open_minute=30)).build())
+class MockExchange(Exchange):
+    listing_hash = 'a'
+    parsed = 0
+    def __init__(self):
+        super().__init__('XTST', 'XTST', 'XTST', 'Test', calendar)
+    @override
+    def get_listing(self) -> Sequence[Security]:
+        MockExchange.parsed += 1
+        return [
+            MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1),
+            MockSecurity('BBB', 'B Inc.', SecurityType.ETF, MockExchange.instance, 2)
+        ]
+    @override
+    def get_listing_hash(self) -> str:
+        return MockExchange.listing_hash
+class MockSecurity(Security):
+    __slots__ = ('lot',)
+    def __init__(self, symbol: str, name: str, type: SecurityType, exchange: Exchange, lot: int):
+        super().__init__(symbol, name, type, exchange)
+        self.lot = lot
+
+class TestSecurity(unittest.TestCase):
+    def test_interning(self):
+        security = MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1)
+        self.assertIs(security, MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1))
+        self.assertIsNot(security, MockSecurity('AAB', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1))
+        self.assertEqual(hash(security), hash(MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1)))
+        self.assertFalse(hasattr(security, '__dict__'))
+        with self.assertRaises(Exception): security.lot = 2
+
+    def test_restore(self):
+        security = MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1)
+        serializer = GenericSerializer()
+        self.assertIs(security, serializer.deserialize(serializer.serialize(security)))
+        self.assertIs(security, pickle.loads(pickle.dumps(security)))
+        self.assertIs(security, copy.deepcopy(security))
+        self.assertIs(MockExchange.instance, pickle.loads(pickle.dumps(MockExchange.instance)))
+
+class TestSecurityRegistry(unittest.TestCase):
+    def test_snapshot(self):
+        securities = MockExchange.instance.get_listing()
+        snapshot = SecurityRegistry._to_snapshot('a', securities)
+        self.assertEqual(2, len(snapshot['rows']))
+        result = SecurityRegistry._from_snapshot(snapshot)
+        self.assertEqual(securities, result)
+        self.assertTrue(all(type(it) == MockSecurity for it in result))
+        self.assertIs(MockExchange.instance, result[0].exchange)
+
+    def test_load_listing(self):
+        exchange = MockExchange.instance
+        storage = MemoryKVStorage()
+        MockExchange.parsed = 0
+        MockExchange.listing_hash = 'a'
+        expect = exchange.get_listing()
+        self.assertEqual(expect, SecurityRegistry(storage)._load_listing(exchange))
+        self.assertEqual(expect, SecurityRegistry(storage)._load_listing(exchange))
+        self.assertEqual(2, MockExchange.parsed)
+        MockExchange.listing_hash = 'b'
+        self.assertEqual(expect, SecurityRegistry(storage)._load_listing(exchange))
+        self.assertEqual(3, MockExchange.parsed)
+
+    def test_refresh(self):
+        security = MockSecurity('AAA', 'A Inc.', SecurityType.STOCK, MockExchange.instance, 1)
+        stale = {**security.get_state(), 'name': 'A Corp.'}
+        self.assertIs(security, MockSecurity.restore(stale))
+        self.assertEqual('A Inc.', security.name)
+        with Flyweight.refreshing():
+            MockSecurity.restore(stale)
+        self.assertEqual('A Corp.', security.name)
+        # the registry refreshes the securities from the listing
+        SecurityRegistry(MemoryKVStorage())._load_listing(MockExchange.instance)
+        self.assertEqual('A Inc.', security.name)
+
+class TestExchange(unittest.TestCase):
+    def test_registry(self):
+        expect = {it.instance for it in get_classes("trading.providers", recursive=False, base=Exchange)}
+        self.assertEqual(expect, Exchange.all())
@@ -5,7 +5,7 @@ from trading.core import Interval
 from trading.core.news import Security
 from trading.core.securities import Exchange, SecurityType
 from trading.core.work_calendar import BasicWorkCalendar, WorkSchedule, Hours
-from trading.core.timing_config import BasicTimingConfig, execution_spots
+from trading.core.timing_config import BasicTimingConfig, execution_spots, worktime_spots
 
 serializer = GenericSerializer()
 calendar = BasicWorkCalendar(tz=dates.ET, work_schedule=WorkSchedule.Builder(Hours(9, 16, open_minute=30)).build())
@@ -60,4 +60,23 @@ class TestBasicTimingConfig(unittest.TestCase):
         ]
         result = list(execution_spots([sec1, sec2], timing_config, Interval.M30, start, end))
         self.assertEqual(expect, result)
-    
\ No newline at end of file
+    
+
+    def test_worktime_spots(self):
+        calendar3 = BasicWorkCalendar(tz=dates.CET, work_schedule=WorkSchedule.Builder(Hours(9, 0)).off('2025-04-21').build())
+        exchange3 = Exchange('XTST3', 'XTST3', 'XTST3', 'Test3', calendar3)
+        securities = [
+            Security('TST', 'Test', SecurityType.STOCK, exchange),
+            Security('TST1', 'Test1', SecurityType.STOCK, exchange),
+            Security('TST2', 'Test2', SecurityType.STOCK, exchange2),
+            Security('TST3', 'Test3', SecurityType.STOCK, exchange3)
+        ]
+        for start, step in [(calendar.str_to_unix('2025-04-17 00:00:00'), 1800), (calendar.str_to_unix('2025-04-18 10:07:00'), 1234)]:
+            end = start + 8*24*3600
+            expect = []
+            unix_time = start
+            while unix_time < end:
+                tradable = {it for it in securities if it.exchange.calendar.is_worktime(unix_time)}
+                if tradable: expect.append((unix_time, tradable))
+                unix_time += step
+            self.assertEqual(expect, list(worktime_spots(securities, step, start, end)))
@@ -1,7 +1,10 @@
 #3
 from __future__ import annotations
-from typing import Iterable, TypeVar, override
-from datetime import datetime, tzinfo
+import heapq
+import itertools
+import math
+from typing import Iterable, Iterator, TypeVar, override
+from datetime import datetime, time as dtime, timedelta, tzinfo
 from base import dates
 from base.serialization import Serializable
 from base.types import Equatable
@@ -79,14 +82,49 @@ class ForexTimingConfig(TimingConfig):
                 return True
         return False
 
+def _merge_spots(securities: Iterable[Security], spots: dict[Exchange, Iterator[float]]) -> Iterator[tuple[float, set[Security]]]:
+    """
+    Merges the spots of the exchanges through a heap, so that only the exchange whose spot was taken is advanced.
+    Yields each distinct time with all securities of the exchanges that have a spot at that time.
+    """
+    by_exchange: dict[Exchange, set[Security]] = {}
+    for security in securities: by_exchange.setdefault(security.exchange, set()).add(security)
+    merged = heapq.merge(*([(time, i) for time in spots[exchange]] for i, exchange in enumerate(by_exchange)))
+    exchanges = list(by_exchange)
+    for time, group in itertools.groupby(merged, key=lambda it: it[0]):
+        yield time, {security for _, i in group for security in by_exchange[exchanges[i]]}
+
 def execution_spots(securities: Iterable[Security], timing_config: TimingConfig, interval: Interval, start: float|None = None, end: float|None = None):
     unix_time = start or dates.unix()
     end = end or float('+inf')
     securities = set(securities)
-    exchanges = set(it.exchange for it in securities)
+    def spots(exchange: Exchange) -> Iterator[float]:
+        time = timing_config.next(unix_time, interval, exchange)
+        while time <= end:
+            yield time
+            time = timing_config.next(time, interval, exchange)
+    yield from _merge_spots(securities, {it.exchange: spots(it.exchange) for it in securities})
 
-    while True:
-        times: dict[Exchange, float] = {it: timing_config.next(unix_time, interval, it) for it in exchanges}
-        unix_time = min(times.values())
-        if unix_time > end: break
-        yield unix_time, {it for it in securities if times[it.exchange] == unix_time}
+def worktime_spots(securities: Iterable[Security], step: float, start: float, end: float) -> Iterator[tuple[float, set[Security]]]:
+    """
+    Yields the times start + k*step before end which fall within the work time of at least one exchange,
+    with the securities of those exchanges. Each exchange jumps from session to session,
+    instead of checking whether every step is within its work time.
+    """
+    securities = set(securities)
+    def spots(exchange: Exchange) -> Iterator[float]:
+        calendar = exchange.calendar
+        # a session closing at midnight includes the start of the next day
+        day = calendar.unix_to_datetime(start).date() - timedelta(days=1)
+        while True:
+            if datetime.combine(day, dtime(0), tzinfo=calendar.tz).timestamp() >= end: return
+            noon = datetime.combine(day, dtime(12), tzinfo=calendar.tz)
+            day += timedelta(days=1)
+            if calendar.is_off(noon): continue
+            session_open, session_close = calendar.set_open(noon).timestamp(), calendar.set_close(noon).timestamp()
+            # work time is (open, close]
+            k = max(0, math.floor((session_open - start)/step) + 1)
+            while start + k*step <= session_close and start + k*step < end:
+                yield start + k*step
+                k += 1
+    yield from _merge_spots(securities, {it.exchange: spots(it.exchange) for it in securities})
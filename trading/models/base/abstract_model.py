@@ -4,7 +4,6 @@ from itertools import chain
 from typing import overload, Literal
 import torch
 from torch import Tensor
-import torchinfo
 import config
 from trading.core import Interval
 from trading.models.base.model_config import BaseModelConfig
@@ -38,6 +37,7 @@ class AbstractModel(torch.nn.Module):
     def __call__(self, tensors: dict[str, Tensor]|Tensor, *args: Tensor) -> Tensor:
         return super().__call__(tensors, *args)
     def print_summary(self, merge: int = 10):
+        import torchinfo
         torchinfo.summary(self, input_size=[
             (config.models.batch_size*merge, *self.dummy_input[key].shape[1:]) for key in self.sorted_input_keys
         ])
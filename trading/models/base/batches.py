@@ -1,10 +1,16 @@
 #1
 from __future__ import annotations
-from typing import Iterable, Iterator, Self
+from typing import Callable, Iterable, Iterator, Self, Sequence
 import re
+import time
 import os
 import math
+import json
+import itertools
 import logging
+import numpy as np
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from torch import Tensor
 import torch
@@ -22,6 +28,11 @@ class BatchFile:
         self.exchange = Exchange.for_mic(match.group(1))
         self.unix_time = int(match.group(2))
         self.entry = int(match.group(3))
+    @property
+    def root(self) -> Path:
+        return self.path.parent
+    def read(self) -> dict[str, Tensor]:
+        return torch.load(self.path, weights_only=True)
     @staticmethod
     def get(folder: Path, time: float, entry: int, exchange: Exchange) -> BatchFile:
         return BatchFile(folder / f"{exchange.mic}_{int(time)}_{entry}.pt")
@@ -44,21 +55,258 @@ class Batches(Iterable[dict[str, Tensor]]):
     def __len__(self):
         return math.ceil(len(self.files)/self.merge)
 
+    def load(self, i: int, device: torch.device|None = None) -> dict[str, Tensor]:
+        """Returns the i-th merged batch, on the given device (by default the batches' device)."""
+        files = self.files[i*self.merge:(i+1)*self.merge]
+        data: list[dict[str, Tensor]] = [it.read() for it in files]
+        merged_data = {key:torch.cat([it[key] for it in data], dim=0).to(device=device or self.device, dtype=self.dtype) for key in data[0].keys()}
+        shapes = {key:merged_data[key].shape for key in merged_data}
+        logger.debug(f"Loaded batch with shape {shapes}")
+        return merged_data
+
     class Iterator(Iterator[dict[str, Tensor]]):
         batches: Batches
         def __init__(self, batches):
             self.batches = batches
             self.i = 0
         def __next__(self) -> dict[str, Tensor]:
-            if self.i >= len(self.batches.files):
+            if self.i >= len(self.batches):
                 raise StopIteration()
-            files = self.batches.files[self.i:self.i+self.batches.merge]
-            data: list[dict[str, Tensor]] = [torch.load(it.path, weights_only=True) for it in files]
-            merged_data = {key:torch.cat([it[key] for it in data], dim=0).to(device=self.batches.device, dtype=self.batches.dtype) for key in data[0].keys()}
-            shapes = {key:merged_data[key].shape for key in merged_data}
-            logger.debug(f"Loaded batch with shape {shapes}")
-            self.i += len(files)
-            return merged_data
+            self.i += 1
+            return self.batches.load(self.i-1)
 
     def __iter__(self):
         return Batches.Iterator(self)
+
+class BatchEntry:
+    """An index table row, locating the rows of one batch within a shard of the dataset."""
+    def __init__(self, dataset: MemmapDataset, exchange: Exchange, unix_time: int, entry: int, shard: str, start: int, stop: int):
+        self.dataset = dataset
+        self.exchange = exchange
+        self.unix_time = unix_time
+        self.entry = entry
+        self.shard = shard
+        self.start = start
+        self.stop = stop
+    def to_row(self) -> list:
+        return [self.exchange.mic, self.unix_time, self.entry, self.shard, self.start, self.stop]
+    @staticmethod
+    def from_row(dataset: MemmapDataset, row: list) -> BatchEntry:
+        return BatchEntry(dataset, Exchange.for_mic(row[0]), row[1], row[2], row[3], row[4], row[5])
+    @property
+    def root(self) -> Path:
+        return self.dataset.root
+    def read(self) -> dict[str, Tensor]:
+        return self.dataset.get([self])
+    def __len__(self) -> int:
+        return self.stop - self.start
+    def __repr__(self) -> str:
+        return f"BatchEntry({self.exchange.mic}, {self.unix_time}, {self.entry}, {self.shard}[{self.start}:{self.stop}])"
+
+class MemmapDataset:
+    """
+    Batches stored as rows of preallocated memory mapped arrays, one .npy file per tensor key per shard,
+    with an append only index table of (exchange, unix time, entry, shard, row range).
+    Rows are written before their index entry, so the index never points to incomplete data.
+    Reading slices the arrays without copying.
+    NOT thread safe.
+    Args:
+        shard_rows: The number of rows preallocated for each shard.
+        dtype: The dtype the rows are stored as.
+    """
+    INDEX = 'index.jsonl'
+    def __init__(self, root: Path, shard_rows: int = 1 << 16, dtype: torch.dtype = torch.float32):
+        self.root = root
+        self.shard_rows = shard_rows
+        self.dtype = torch.empty(0, dtype=dtype).numpy().dtype
+        self.entries: list[BatchEntry] = []
+        self._arrays: dict[tuple[str, str], np.ndarray] = {}
+        self._writable: dict[str, np.ndarray] = {}
+        self._shard: str|None = None
+        self._rows = 0
+        index = root/MemmapDataset.INDEX
+        if index.exists():
+            with open(index) as file:
+                self.entries = [BatchEntry.from_row(self, json.loads(line)) for line in file if line.strip()]
+        else: root.mkdir(parents=True, exist_ok=True)
+        self._keys = {(it.exchange, it.unix_time, it.entry): it for it in self.entries}
+        if self.entries:
+            self._shard = max(it.shard for it in self.entries)
+            self._rows = max(it.stop for it in self.entries if it.shard == self._shard)
+
+    def __getstate__(self) -> dict:
+        # the opened arrays are mapped again by the process they are sent to
+        return {**self.__dict__, '_arrays': {}, '_writable': {}}
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (root/MemmapDataset.INDEX).exists()
+    def contains(self, exchange: Exchange, unix_time: float, entry: int) -> bool:
+        return (exchange, int(unix_time), entry) in self._keys
+    def find(self, exchange: Exchange, unix_time: float, entry: int) -> BatchEntry|None:
+        return self._keys.get((exchange, int(unix_time), entry))
+
+    def _open(self, shard: str, key: str) -> np.ndarray:
+        if (shard, key) not in self._arrays:
+            self._arrays[(shard, key)] = np.load(self.root/shard/f"{key}.npy", mmap_mode='c')
+        return self._arrays[(shard, key)]
+    def _reserve(self, data: dict[str, Tensor], rows: int) -> dict[str, np.ndarray]:
+        """Returns the writable arrays of the shard the rows should be written to, creating a new one if the current is full."""
+        if self._shard is not None:
+            arrays = self._get_writable(self._shard, data)
+            if self._rows + rows <= len(next(iter(arrays.values()))): return arrays
+        self._shard = f"{int(self._shard)+1 if self._shard is not None else 0:05}"
+        self._rows = 0
+        (self.root/self._shard).mkdir()
+        capacity = max(self.shard_rows, rows)
+        self._writable = {
+            key: np.lib.format.open_memmap(self.root/self._shard/f"{key}.npy", mode='w+', dtype=self.dtype, shape=(capacity, *value.shape[1:]))
+            for key, value in data.items()
+        }
+        return self._writable
+    def _get_writable(self, shard: str, data: dict[str, Tensor]) -> dict[str, np.ndarray]:
+        if not self._writable:
+            self._writable = {key: np.load(self.root/shard/f"{key}.npy", mmap_mode='r+') for key in data.keys()}
+        if set(self._writable.keys()) != set(data.keys()):
+            raise Exception(f"Expected keys {sorted(self._writable.keys())}, got {sorted(data.keys())}.")
+        return self._writable
+
+    def append(self, exchange: Exchange, unix_time: float, entry: int, data: dict[str, Tensor]):
+        """Writes the batch (tensors with the same first dimension) and adds it to the index."""
+        if self.contains(exchange, unix_time, entry): raise Exception(f"Batch {exchange.mic} {unix_time} {entry} already exists in {self.root}.")
+        rows = len(next(iter(data.values())))
+        arrays = self._reserve(data, rows)
+        for key, value in data.items():
+            arrays[key][self._rows:self._rows+rows] = value.detach().cpu().numpy()
+            arrays[key].flush()
+        assert self._shard is not None
+        batch_entry = BatchEntry(self, exchange, int(unix_time), entry, self._shard, self._rows, self._rows+rows)
+        with open(self.root/MemmapDataset.INDEX, 'a') as file:
+            file.write(json.dumps(batch_entry.to_row()) + '\n')
+        self._rows += rows
+        self.entries.append(batch_entry)
+        self._keys[(batch_entry.exchange, batch_entry.unix_time, batch_entry.entry)] = batch_entry
+
+    def get(self, entries: Sequence[BatchEntry]) -> dict[str, Tensor]:
+        """
+        Returns the rows of the entries, which must belong to this dataset.
+        Consecutive entries of the same shard are sliced without copying, the rest are concatenated.
+        """
+        parts: list[tuple[str, int, int]] = []
+        for it in entries:
+            if it.dataset is not self: raise Exception(f"Entry {it} does not belong to {self.root}.")
+            if parts and parts[-1][0] == it.shard and parts[-1][2] == it.start: parts[-1] = (it.shard, parts[-1][1], it.stop)
+            else: parts.append((it.shard, it.start, it.stop))
+        keys = [it.stem for it in (self.root/parts[0][0]).glob('*.npy')]
+        tensors = {key: [torch.from_numpy(self._open(shard, key)[start:stop]) for shard, start, stop in parts] for key in keys}
+        return {key: value[0] if len(value) == 1 else torch.cat(value, dim=0) for key, value in tensors.items()}
+
+    @staticmethod
+    def from_batch_files(folder: Path, root: Path, **kwargs) -> MemmapDataset:
+        """Copies the batch files of the folder into the dataset at root, skipping those already copied."""
+        dataset = MemmapDataset(root, **kwargs)
+        for it in BatchFile.load(folder):
+            if dataset.contains(it.exchange, it.unix_time, it.entry): continue
+            dataset.append(it.exchange, it.unix_time, it.entry, it.read())
+        logger.info(f"Converted {len(dataset.entries)} batches from {folder} to {root}.")
+        return dataset
+
+class MemmapBatches(Iterable[dict[str, Tensor]]):
+    """The Batches counterpart for entries of MemmapDatasets."""
+    def __init__(self, entries: list[BatchEntry], merge: int = 1, device: torch.device = torch.device("cpu"), dtype = torch.float32):
+        self.entries = entries
+        self.merge = merge
+        self.device = device
+        self.dtype = dtype
+
+    def to(self, device: torch.device|None = None, dtype: torch.dtype|None = None) -> Self:
+        if device: self.device = device
+        if dtype: self.dtype = dtype
+        return self
+
+    def __len__(self):
+        return math.ceil(len(self.entries)/self.merge)
+
+    def load(self, i: int, device: torch.device|None = None) -> dict[str, Tensor]:
+        """Returns the i-th merged batch, on the given device (by default the batches' device)."""
+        entries = self.entries[i*self.merge:(i+1)*self.merge]
+        parts = [dataset.get(list(group)) for dataset, group in itertools.groupby(entries, key=lambda it: it.dataset)]
+        data = parts[0] if len(parts) == 1 else {key: torch.cat([it[key] for it in parts], dim=0) for key in parts[0].keys()}
+        return {key: value.to(device=device or self.device, dtype=self.dtype) for key, value in data.items()}
+
+    def __iter__(self) -> Iterator[dict[str, Tensor]]:
+        for i in range(len(self)):
+            yield self.load(i)
+
+_worker_batches: Batches|MemmapBatches|None = None
+def _init_worker(batches: Batches|MemmapBatches):
+    global _worker_batches
+    _worker_batches = batches
+def _load(i: int) -> dict[str, Tensor]:
+    """Loads a batch within a worker process, into shared memory, so that it is not copied back."""
+    assert _worker_batches is not None
+    return {key: value.share_memory_() for key, value in _worker_batches.load(i, torch.device("cpu")).items()}
+
+class PrefetchBatches(Iterable[dict[str, Tensor]]):
+    """
+    Loads the next batches in the background while the current one is used,
+    keeping at most prefetch batches loading or waiting to be used, including the next one. Batches are returned in order.
+    Args:
+        workers: The number of loading threads or processes.
+        processes: If true, batches are loaded by worker processes and passed back through shared memory.
+        pin_memory: If true, batches are pinned before being moved to the device, which is then done asynchronously.
+        on_batch: Called for each batch, with the number of loaded batches waiting to be used
+            and the time spent waiting for this one, in seconds.
+    """
+    def __init__(
+        self,
+        batches: Batches|MemmapBatches,
+        prefetch: int = 2,
+        workers: int = 1,
+        processes: bool = False,
+        pin_memory: bool = False,
+        on_batch: Callable[[int, float], None]|None = None
+    ):
+        self.batches = batches
+        self.prefetch = max(1, prefetch)
+        self.workers = workers
+        self.processes = processes
+        self.pin_memory = pin_memory
+        self.on_batch = on_batch
+
+    def to(self, device: torch.device|None = None, dtype: torch.dtype|None = None) -> Self:
+        self.batches.to(device, dtype)
+        return self
+
+    def __len__(self):
+        return len(self.batches)
+
+    def _load(self, i: int) -> dict[str, Tensor]:
+        data = self.batches.load(i, torch.device("cpu"))
+        if self.pin_memory: data = {key: value.pin_memory() for key, value in data.items()}
+        return data
+
+    def __iter__(self) -> Iterator[dict[str, Tensor]]:
+        if self.processes:
+            import torch.multiprocessing
+            # the batches are sent to each worker once, rather than with each submitted batch
+            executor: Executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=torch.multiprocessing.get_context(), initializer=_init_worker, initargs=(self.batches,))
+        else: executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        pending: deque[Future[dict[str, Tensor]]] = deque()
+        submitted = 0
+        stall = 0.
+        try:
+            for _ in range(len(self)):
+                while submitted < len(self) and len(pending) < self.prefetch:
+                    pending.append(executor.submit(_load, submitted) if self.processes else executor.submit(self._load, submitted))
+                    submitted += 1
+                start = time.perf_counter()
+                data = pending.popleft().result()
+                wait = time.perf_counter() - start
+                stall += wait
+                if self.on_batch: self.on_batch(sum(it.done() for it in pending), wait)
+                if self.processes and self.pin_memory: data = {key: value.pin_memory() for key, value in data.items()}
+                yield {key: value.to(device=self.batches.device, non_blocking=self.pin_memory) for key, value in data.items()}
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        logger.info(f"Waited {stall:.2f}s for {len(self)} prefetched batches.")
@@ -0,0 +1,116 @@
+#1
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Self
+import torch
+from torch import Tensor
+from base.reflection import get_full_classname
+from base.serialization import GenericSerializer
+from trading.core.securities import Exchange
+from trading.models.base.abstract_model import AbstractModel
+from trading.models.base.batches import Batches, MemmapBatches, MemmapDataset
+
+logger = logging.getLogger(__name__)
+serializer = GenericSerializer()
+
+class FeatureCache:
+    """
+    Stores the tensors a model extracts from source batches (extract_tensors), so that each batch is extracted once.
+    The tensors are kept in memmap datasets, one per model and source (e.g. batch folder),
+    and are identified by the exchange, time and entry of the source batch.
+    The model is identified by the hash of its class and config, so changing e.g. the pricing data config,
+    the output target or the moving average window never reads stale entries.
+    Thread safe.
+    """
+    OUTPUT = 'output'
+    def __init__(self, root: Path, model: AbstractModel, dtype: torch.dtype = torch.float32):
+        self.model = model
+        self.dtype = dtype
+        self.root = root/FeatureCache.get_hash(model)
+        self.datasets: dict[tuple[str, bool], MemmapDataset] = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def get_hash(model: AbstractModel) -> str:
+        return hashlib.sha256(f"{get_full_classname(model)}:{serializer.serialize(model.config)}".encode()).hexdigest()[:16]
+
+    def _get_dataset(self, source: str, with_output: bool) -> MemmapDataset:
+        with self.lock:
+            if (source, with_output) not in self.datasets:
+                name = hashlib.sha256(f"{source}:{with_output}".encode()).hexdigest()[:16]
+                self.datasets[(source, with_output)] = MemmapDataset(self.root/name, dtype=self.dtype)
+            return self.datasets[(source, with_output)]
+
+    def get(
+        self,
+        source: str,
+        exchange: Exchange,
+        unix_time: float,
+        entry: int,
+        read: Callable[[], dict[str, Tensor]],
+        with_output: bool = True,
+        device: torch.device = torch.device("cpu")
+    ) -> dict[str, Tensor]:
+        """
+        Returns the extracted tensors of the batch, including the target (under OUTPUT) if with_output is true.
+        If missing, the batch is read, moved to the device, extracted and stored.
+        Stored tensors are returned as views of the memmaps, on the cpu.
+        """
+        dataset = self._get_dataset(source, with_output)
+        with self.lock:
+            batch_entry = dataset.find(exchange, unix_time, entry)
+        if batch_entry is not None: return batch_entry.read()
+
+        example = {key: value.to(device=device, dtype=self.dtype) for key, value in read().items()}
+        if with_output:
+            tensors, output = self.model.extract_tensors(example, with_output=True)
+            tensors = {**tensors, FeatureCache.OUTPUT: output}
+        else:
+            tensors = self.model.extract_tensors(example, with_output=False)
+        with self.lock:
+            if not dataset.contains(exchange, unix_time, entry):
+                dataset.append(exchange, unix_time, entry, tensors)
+        return tensors
+
+    @staticmethod
+    def split(batch: dict[str, Tensor]) -> tuple[dict[str, Tensor], Tensor]:
+        """Splits cached tensors into the model input and the target."""
+        return {key: value for key, value in batch.items() if key != FeatureCache.OUTPUT}, batch[FeatureCache.OUTPUT]
+
+class FeatureBatches(Iterable[dict[str, Tensor]]):
+    """
+    Returns the extracted tensors of the batches (including the target under FeatureCache.OUTPUT) instead of the raw examples,
+    reading them from the cache after the first epoch.
+    """
+    def __init__(self, batches: Batches|MemmapBatches, cache: FeatureCache):
+        self.batches = batches
+        self.cache = cache
+
+    @property
+    def device(self) -> torch.device: return self.batches.device
+    @property
+    def dtype(self) -> torch.dtype: return self.batches.dtype
+    def to(self, device: torch.device|None = None, dtype: torch.dtype|None = None) -> Self:
+        self.batches.to(device, dtype)
+        return self
+
+    def __len__(self):
+        return len(self.batches)
+
+    def load(self, i: int, device: torch.device|None = None) -> dict[str, Tensor]:
+        merge = self.batches.merge
+        items = self.batches.files[i*merge:(i+1)*merge] if isinstance(self.batches, Batches) else self.batches.entries[i*merge:(i+1)*merge]
+        parts = [
+            self.cache.get(str(it.root), it.exchange, it.unix_time, it.entry, it.read, with_output=True, device=self.batches.device)
+            for it in items
+        ]
+        return {
+            key: (parts[0][key] if len(parts) == 1 else torch.cat([it[key].cpu() for it in parts], dim=0)).to(device=device or self.device, dtype=self.dtype)
+            for key in parts[0].keys()
+        }
+
+    def __iter__(self) -> Iterator[dict[str, Tensor]]:
+        for i in range(len(self)):
+            yield self.load(i)
@@ -0,0 +1,67 @@
+#1
+"""
+Vectorized feature kernels, equivalent to the reference functions in tensors.py,
+but computed with a constant number of operations regardless of the window size,
+and optionally into preallocated outputs.
+"""
+from __future__ import annotations
+import torch
+from torch import Tensor
+from trading.models.base.model_config import BarValues
+
+def _to_last(tensor: Tensor, dim: int) -> Tensor:
+    return tensor.movedim(dim, -1)
+
+def moving_average(tensor: Tensor, dim: int = 1, window: int = 10, out: Tensor|None = None) -> Tensor:
+    """
+    The moving average across dim, of the same shape as the tensor.
+    Entries before the first are considered equal to the first, as in get_moving_average.
+    """
+    series = _to_last(tensor, dim)
+    # window sums as differences of cumulative sums of the deviations from the first entry,
+    # which keeps the sums small, and makes the entries before the first contribute nothing
+    first = series[...,:1]
+    sums = (series - first).cumsum(dim=-1)
+    result = sums.clone() if out is None else _to_last(out, dim).copy_(sums)
+    result[...,window:] -= sums[...,:-window]
+    result.div_(window).add_(first)
+    return result.movedim(-1, dim) if out is None else out
+
+def relativize(tensor: Tensor, dim: int = 1, out: Tensor|None = None) -> Tensor:
+    """
+    The relative difference between adjacent entries across dim, with 0 for the first entry, as in get_time_relativized.
+    Args:
+        out: The preallocated output, of the same shape as the tensor. Must not overlap with it.
+    """
+    series = _to_last(tensor, dim)
+    result = torch.empty_like(series) if out is None else _to_last(out, dim)
+    torch.sub(series[...,1:], series[...,:-1], out=result[...,1:])
+    result[...,1:].div_(series[...,:-1])
+    result[...,0] = 0
+    return result.movedim(-1, dim) if out is None else out
+
+def span_average_relativize(tensor: Tensor, count: int, window: int = 10, out: Tensor|None = None) -> Tensor:
+    """
+    The model4 features of a batch of bars, of shape (batch, time, >=5), with values ordered as BarValues.
+    Takes the last count+window entries, replaces the open with the relative high-low span,
+    appends the moving averages of all 5 values, and relativizes all but the span (and its average) in time.
+    Returns the last count entries, of shape (batch, 10, count).
+    Args:
+        out: The preallocated output, of shape (batch, 10, count).
+    """
+    bars = tensor[:,-count-window:,:5].transpose(1, 2)
+    length = bars.shape[2]
+    if length < count: raise Exception(f"Expected at least {count} entries, got {length}.")
+    span = (bars[:,BarValues.H.value] - bars[:,BarValues.L.value]).div_(bars[:,BarValues.L.value])
+    prices = bars[:,1:5]
+    result = torch.empty((bars.shape[0], 10, count), dtype=bars.dtype, device=bars.device) if out is None else out
+    result[:,0] = span[:,-count:]
+    result[:,5] = moving_average(span, dim=1, window=window)[:,-count:]
+    for offset, series in ((1, prices), (6, moving_average(prices, dim=2, window=window))):
+        current, previous = series[...,-count:], series[...,-count-1:-1]
+        if length == count:
+            torch.sub(current[...,1:], previous, out=result[:,offset:offset+4,1:]).div_(previous)
+            result[:,offset:offset+4,0] = 0
+        else:
+            torch.sub(current, previous, out=result[:,offset:offset+4]).div_(previous)
+    return result
@@ -6,10 +6,8 @@ import time
 import torch
 import logging
 import gc
-from typing import Literal, Sequence, final, override
+from typing import TYPE_CHECKING, Literal, Sequence, final, override
 from pathlib import Path
-from tqdm import tqdm
-from matplotlib import pyplot as plt
 from torch import Tensor
 from sqlalchemy import Engine, create_engine, select
 from sqlalchemy.orm import Session, Mapped, declarative_base, mapped_column
@@ -18,12 +16,15 @@ from base import plotutils
 from base import dates
 from base.algos import interpolate
 from base.serialization import SerializedObject
-from base.reflection import get_module, get_full_classname
+from base.reflection import get_module, get_full_classname, lazy_import
 from trading.models.base.abstract_model import AbstractModel
-from trading.models.base.batches import BatchFile, Batches
+from trading.models.base.batches import BatchEntry, BatchFile, Batches, MemmapBatches, MemmapDataset, PrefetchBatches
+from trading.models.base.feature_cache import FeatureBatches, FeatureCache
 from trading.models.base.stats import StatContainer
 from trading.models.base.model_config import BaseModelConfig
 from trading.models.base.tensors import get_sampled
+if TYPE_CHECKING: from matplotlib import pyplot as plt
+else: plt = lazy_import("matplotlib.pyplot")
 
 logger = logging.getLogger(__name__)
 
@@ -242,18 +243,36 @@ class Rule:
 
 #region Training helpers
 class BatchGroupConfig:
+    """
+    Args:
+        prefetch: If positive, the number of batches loaded in the background ahead of the one being used.
+        prefetch_workers: The number of threads (or processes) loading the batches.
+        prefetch_processes: If true, the batches are loaded by processes instead of threads.
+        pin_memory: If true, the prefetched batches are pinned before being moved to the device.
+        feature_cache: If true, the tensors extracted from the batches are stored on the first epoch and reused afterwards.
+    """
     def __init__(self,
         name: str,
         ratio: float,
         merge: int,
         sampling: list[tuple[float|tuple[float,float], float]]|None = None,
-        backward: bool = False
+        backward: bool = False,
+        prefetch: int = 0,
+        prefetch_workers: int = 1,
+        prefetch_processes: bool = False,
+        pin_memory: bool = False,
+        feature_cache: bool = False
     ):
         self.name = name
         self.ratio = ratio
         self.merge = merge
         self.sampling = sampling
         self.backward = backward
+        self.prefetch = prefetch
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_processes = prefetch_processes
+        self.pin_memory = pin_memory
+        self.feature_cache = feature_cache
 
 class TrainConfig:
     rules: list[Rule]
@@ -276,7 +295,7 @@ class TrainConfig:
             return TrainConfig._ActionBuilder(rule)
 
 class BatchGroup:
-    def __init__(self, config: BatchGroupConfig, batches: Batches):
+    def __init__(self, config: BatchGroupConfig, batches: Batches|MemmapBatches|FeatureBatches|PrefetchBatches):
         self.config = config
         self.batches = batches
 
@@ -316,8 +335,14 @@ _DB = "data.db"
 _CHECKPOINTS = "checkpoints"
 _PRIMARY_CHECKPOINT = "primary_checkpoint.pt"
 _BACKTESTS = "backtests"
+_FEATURES = "features"
 #endregion
 
+def _restore_manager[T: AbstractModel](model: T, state: dict) -> ModelManager[T]:
+    manager = ModelManager(model)
+    manager.model.load_state_dict(state)
+    return manager
+
 class ModelManager[T: AbstractModel]:
     model: T
     def __init__(self, model: T):
@@ -346,6 +371,13 @@ class ModelManager[T: AbstractModel]:
         if self.primary_checkpoint.exists():
             CheckpointAction(self.primary_checkpoint).restore(self)
 
+    def __reduce__(self):
+        """
+        Pickled as the model and its current state, e.g. to evaluate it in worker processes.
+        The unpickled manager is created anew for the model, and then gets the pickled model state instead of the checkpoint.
+        """
+        return (_restore_manager, (self.model, self.model.state_dict()))
+
     def state_dict(self) -> dict:
         return {
             'model': self.model.state_dict(),
@@ -367,8 +399,15 @@ class ModelManager[T: AbstractModel]:
         self.train_state.stop = train_state['stop']
 
     def create_batch_groups(self, config: TrainConfig) -> list[BatchGroup]:
-        files: list[BatchFile] = []
-        files = functools.reduce(lambda files, folder: files +  BatchFile.load(folder), config.inputs, files)
+        """
+        Splits the batches of the inputs into groups, in time order.
+        Inputs are either batch file folders or memmap datasets, but not a mix of both.
+        """
+        memmap = [MemmapDataset.exists(it) for it in config.inputs]
+        if any(memmap) and not all(memmap): raise Exception(f"Inputs {config.inputs} mix batch file folders and memmap datasets.")
+        files: list[BatchFile]|list[BatchEntry] = []
+        if all(memmap) and config.inputs: files = [it for folder in config.inputs for it in MemmapDataset(folder).entries]
+        else: files = functools.reduce(lambda files, folder: files +  BatchFile.load(folder), config.inputs, files)
         files = sorted(files, key=lambda it: it.unix_time)
         files = [
             it for it in files 
@@ -381,11 +420,34 @@ class ModelManager[T: AbstractModel]:
         for i in range(len(files)-sum(counts)): counts[i] += 1
         result: list[BatchGroup] = []
         for count, batch_group_config in zip(counts, config.batch_group_configs):
-            result.append(BatchGroup(batch_group_config, Batches(files[:count], merge=batch_group_config.merge, device = self.device, dtype = self.dtype)))
+            batches_type = MemmapBatches if all(memmap) and config.inputs else Batches
+            batches = batches_type(files[:count], merge=batch_group_config.merge, device = self.device, dtype = self.dtype)
+            if batch_group_config.feature_cache:
+                if batch_group_config.prefetch > 0 and batch_group_config.prefetch_processes:
+                    raise Exception(f"The feature cache of batch group {batch_group_config.name} can not be filled by prefetching processes.")
+                batches = FeatureBatches(batches, self.feature_cache)
+            if batch_group_config.prefetch > 0:
+                batches = PrefetchBatches(
+                    batches,
+                    prefetch=batch_group_config.prefetch,
+                    workers=batch_group_config.prefetch_workers,
+                    processes=batch_group_config.prefetch_processes,
+                    pin_memory=batch_group_config.pin_memory and self.device.type == 'cuda'
+                )
+            result.append(BatchGroup(batch_group_config, batches))
             files = files[count:]
         return result
 
+    @functools.cached_property
+    def feature_cache(self) -> FeatureCache:
+        return FeatureCache(self.root/_FEATURES, self.model, self.dtype)
+    def extract_tensors(self, batch: dict[str, Tensor]) -> tuple[dict[str, Tensor], Tensor]:
+        """Returns the model input and the target of a raw or already extracted (feature cache) batch."""
+        if FeatureCache.OUTPUT in batch: return FeatureCache.split(batch)
+        return self.model.extract_tensors(batch, with_output=True)
+
     def train(self, config: TrainConfig, max_epoch = 10000000):
+        from tqdm import tqdm
         batch_groups = self.create_batch_groups(config)
         primary_checkpoint = CheckpointAction(self.primary_checkpoint)
         stats = config.stats
@@ -410,7 +472,7 @@ class ModelManager[T: AbstractModel]:
                         self.model.train()
                         with tqdm(batch_group.batches, desc=f"Epoch {self.epoch} ({batch_group.config.name})", leave=True) as bar:
                             for batch in bar:
-                                input, expect = self.model.extract_tensors(batch, with_output=True)
+                                input, expect = self.extract_tensors(batch)
                                 if batch_group.config.sampling:
                                     sample = get_sampled(expect, batch_group.config.sampling)
                                     input = {key: value[sample] for key,value in input.items()}
@@ -428,7 +490,7 @@ class ModelManager[T: AbstractModel]:
                         with torch.no_grad():
                             with tqdm(batch_group.batches, desc = f"Evaluating '{batch_group.config.name}' batches...", leave=False) as bar:
                                 for batch in bar:
-                                    input, expect = self.model.extract_tensors(batch, with_output=True)
+                                    input, expect = self.extract_tensors(batch)
                                     if batch_group.config.sampling:
                                         sample = get_sampled(expect, batch_group.config.sampling)
                                         input = {key: value[sample] for key,value in input.items()}
@@ -2,22 +2,26 @@
 from __future__ import annotations
 from functools import cached_property
 import logging
-from matplotlib.axes import Axes
 from numpy import ndarray
 import torch
-from typing import overload, Iterable, override, TypeVar
+from typing import TYPE_CHECKING, Callable, overload, Iterable, Sequence, override, TypeVar
 from torch import Tensor
 from enum import Enum, auto
-from matplotlib import pyplot as plt
 from torch.nn.modules import Module
 
-from base.reflection import transient
+from base.reflection import transient, lazy_import
 from base.serialization import GenericSerializer, Serializable, json_type
 from base.types import ReadonlyDict, Equatable
 from trading.core import Interval
 from trading.core.timing_config import TimingConfig
 from trading.core.securities import Exchange, Security
+from trading.core.pricing import OHLCV
 from trading.providers.aggregate import AggregateProvider
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib import pyplot as plt
+else:
+    plt = lazy_import("matplotlib.pyplot")
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +116,64 @@ class PriceEstimator(Equatable, Serializable):
         tensor = torch.tensor([it[self.value.name] for it in prices], dtype=torch.float64)
         return float(self.agg.apply(tensor, dim=-1).item())
 
+    def estimate_many(self, securities: Sequence[Security], unix_times: Sequence[float]) -> list[float|Exception]:
+        """
+        Vectorized estimate, for each pair of security and time.
+        The windows with the same bounds are fetched together (get_pricing_many),
+        and the windows of the same length are aggregated as a single tensor.
+        Returns the exception instead of the estimate for each pair that failed.
+        """
+        def bounds(security: Security, unix_time: float) -> tuple[float, float]:
+            return unix_time, security.exchange.calendar.add_intervals(unix_time, self.interval, self.index.stop)
+        windows = _get_pricing_many(securities, unix_times, bounds, self.interval, interpolate=True, max_fill_ratio=self.max_fill_ratio)
+        result: list[float|Exception] = [it if isinstance(it, Exception) else Exception(f"No pricing.") for it in windows]
+        by_length: dict[int, list[int]] = {}
+        for i, window in enumerate(windows):
+            if not isinstance(window, Exception) and window: by_length.setdefault(len(window), []).append(i)
+        for indices in by_length.values():
+            tensor = torch.tensor([[it[self.value.name] for it in windows[i]] for i in indices], dtype=torch.float64) # type: ignore
+            for i, value in zip(indices, self.agg.apply(tensor, dim=-1).tolist()): result[i] = value
+        return result
+
+    @staticmethod
+    def price_at_many(
+        securities: Sequence[Security],
+        unix_times: Sequence[float],
+        interval: Interval = Interval.M5,
+        value: BarValues = BarValues.C,
+        lookback: float = 24*3600
+    ) -> list[float|Exception]:
+        """
+        The value of the last bar within the lookback before each time (e.g. the buy price at the last M5 close), for each pair of security and time.
+        Returns the exception instead of the price for each pair that failed.
+        """
+        windows = _get_pricing_many(securities, unix_times, lambda security, unix_time: (unix_time - lookback, unix_time), interval)
+        return [
+            it if isinstance(it, Exception) else it[-1][value.name] if it else Exception(f"No pricing.")
+            for it in windows
+        ]
+
+def _get_pricing_many(
+    securities: Sequence[Security],
+    unix_times: Sequence[float],
+    bounds: Callable[[Security, float], tuple[float, float]],
+    interval: Interval,
+    *,
+    interpolate: bool = False,
+    max_fill_ratio: float = 1
+) -> list[Sequence[OHLCV]|Exception]:
+    """Fetches the pricing within the bounds of each pair of security and time, with one get_pricing_many call per distinct bounds."""
+    if len(securities) != len(unix_times): raise Exception(f"Got {len(securities)} securities and {len(unix_times)} times.")
+    groups: dict[tuple[float, float], list[int]] = {}
+    for i, (security, unix_time) in enumerate(zip(securities, unix_times)):
+        groups.setdefault(bounds(security, unix_time), []).append(i)
+    result: list[Sequence[OHLCV]|Exception] = [Exception(f"Failed to fetch {interval} pricing for {it.symbol}.") for it in securities]
+    for (unix_from, unix_to), indices in groups.items():
+        pricing = AggregateProvider.instance.get_pricing_many(unix_from, unix_to, {securities[i] for i in indices}, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+        for i in indices:
+            if securities[i] in pricing: result[i] = pricing[securities[i]]
+    return result
+
 class PriceModifier(Equatable, Serializable):
     """
     Modifies price change percentages to values that should be used as model outputs.
@@ -8,16 +8,20 @@ from torch import Tensor
 
 logger = logging.getLogger(__name__)
 
+def _count_bad_entries(tensor: Tensor, allow_zeros: bool = True) -> Tensor:
+    result = ~tensor.isfinite()
+    if not allow_zeros: result = result | (tensor == 0)
+    return result.sum()
 def check_tensors(tensors: Sequence[Tensor] | tuple[Tensor] | Mapping[Any, Tensor], allow_zeros=True):
-    if isinstance(tensors, (Sequence, tuple)):
-        for tensor in tensors: check_tensor(tensor)
-    elif isinstance(tensors, Mapping):
-        for tensor in tensors.values(): check_tensor(tensor)
-    else: raise ValueError("Expecting list, tuple or dict in check_tensors.")
+    """Checks all tensors with a single device sync."""
+    if isinstance(tensors, Mapping): tensors = list(tensors.values())
+    elif not isinstance(tensors, (Sequence, tuple)): raise ValueError("Expecting list, tuple or dict in check_tensors.")
+    if not tensors: return
+    bad_entries = int(torch.stack([_count_bad_entries(it, allow_zeros).to(tensors[0].device) for it in tensors]).sum().item())
+    if bad_entries > 0:
+        raise Exception(f"Found {bad_entries} unwanted inf, nan {'or 0 ' if not allow_zeros else ''}values in tensors.")
 def check_tensor(tensor: Tensor, allow_zeros=True):
-    result = tensor.isnan() | tensor.isinf()
-    if not allow_zeros: result = result | (tensor == 0)
-    bad_entries = result.sum().item()
+    bad_entries = int(_count_bad_entries(tensor, allow_zeros).item())
     if bad_entries > 0:
         raise Exception(f"Found {bad_entries} unwanted inf, nan {'or 0 ' if not allow_zeros else ''}values in tensors.")
 
@@ -0,0 +1,71 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import torch
+from trading.providers.nasdaq import Nasdaq
+from trading.models.base.batches import BatchFile, Batches, MemmapBatches, MemmapDataset, PrefetchBatches
+
+def _batch(i: int, rows: int) -> dict[str, torch.Tensor]:
+    return {
+        'H1': torch.arange(rows*10*5, dtype=torch.float64).reshape(rows, 10, 5) + i,
+        'AFTER_H1': torch.full((rows, 7, 5), float(i), dtype=torch.float64)
+    }
+
+class TestMemmapDataset(unittest.TestCase):
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as root:
+            folder, target = Path(root)/'files', Path(root)/'memmap'
+            folder.mkdir()
+            for i in range(5):
+                torch.save(_batch(i, 3 + i%2), BatchFile.get(folder, 1000*(i//2), i, Nasdaq.instance).path)
+            dataset = MemmapDataset.from_batch_files(folder, target, shard_rows=8)
+            self.assertEqual(5, len(dataset.entries))
+            self.assertEqual(['00000', '00000', '00001', '00001', '00002'], [it.shard for it in dataset.entries])
+            # converting again only adds missing batches
+            self.assertEqual(5, len(MemmapDataset.from_batch_files(folder, target, shard_rows=8).entries))
+
+            dataset = MemmapDataset(target)
+            self.assertTrue(dataset.contains(Nasdaq.instance, 1000, 2))
+            self.assertFalse(dataset.contains(Nasdaq.instance, 1000, 4))
+            expected = list(Batches(BatchFile.load(folder), merge=2))
+            result = list(MemmapBatches(dataset.entries, merge=2))
+            self.assertEqual(len(expected), len(result))
+            for a, b in zip(expected, result):
+                self.assertEqual(a.keys(), b.keys())
+                for key in a: self.assertTrue(torch.equal(a[key], b[key]))
+            # rows of the same shard are not copied
+            data = dataset.get(dataset.entries[:2])
+            self.assertTrue(np.shares_memory(data['H1'].numpy(), dataset._open('00000', 'H1')))
+            self.assertRaises(Exception, lambda: dataset.append(Nasdaq.instance, 1000, 2, _batch(0, 1)))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as root:
+            dataset = MemmapDataset(Path(root), shard_rows=8)
+            dataset.append(Nasdaq.instance, 1, 1, _batch(1, 3))
+            dataset = MemmapDataset(Path(root), shard_rows=8)
+            dataset.append(Nasdaq.instance, 2, 1, _batch(2, 3))
+            dataset.append(Nasdaq.instance, 3, 1, _batch(3, 10))
+            self.assertEqual([('00000', 0, 3), ('00000', 3, 6), ('00001', 0, 10)], [(it.shard, it.start, it.stop) for it in dataset.entries])
+            self.assertTrue(torch.equal(_batch(2, 3)['AFTER_H1'].float(), dataset.get(dataset.entries[1:2])['AFTER_H1']))
+            self.assertRaises(Exception, lambda: dataset.append(Nasdaq.instance, 4, 1, {'H1': torch.zeros(1, 10, 5)}))
+
+class TestPrefetchBatches(unittest.TestCase):
+    def test_prefetch(self):
+        with tempfile.TemporaryDirectory() as root:
+            folder = Path(root)
+            for i in range(7):
+                torch.save(_batch(i, 2), BatchFile.get(folder, 1000*i, i, Nasdaq.instance).path)
+            dataset = MemmapDataset.from_batch_files(folder, folder/'memmap')
+            for batches in [Batches(BatchFile.load(folder), merge=2), MemmapBatches(dataset.entries, merge=2)]:
+                expected = list(batches)
+                for processes in [False, True]:
+                    calls: list[tuple[int, float]] = []
+                    prefetch = PrefetchBatches(batches, prefetch=2, workers=2, processes=processes, on_batch=lambda depth, wait: calls.append((depth, wait)))
+                    self.assertEqual(len(batches), len(prefetch))
+                    result = list(prefetch)
+                    self.assertEqual(len(expected), len(result))
+                    for a, b in zip(expected, result):
+                        for key in a: self.assertTrue(torch.equal(a[key], b[key]))
+                    self.assertEqual(len(expected), len(calls))
+                    self.assertTrue(all(0 <= depth < 2 for depth, _ in calls))
@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import torch
+from trading.core import Interval
+from trading.core.timing_config import BasicTimingConfig
+from trading.providers.nasdaq import Nasdaq
+from trading.models.base.batches import BatchFile, Batches
+from trading.models.base.feature_cache import FeatureBatches, FeatureCache
+from trading.models.base.model_config import AFTER, Aggregation, BarValues, LinearPriceModifier, PriceOutputTarget, PricingDataConfig
+from trading.models.model4.model import Model, ModelConfig
+
+def _config(mvg_window: int = 10) -> ModelConfig:
+    return ModelConfig(
+        (Nasdaq.instance,),
+        PricingDataConfig({Interval.H1: 10}),
+        PriceOutputTarget(Interval.H1, BarValues.C, slice(1,2), Aggregation.AVG, LinearPriceModifier(0, 0.1)),
+        BasicTimingConfig.Builder().at(9).build(),
+        mvg_window
+    )
+
+class TestFeatureCache(unittest.TestCase):
+    def test_feature_batches(self):
+        generator = torch.Generator().manual_seed(0)
+        with tempfile.TemporaryDirectory() as root:
+            folder = Path(root)/'batches'
+            folder.mkdir()
+            for i in range(3):
+                torch.save({
+                    'H1': 10 + torch.rand((4, 30, 5), generator=generator, dtype=torch.float64),
+                    f'{AFTER}_H1': 10 + torch.rand((4, 7, 5), generator=generator, dtype=torch.float64)
+                }, BatchFile.get(folder, 1000*i, i, Nasdaq.instance).path)
+            model = Model(_config())
+            batches = Batches(BatchFile.load(folder), merge=2)
+            expected = [model.extract_tensors(it, with_output=True) for it in batches]
+
+            cache = FeatureCache(Path(root)/'features', model)
+            for epoch in range(2):
+                with patch.object(model, 'extract_tensors', wraps=model.extract_tensors) as extract:
+                    result = [FeatureCache.split(it) for it in FeatureBatches(batches, cache)]
+                    self.assertEqual(3 if epoch == 0 else 0, extract.call_count)
+                self.assertEqual(len(expected), len(result))
+                for (input, output), (expected_input, expected_output) in zip(result, expected):
+                    self.assertEqual(expected_input.keys(), input.keys())
+                    for key in input: self.assertTrue(torch.allclose(expected_input[key], input[key]))
+                    self.assertTrue(torch.allclose(expected_output, output))
+
+            # another cache instance reads the stored features
+            with patch.object(model, 'extract_tensors') as extract:
+                list(FeatureBatches(batches, FeatureCache(Path(root)/'features', model)))
+                extract.assert_not_called()
+
+    def test_invalidation(self):
+        self.assertEqual(FeatureCache.get_hash(Model(_config())), FeatureCache.get_hash(Model(_config())))
+        self.assertNotEqual(FeatureCache.get_hash(Model(_config())), FeatureCache.get_hash(Model(_config(5))))
+        config = _config()
+        other = ModelConfig(config.exchanges, PricingDataConfig({Interval.H1: 12}), config.price_output_target, config.timing)
+        self.assertNotEqual(FeatureCache.get_hash(Model(config)), FeatureCache.get_hash(Model(other)))
@@ -0,0 +1,69 @@
+import os
+import time
+import unittest
+import torch
+from torch import Tensor
+from trading.models.base.model_config import BarValues
+from trading.models.base.tensors import get_moving_average, get_time_relativized
+from trading.models.base.kernels import moving_average, relativize, span_average_relativize
+
+def _reference(tensor: Tensor, count: int, window: int) -> Tensor:
+    """The model4 feature extraction, composed of the reference functions."""
+    tensor = tensor[:,-count-window:,:5].clone()
+    tensor[:,:,BarValues.O.value] = (tensor[:,:,BarValues.H.value] - tensor[:,:,BarValues.L.value]) / tensor[:,:,BarValues.L.value]
+    mvg = get_moving_average(tensor, dim=1, window=window)
+    tensor = torch.concat([tensor, mvg], dim=2)
+    tensor[:,:,1:5] = get_time_relativized(tensor[:,:,1:5], dim=1)
+    tensor[:,:,6:10] = get_time_relativized(tensor[:,:,6:10], dim=1)
+    return tensor[:,-count:,:].transpose(1,2)
+
+def _bars(batch: int, length: int) -> Tensor:
+    return 10 + torch.rand((batch, length, 5), generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+
+class TestKernels(unittest.TestCase):
+    def test_moving_average(self):
+        tensor = torch.randn((4, 50, 3), generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+        for window in [1, 3, 10]:
+            for dim in [0, 1, 2]:
+                self.assertTrue(torch.allclose(get_moving_average(tensor, dim=dim, window=window), moving_average(tensor, dim=dim, window=window)))
+        out = torch.empty_like(tensor)
+        self.assertIs(out, moving_average(tensor, dim=1, window=4, out=out))
+        self.assertTrue(torch.allclose(get_moving_average(tensor, dim=1, window=4), out))
+        prices = 100 + _bars(4, 1000).cumsum(dim=1)
+        self.assertTrue(torch.allclose(get_moving_average(prices, dim=1, window=20), moving_average(prices.float(), dim=1, window=20).double(), rtol=1e-5))
+
+    def test_relativize(self):
+        tensor = _bars(3, 20)
+        for dim in [0, 1, 2]:
+            self.assertTrue(torch.allclose(get_time_relativized(tensor, dim=dim), relativize(tensor, dim=dim)))
+        out = torch.empty_like(tensor)
+        self.assertIs(out, relativize(tensor, dim=1, out=out))
+        self.assertTrue(torch.allclose(get_time_relativized(tensor, dim=1), out))
+
+    def test_span_average_relativize(self):
+        for length, count, window in [(100, 30, 10), (40, 30, 10), (30, 30, 10), (25, 20, 1)]:
+            tensor = _bars(8, length)
+            original = tensor.clone()
+            expect = _reference(tensor, count, window)
+            result = span_average_relativize(tensor, count, window)
+            self.assertEqual(expect.shape, result.shape)
+            self.assertTrue(torch.allclose(expect, result))
+            self.assertTrue(torch.equal(original, tensor))
+        out = torch.empty((8, 10, 20), dtype=torch.float64)
+        self.assertIs(out, span_average_relativize(_bars(8, 50), 20, 10, out=out))
+        self.assertRaises(Exception, lambda: span_average_relativize(_bars(8, 10), 20, 10))
+
+    @unittest.skipUnless(os.environ.get('BENCHMARK'), "Set BENCHMARK to run")
+    def test_benchmark(self):
+        tensor = _bars(1024, 200).float()
+        def measure(function) -> float:
+            function()
+            times = []
+            for _ in range(10):
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+            return min(times)
+        reference = measure(lambda: _reference(tensor, 100, 10))
+        fused = measure(lambda: span_average_relativize(tensor, 100, 10))
+        print(f"Model4 features for {tuple(tensor.shape)}: reference {reference*1000:.2f}ms, fused {fused*1000:.2f}ms.")
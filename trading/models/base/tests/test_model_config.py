@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+import injection
+from base import dates
+from trading.core import Interval
+from trading.core.securities import Security, SecurityType
+from trading.core.tests.test_pricing import exchange
+from trading.providers.synthetic import SyntheticPricingProvider
+from trading.models.base.model_config import Aggregation, BarValues, PriceEstimator
+
+securities = [Security(f"EST{i}", f"Estimator Test {i}", SecurityType.STOCK, exchange) for i in range(5)]
+
+class FailingProvider(SyntheticPricingProvider):
+    def get_pricing_raw(self, unix_from, unix_to, security, interval):
+        if security.symbol == 'EST3': raise Exception(f"Failing {security.symbol}.")
+        return super().get_pricing_raw(unix_from, unix_to, security, interval)
+    async def get_pricing_raw_async(self, unix_from, unix_to, security, interval):
+        if security.symbol == 'EST3': raise Exception(f"Failing {security.symbol}.")
+        return await super().get_pricing_raw_async(unix_from, unix_to, security, interval)
+
+class TestPriceEstimator(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(injection.container.instances, {'aggregate_provider': FailingProvider(local=True)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        calendar = exchange.calendar
+        self.times = calendar.get_timestamps(dates.unix() - 40*24*3600, dates.unix() - 38*24*3600, Interval.H1)[:3]
+
+    def test_estimate_many(self):
+        pairs = [(security, unix_time) for security in securities for unix_time in self.times]
+        for agg in [Aggregation.AVG, Aggregation.LAST, Aggregation.MAX]:
+            estimator = PriceEstimator(BarValues.C, Interval.M15, slice(0, 4), agg)
+            result = estimator.estimate_many([it[0] for it in pairs], [it[1] for it in pairs])
+            for (security, unix_time), estimate in zip(pairs, result):
+                if security.symbol == 'EST3':
+                    self.assertIsInstance(estimate, Exception)
+                    continue
+                assert not isinstance(estimate, Exception)
+                self.assertAlmostEqual(estimator.estimate(security, unix_time), estimate)
+
+    def test_price_at_many(self):
+        result = PriceEstimator.price_at_many(securities, [self.times[1]]*len(securities))
+        provider = injection.container.get('aggregate_provider')
+        for security, price in zip(securities, result):
+            if security.symbol == 'EST3':
+                self.assertIsInstance(price, Exception)
+                continue
+            self.assertEqual(provider.get_pricing(self.times[1]-24*3600, self.times[1], security, Interval.M5)[-1].c, price)
@@ -1,7 +1,7 @@
 from numpy import indices
 import torch
 from unittest import TestCase
-from trading.models.base.tensors import get_moving_average, get_normalized_by_largest, get_time_relativized, get_sampled
+from trading.models.base.tensors import check_tensors, get_moving_average, get_normalized_by_largest, get_time_relativized, get_sampled
 
 
 class TestUtils(TestCase):
@@ -78,3 +78,8 @@ class TestUtils(TestCase):
         self.assertEqual(4, result.sum().item())
         self.assertEqual(22, numbers.sum().item())
 
+    def test_check_tensors(self):
+        tensors = {'a': torch.ones(3, 2), 'b': torch.tensor([1., 0.])}
+        check_tensors(tensors)
+        self.assertRaises(Exception, lambda: check_tensors(tensors, allow_zeros=False))
+        self.assertRaises(Exception, lambda: check_tensors([torch.ones(2), torch.tensor([1., float('nan')])]))
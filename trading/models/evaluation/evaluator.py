@@ -1,24 +1,28 @@
 #1
 from __future__ import annotations
+import hashlib
 import logging
 import os
 import time
 import bisect
 import torch
-import matplotlib
 import random
-from tqdm import tqdm
+from functools import cached_property
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable, Any, Sequence, override
-import matplotlib.lines
-from matplotlib import pyplot as plt
-from matplotlib.gridspec import GridSpec
+from typing import TYPE_CHECKING, Callable, Any, Iterable, Iterator, Sequence, override
+from torch import Tensor
 
 from base import dates
 from base import text
+from base.db import sqlite_engine
+from base.key_value_storage import SqlKVStorage
+from base.key_series_storage import SqlKSStorage
 from base.types import ClassDict
 from base.serialization import Serializable, GenericSerializer
 from base import plotutils
+from base.reflection import lazy_import
 from trading.core.timing_config import TimingConfig
 from trading.core import Interval
 from trading.core.securities import Exchange, Security, SecurityType
@@ -26,7 +30,14 @@ from trading.models.base.manager import ModelManager
 from trading.providers.aggregate import AggregateProvider
 from trading.models.base.model_config import PriceEstimator, BaseModelConfig
 from trading.models.base.abstract_model import AbstractModel
+from trading.models.evaluation.output_cache import OutputCache
 from trading.models.generators.abstract_generator import AbstractGenerator
+if TYPE_CHECKING:
+    import matplotlib.lines
+    from matplotlib import pyplot as plt, gridspec
+else:
+    plt = lazy_import("matplotlib.pyplot")
+    gridspec = lazy_import("matplotlib.gridspec")
 logger = logging.getLogger()
 
 FOLDER = Path(__file__).parent / 'backtests'
@@ -45,6 +56,8 @@ class Selector(Serializable):
         self.top_count = top_count
     def insert(self, result: Result):
         bisect.insort_right(self.results, result, key=lambda it: -it.output)
+    def insert_many(self, results: Iterable[Result]):
+        for result in results: self.insert(result)
     def get_selected(self) -> Sequence[Result]:
         """
         Returns results sorted from best to worst.
@@ -103,6 +116,39 @@ class BacktestFrame(Serializable, ClassDict[float]):
         total_real_win = prev.total_real_win*real_win if prev else real_win
         return BacktestFrame(win, total_win, real_win, total_real_win)
 
+class BacktestSlot(Serializable):
+    """
+    The outcome of a single time slot of a backtest, independent of the other slots.
+    If nothing could be bought, the security is None and the error is set.
+    """
+    def __init__(
+        self,
+        unix_time: float,
+        security: Security|None = None,
+        output: float = 0,
+        data: dict|None = None,
+        buy_price: float = 1,
+        sell_price: float = 1,
+        error: str|None = None
+    ):
+        self.unix_time = unix_time
+        self.security = security
+        self.output = output
+        self.data = data or {}
+        self.buy_price = buy_price
+        self.sell_price = sell_price
+        self.error = error
+
+    @staticmethod
+    def fold(slots: Iterable[BacktestSlot], commission: float, prev: BacktestFrame|None = None) -> list[BacktestFrame]:
+        """The frames of the slots with a bought security, in the given order."""
+        result: list[BacktestFrame] = []
+        for slot in slots:
+            if slot.security is None: continue
+            prev = BacktestFrame.create(slot.buy_price, slot.sell_price, commission, prev)
+            result.append(prev)
+        return result
+
 class BacktestResult(Serializable):
     def __init__(
         self,
@@ -132,18 +178,170 @@ class BacktestResult(Serializable):
 """
 
 serializer = GenericSerializer()
+_FEATURE_SOURCE = 'evaluator'
+
+class BacktestJournal:
+    """
+    Records the slots of a backtest in a sqlite database as they complete, so that an interrupted backtest can be resumed.
+    The journal is bound to the parameters of the backtest, and opening it with different parameters raises an exception.
+    Thread and multiprocess safe.
+    """
+    _KEY = 'slots'
+    def __init__(self, path: Path, parameters: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        engine = sqlite_engine(path)
+        self.path = path
+        self.slots = SqlKSStorage[BacktestSlot](engine, 'slots', lambda it: it.unix_time)
+        stored = SqlKVStorage(engine, 'parameters').get_or_set('parameters', parameters, str)
+        if stored != parameters: raise Exception(f"The journal {path} belongs to a backtest with different parameters.")
+
+    def get(self) -> list[BacktestSlot]:
+        """The completed slots, sorted by time."""
+        return sorted(self.slots.get(BacktestJournal._KEY, float('-inf'), float('inf')), key=lambda it: it.unix_time)
+    def add(self, slot: BacktestSlot):
+        self.slots.set(BacktestJournal._KEY, [slot])
+
+class BacktestPlot:
+    """Plots the frames of a running backtest in interactive figures."""
+    def __init__(self):
+        plt.ion()
+        self.fig1, ax1 = plt.subplots(1,1)
+        self.fig2, ax2 = plt.subplots(1,1)
+        ax1.set_title('Daily gain')
+        ax2.set_title('Cumulative gain')
+        ax1.set_xlabel('Days')
+        ax2.set_xlabel('Days')
+        self.lines: dict[str, matplotlib.lines.Line2D] = {
+            'win': ax1.plot([], [], color='blue', label='Win', marker='o', markersize=2, linestyle='')[0],
+            'real_win': ax1.plot([], [], color='red', label='Real Win', marker='o', markersize=2, linestyle='')[0],
+            'total_win': ax2.plot([], [], color='blue', label='Total Win')[0],
+            'total_real_win': ax2.plot([], [], color='red', label='Total Real Win')[0],
+        }
+        ax1.legend()
+        ax2.legend()
+        self.history: list[BacktestFrame] = []
+        plotutils.refresh_interactive_figures(self.fig1, self.fig2)
+
+    def update(self, frame: BacktestFrame):
+        self.history.append(frame)
+        x = list(range(len(self.history)))
+        for key, line in self.lines.items():
+            line.set_data(x, [it[key] for it in self.history])
+            line.axes.relim()
+            line.axes.autoscale_view()
+        plotutils.refresh_interactive_figures(self.fig1, self.fig2)
+
+    def close(self, block: bool = True):
+        plt.ioff()
+        plt.show(block=block)
 
 class Evaluator:
-    def __init__(self, manager: ModelManager, generator: AbstractGenerator):
+    """
+    Args:
+        feature_cache: If true, the tensors extracted for historical times (e.g. in backtests) are stored and reused.
+        batch_size: The number of securities evaluated in a single forward pass.
+        workers: The number of threads generating examples concurrently. If 0, examples are generated in the calling thread.
+            Only safe if the storages used by the generator are thread safe (e.g. not the memory storages of local providers).
+        output_cache: If set, the outputs for historical times are read from the cache first, and the missing ones are stored.
+    """
+    def __init__(
+        self,
+        manager: ModelManager,
+        generator: AbstractGenerator,
+        feature_cache: bool = False,
+        batch_size: int = 64,
+        workers: int = 0,
+        output_cache: OutputCache|None = None
+    ):
         self.generator = generator
         self.manager = manager
+        self.feature_cache = feature_cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.output_cache = output_cache
 
-    def evaluate(self, security: Security, unix_time: float|None = None) -> float:
+    def _extract_tensors(self, security: Security, unix_time: float|None) -> dict[str, Tensor]:
+        """The extracted tensors of the security, with a batch dimension of 1."""
+        def read() -> dict[str, Tensor]:
+            return {key:value.unsqueeze(0).to(dtype=self.manager.dtype, device=self.manager.device) for key,value in self.generator.generate_example(security, unix_time or dates.unix(), with_output=False).items()}
+        if not self.feature_cache or unix_time is None:
+            return self.manager.model.extract_tensors(read(), with_output=False)
+        entry = int.from_bytes(hashlib.sha256(security.symbol.encode()).digest()[:8]) >> 1
+        tensors = self.manager.feature_cache.get(_FEATURE_SOURCE, security.exchange, unix_time, entry, read, with_output=False, device=self.manager.device)
+        return {key: value.to(device=self.manager.device) for key, value in tensors.items()}
+
+    def _try_extract_tensors(self, security: Security, unix_time: float|None) -> dict[str, Tensor]|Exception:
+        try:
+            return self._extract_tensors(security, unix_time)
+        except Exception as e:
+            return e
+
+    def _extract_batches(self, securities: list[Security], unix_time: float|None) -> Iterator[list[tuple[Security, dict[str, Tensor]|Exception]]]:
+        """
+        Yields the extracted tensors of consecutive batches of securities, or the exception that prevented the extraction.
+        The next batch is extracted concurrently while the current one is being evaluated.
+        """
+        batches = [securities[i:i+self.batch_size] for i in range(0, len(securities), self.batch_size)]
+        if not self.workers:
+            for batch in batches: yield [(it, self._try_extract_tensors(it, unix_time)) for it in batch]
+            return
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='evaluator') as executor:
+            pending: deque[list[tuple[Security, Future[dict[str, Tensor]|Exception]]]] = deque()
+            for batch in batches:
+                pending.append([(it, executor.submit(self._try_extract_tensors, it, unix_time)) for it in batch])
+                if len(pending) > 1:
+                    yield [(security, future.result()) for security, future in pending.popleft()]
+            while pending:
+                yield [(security, future.result()) for security, future in pending.popleft()]
+
+    def _predict(self, tensors: list[dict[str, Tensor]]) -> list[float]:
+        with torch.inference_mode():
+            batch = {key: torch.cat([it[key] for it in tensors], dim=0) for key in tensors[0].keys()}
+            return self.manager.model(batch).reshape(len(tensors), -1)[:,0].tolist()
+
+    def evaluate_many(self, securities: list[Security], unix_time: float|None = None) -> Iterator[list[tuple[Security, float|Exception]]]:
+        """
+        Evaluates the securities in batches, with one forward pass per batch, on unix_time or live (if None).
+        Yields the outputs of each batch, with the exception instead of the output for each security that failed.
+        If the forward pass of a batch fails, its securities are evaluated one at a time, so that a bad example only fails itself.
+        With an output cache, the cached outputs are yielded first, as a single batch,
+        and the outputs of the other securities are stored together once they are all evaluated (or the iteration stops).
+        """
+        if self.output_cache is None or unix_time is None:
+            yield from self._evaluate_batches(securities, unix_time)
+            return
+        model_hash = OutputCache.get_hash(self.manager.model)
+        cached = self.output_cache.get_many(model_hash, securities, unix_time)
+        if cached: yield [(it, cached[it]) for it in securities if it in cached]
+        outputs: dict[Security, float] = {}
+        try:
+            for batch in self._evaluate_batches([it for it in securities if it not in cached], unix_time):
+                outputs.update((security, output) for security, output in batch if not isinstance(output, Exception))
+                yield batch
+        finally:
+            self.output_cache.set_many(model_hash, unix_time, outputs)
+
+    def _evaluate_batches(self, securities: list[Security], unix_time: float|None) -> Iterator[list[tuple[Security, float|Exception]]]:
         self.manager.model.eval()
-        with torch.no_grad():
-            example = {key:value.to(dtype=self.manager.dtype, device=self.manager.device) for key,value in self.generator.generate_example(security, unix_time or dates.unix(), with_output=False).items()}
-            tensors = self.manager.model.extract_tensors(example, with_output=False)
-            return self.manager.model(tensors).squeeze().item()
+        for batch in self._extract_batches(securities, unix_time):
+            extracted = [(security, tensors) for security, tensors in batch if not isinstance(tensors, Exception)]
+            outputs: dict[Security, float|Exception] = {security: tensors for security, tensors in batch if isinstance(tensors, Exception)}
+            if extracted:
+                try:
+                    outputs.update(zip([it[0] for it in extracted], self._predict([it[1] for it in extracted])))
+                except Exception:
+                    logger.warning(f"Failed to evaluate a batch of {len(extracted)} securities. Evaluating one at a time.", exc_info=True)
+                    for security, tensors in extracted:
+                        try:
+                            outputs[security] = self._predict([tensors])[0]
+                        except Exception as e:
+                            outputs[security] = e
+            yield [(security, outputs[security]) for security, _ in batch]
+
+    def evaluate(self, security: Security, unix_time: float|None = None) -> float:
+        [(_, output)] = next(self.evaluate_many([security], unix_time))
+        if isinstance(output, Exception): raise output
+        return output
 
     def select(
         self,
@@ -155,22 +353,23 @@ class Evaluator:
     ) -> None:
         """
         Evaluate model results for all securities, on unix_time or live (if None).
-        On update is invoked with each new result.
+        Securities are evaluated in batches (see evaluate_many), and on update is invoked after each batch.
         """
         logger.info(f"Evaluating {len(securities)} securities for {dates.unix_to_datetime(unix_time, tz=dates.CET) if unix_time else 'live'}.")
         if isinstance(selector, RandomSelector) and selector.top_count >= len(securities):
             for security in securities: selector.insert(Result(security, 0))
             return
-        for security in tqdm(securities, leave=True, desc=f"Evaluating for {dates.unix_to_datetime(unix_time, tz=dates.CET) if unix_time else 'now'}"):
-            try:
-                output = self.evaluate(security, unix_time)
-                selector.insert(Result(security, output))
-                if on_update: on_update(selector)
-                if log: logger.info(f"Evaluated {security.symbol} with output {output}.")
-            except KeyboardInterrupt:
-                raise
-            except:
-                if log: logger.error(f"Failed to evaluate {security.symbol}.", exc_info=True)
+        from tqdm import tqdm
+        with tqdm(total=len(securities), leave=True, desc=f"Evaluating for {dates.unix_to_datetime(unix_time, tz=dates.CET) if unix_time else 'now'}") as progress:
+            for batch in self.evaluate_many(securities, unix_time):
+                results = [Result(security, output) for security, output in batch if not isinstance(output, Exception)]
+                selector.insert_many(results)
+                if results and on_update: on_update(selector)
+                if log:
+                    for security, output in batch:
+                        if isinstance(output, Exception): logger.error(f"Failed to evaluate {security.symbol}.", exc_info=output)
+                        else: logger.info(f"Evaluated {security.symbol} with output {output}.")
+                progress.update(len(batch))
         return
 
     def backtest(
@@ -181,74 +380,29 @@ class Evaluator:
         timing: TimingConfig,
         estimator: PriceEstimator,
         selector: Selector = Selector(),
-        commission: float = 0.0035
+        commission: float = 0.0035,
+        name: str|None = None,
+        plot: bool = True,
+        workers: int = 0
     ) -> BacktestResult:
         """
-        Returns total gain in percentages
+        Runs the backtest (see Backtest), and writes the result to the backtests folder, as {name}.json.
+        Args:
+            name: The name of the backtest. A backtest interrupted earlier is resumed by passing the same name.
+                Defaults to a new name based on the current time.
+            plot: If true, the frames are plotted as they complete, and the plot is shown (blocking) at the end.
+            workers: The number of processes running slots in parallel (see Backtest.run).
         """
-        securities = [it for it in exchange.securities() if it.type == SecurityType.STOCK]
+        name = name or f"backtest_t{int(dates.unix())}"
+        backtest = Backtest(self, unix_from, unix_to, exchange, timing, estimator, selector, commission, self.manager.backtests/f"{name}.db")
         logger.info(f"Backtesting on {exchange.name} from {exchange.calendar.unix_to_datetime(unix_from)} to {exchange.calendar.unix_to_datetime(unix_to)}")
-        unix_time = unix_from
-        history: list[BacktestFrame] = []
-        plt.ion()
-        fig1, ax1 = plt.subplots(1,1)
-        fig2, ax2 = plt.subplots(1,1)
-        ax1.set_title('Daily gain')
-        ax2.set_title('Cumulative gain')
-        ax1.set_xlabel('Days')
-        ax2.set_xlabel('Days')
-        mock = [1,2]
-        lines: dict[str, matplotlib.lines.Line2D] = {
-            'real': ax2.plot(mock, mock, color = 'blue', label = 'Total Win')[0],
-            'ideal': ax2.plot(mock, mock, color = 'red', label = 'Real Win')[0],
-        }
-        ax1.legend()
-        ax2.legend()
-        plotutils.refresh_interactive_figures(fig1, fig2)
-        
-        unix_time = timing.next(unix_time, Interval.M5, exchange)
-        while unix_time < unix_to:
-            try:
-                selector.clear()
-                self.select(securities, unix_time=unix_time, log=False, selector=selector)
-                
-                results = selector.get_selected()
-                result: Result|None = None
-                sell_price: float = 1.0
-                buy_price: float = 1.0
-                for it in results:
-                    try:
-                        sell_price = estimator.estimate(it.security, unix_time)
-                        buy_price = AggregateProvider.instance.get_pricing(unix_time-24*3600, unix_time, it.security, Interval.M5)[-1].c
-                        result = it
-                        break
-                    except:
-                        logger.warning(f"Failed to estimate sell price for {it.security.symbol}", exc_info=True)
-                if not result: raise Exception(f"Failed to estimate sell price for all selected entries.")
-
-                history.append(BacktestFrame.create(buy_price, sell_price, commission, history[-1] if history else None))
-                logger.info(f"Buying {result.security.symbol} at {dates.unix_to_datetime(unix_time,tz=dates.CET)}.")
-                logger.info(f"Output: {result.output}. Data: {result.data}.")
-                logger.info(f"REAL WIN: {history[-1].win}")
-
-                x = list(range(len(history)))
-                for key in lines.keys():
-                    lines[key].set_data(x, [it[key] for it in history])
-                plotutils.refresh_interactive_figures(fig1, fig2)
-            except KeyboardInterrupt:
-                raise
-            except:
-                logger.error(f"Failed to evaluate at {dates.unix_to_datetime(unix_time,tz=dates.CET)}.", exc_info=True)
-            unix_time = timing.next(unix_time, Interval.M5, exchange)
-            
-        plt.ioff()
-        selector.clear()
-        model = f"{self.manager.model.get_name()}\n{text.tab(serializer.serialize(self.manager.model.config, indent=2))}"
-        backtest_result = BacktestResult(history, unix_from, unix_to, selector, estimator, commission, model)
-        path = self.manager.backtests / f"backtest_t{int(dates.unix())}.json"
-        path.write_text(serializer.serialize(backtest_result))
-        plt.show(block = True)
-        return backtest_result
+        figure = BacktestPlot() if plot else None
+        for frame in backtest.run(workers=workers):
+            if figure: figure.update(frame)
+        result = backtest.result()
+        (self.manager.backtests/f"{name}.json").write_text(serializer.serialize(result))
+        if figure: figure.close()
+        return result
 
     @staticmethod
     def show_backtest_file(file: Path, block: bool = True):
@@ -256,7 +410,7 @@ class Evaluator:
         Evaluator.show_backtest(data, block=block)
 
     def show_backtests(self, unix_from: float, unix_to: float):
-        backtests = [serializer.deserialize((self.manager.backtests/file).read_text(), BacktestResult) for file in os.listdir(self.manager.backtests)]
+        backtests = [serializer.deserialize(file.read_text(), BacktestResult) for file in self.manager.backtests.glob('*.json')]
         backtests = [it for it in backtests if it.unix_time > unix_from and it.unix_time <= unix_to]
         backtests = sorted(backtests, key=lambda it: it.unix_time)
         for backtest in backtests:
@@ -266,7 +420,7 @@ class Evaluator:
     def show_backtest(data: BacktestResult, block: bool = True):
         history = data.history
         fig = plt.figure(figsize=(6,4))
-        gs = GridSpec(4, 2, figure=fig)
+        gs = gridspec.GridSpec(4, 2, figure=fig)
         ax_title = fig.add_subplot(gs[0,:])
         ax_left = fig.add_subplot(gs[1:,0])
         ax_right = fig.add_subplot(gs[1:,1])
@@ -289,3 +443,151 @@ class Evaluator:
 
         plt.show(block=block)
         return
+
+_worker_backtest: Backtest|None = None
+def _init_worker(backtest: Backtest, threads: int):
+    global _worker_backtest
+    torch.set_num_threads(threads)
+    backtest.evaluator.manager.model.eval()
+    _worker_backtest = backtest
+def _run_slot(unix_time: float) -> BacktestSlot:
+    assert _worker_backtest is not None
+    return _worker_backtest.run_slot(unix_time)
+
+class Backtest:
+    """
+    Headless backtest. In each time slot matching the timing config, the evaluator selects the securities,
+    and the first selected security with an estimable sell price is bought at the last M5 close.
+    Completed slots are recorded in the journal, and skipped when the backtest is resumed.
+    Failed slots are recorded too, but run again when resumed, since the failure may be transient (e.g. a provider timeout).
+    Args:
+        journal: The path of the journal (sqlite database).
+        securities: The evaluated securities. Defaults to the stocks of the exchange.
+    """
+    def __init__(
+        self,
+        evaluator: Evaluator,
+        unix_from: float,
+        unix_to: float,
+        exchange: Exchange,
+        timing: TimingConfig,
+        estimator: PriceEstimator,
+        selector: Selector,
+        commission: float,
+        journal: Path,
+        securities: list[Security]|None = None
+    ):
+        self.evaluator = evaluator
+        self.unix_from = unix_from
+        self.unix_to = unix_to
+        self.exchange = exchange
+        self.timing = timing
+        self.estimator = estimator
+        self.selector = selector
+        self.commission = commission
+        self._securities = securities
+        selector.clear()
+        self.journal = BacktestJournal(journal, serializer.serialize({
+            'unix_from': unix_from,
+            'unix_to': unix_to,
+            'exchange': exchange.mic,
+            'estimator': estimator,
+            'selector': selector,
+            'commission': commission,
+            'timing': timing,
+            'securities': [f"{it.exchange.mic}:{it.symbol}" for it in securities] if securities is not None else None,
+            # including the weights, so that a retrained model does not resume the slots of the previous one
+            'model': OutputCache.get_hash(evaluator.manager.model)
+        }))
+
+    def __getstate__(self) -> dict:
+        # the journal is only written by the process running the backtest
+        return {**self.__dict__, 'journal': None}
+
+    @cached_property
+    def securities(self) -> list[Security]:
+        return self._securities if self._securities is not None else [it for it in self.exchange.securities() if it.type == SecurityType.STOCK]
+
+    def get_times(self) -> list[float]:
+        """The times of all slots."""
+        result: list[float] = []
+        unix_time = self.timing.next(self.unix_from, Interval.M5, self.exchange)
+        while unix_time < self.unix_to:
+            result.append(unix_time)
+            unix_time = self.timing.next(unix_time, Interval.M5, self.exchange)
+        return result
+
+    def run_slot(self, unix_time: float) -> BacktestSlot:
+        try:
+            self.selector.clear()
+            self.evaluator.select(self.securities, unix_time=unix_time, log=False, selector=self.selector)
+            selected = self.selector.get_selected()
+            # prices are fetched for chunks of the selection, and the first result with both prices is bought
+            chunk = max(1, self.selector.top_count)
+            for start in range(0, len(selected), chunk):
+                results = selected[start:start+chunk]
+                securities = [it.security for it in results]
+                sell_prices = self.estimator.estimate_many(securities, [unix_time]*len(results))
+                buy_prices = PriceEstimator.price_at_many(securities, [unix_time]*len(results))
+                for it, sell_price, buy_price in zip(results, sell_prices, buy_prices):
+                    if isinstance(sell_price, Exception) or isinstance(buy_price, Exception):
+                        logger.warning(f"Failed to estimate sell price for {it.security.symbol}", exc_info=sell_price if isinstance(sell_price, Exception) else buy_price)
+                        continue
+                    logger.info(f"Buying {it.security.symbol} at {dates.unix_to_datetime(unix_time,tz=dates.CET)}. Output: {it.output}. Data: {it.data}. Win: {sell_price/buy_price}.")
+                    return BacktestSlot(unix_time, it.security, it.output, it.data, buy_price, sell_price)
+            raise Exception(f"Failed to estimate sell price for all selected entries.")
+        except Exception as e:
+            logger.error(f"Failed to evaluate at {dates.unix_to_datetime(unix_time,tz=dates.CET)}.", exc_info=True)
+            return BacktestSlot(unix_time, error=str(e))
+        finally:
+            self.selector.clear()
+
+    def _run_slots(self, times: list[float], workers: int, max_pending: int|None) -> Iterator[BacktestSlot]:
+        """Runs the slots, yielding them in the given order."""
+        if not workers:
+            for unix_time in times: yield self.run_slot(unix_time)
+            return
+        self.securities # resolved once, before the backtest is sent to the workers
+        max_pending = max_pending or 2*workers
+        threads = max(1, (os.cpu_count() or 1)//workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=torch.multiprocessing.get_context(), initializer=_init_worker, initargs=(self, threads)) as executor:
+            pending: deque[Future[BacktestSlot]] = deque()
+            for unix_time in times:
+                pending.append(executor.submit(_run_slot, unix_time))
+                if len(pending) >= max_pending: yield pending.popleft().result()
+            while pending: yield pending.popleft().result()
+
+    def run(self, workers: int = 0, max_pending: int|None = None) -> Iterator[BacktestFrame]:
+        """
+        Runs the slots in time order, yielding the frame of each slot with a bought security as it completes.
+        Slots completed earlier are read from the journal instead, and slots that failed earlier are run again.
+        Args:
+            workers: The number of processes running slots in parallel. If 0, slots are run in the calling process.
+                Each worker gets a copy of the backtest (with the model) once, and runs slots with its own selector.
+                Slots are journaled and folded in time order, so the frames are the same regardless of the number of workers.
+                Not supported with the feature cache of the evaluator, which can only be filled by a single process.
+            max_pending: The maximum number of slots submitted ahead of the fold. Defaults to 2 per worker.
+        """
+        if workers and self.evaluator.feature_cache:
+            raise Exception(f"The feature cache of the evaluator can not be filled by worker processes.")
+        done = {it.unix_time: it for it in self.journal.get() if it.error is None}
+        times = self.get_times()
+        remaining = self._run_slots([it for it in times if it not in done], workers, max_pending)
+        prev: BacktestFrame|None = None
+        try:
+            for unix_time in times:
+                slot = done.get(unix_time)
+                if slot is None:
+                    slot = next(remaining)
+                    self.journal.add(slot)
+                if slot.security is None: continue
+                prev = BacktestFrame.create(slot.buy_price, slot.sell_price, self.commission, prev)
+                yield prev
+        finally:
+            remaining.close()
+
+    def result(self) -> BacktestResult:
+        """The result of the completed slots."""
+        model = f"{self.evaluator.manager.model.get_name()}\n{text.tab(serializer.serialize(self.evaluator.manager.model.config, indent=2))}"
+        history = BacktestSlot.fold(self.journal.get(), self.commission)
+        return BacktestResult(history, self.unix_from, self.unix_to, self.selector, self.estimator, self.commission, model)
@@ -0,0 +1,67 @@
+#1
+import hashlib
+import math
+from functools import cached_property
+import injection
+from base.key_series_storage import KeySeriesStorage
+from base.serialization import Serializable
+from trading.core.securities import Security
+from trading.models.base.abstract_model import AbstractModel
+from trading.models.base.feature_cache import FeatureCache
+
+class OutputFrame(Serializable):
+    """The outputs of a model at a single time, keyed by the exchange mic and symbol of the security."""
+    def __init__(self, unix_time: float, outputs: dict[str, float]):
+        self.unix_time = unix_time
+        self.outputs = outputs
+
+class OutputCache:
+    """
+    Stores the model outputs of securities at historical times, so that e.g. backtests sweeping
+    selectors, estimators or commissions evaluate the model once.
+    The outputs of each time are stored as a single frame in a key series storage, under the model hash,
+    which covers the model class, config and parameters, so a retrained model never reads stale outputs.
+    Failed evaluations are not stored.
+    Args:
+        name: The name of the storage (see injection.ks_storage).
+        memory: If true, the outputs are kept in memory only.
+    """
+    def __init__(self, name: str = 'model_outputs', memory: bool = False):
+        self.name = name
+        self.memory = memory
+
+    def __getstate__(self) -> dict:
+        # the storage is reopened by name, e.g. in worker processes
+        return {'name': self.name, 'memory': self.memory}
+
+    @cached_property
+    def storage(self) -> KeySeriesStorage[OutputFrame]:
+        return injection.ks_storage(self.name, lambda it: it.unix_time, memory=self.memory)
+
+    @staticmethod
+    def get_hash(model: AbstractModel) -> str:
+        result = hashlib.sha256(FeatureCache.get_hash(model).encode())
+        for key, value in model.state_dict().items():
+            result.update(key.encode())
+            result.update(value.detach().cpu().contiguous().numpy().tobytes())
+        return result.hexdigest()[:16]
+
+    @staticmethod
+    def _key(security: Security) -> str: return f"{security.exchange.mic}:{security.symbol}"
+
+    def _get_frame(self, model_hash: str, unix_time: float) -> OutputFrame|None:
+        frames = self.storage.get(model_hash, math.nextafter(unix_time, -math.inf), unix_time)
+        return frames[0] if frames else None
+
+    def get_many(self, model_hash: str, securities: list[Security], unix_time: float) -> dict[Security, float]:
+        """The stored outputs of the securities, omitting the missing ones."""
+        frame = self._get_frame(model_hash, unix_time)
+        if frame is None: return {}
+        return {it: frame.outputs[OutputCache._key(it)] for it in securities if OutputCache._key(it) in frame.outputs}
+
+    def set_many(self, model_hash: str, unix_time: float, outputs: dict[Security, float]):
+        """Adds the outputs to those stored for the time."""
+        if not outputs: return
+        frame = self._get_frame(model_hash, unix_time) or OutputFrame(unix_time, {})
+        frame.outputs.update({OutputCache._key(security): output for security, output in outputs.items()})
+        self.storage.set(model_hash, [frame])
@@ -3,19 +3,19 @@ from collections import defaultdict
 from functools import cached_property
 import math
 import time
+import numpy as np
 from bisect import insort, insort_right
 from typing import Iterable, Sequence, override
-from base.algos import binary_search, binsert, interpolate
+from base.algos import binary_search, binsert
 from base.caching import KeySeriesStorage, KeyValueStorage, cached_series
 from base.key_series_storage import MemoryKSStorage
 from base.reflection import transient
 from base.tests.common import MemoryKVStorage
 from base.types import Cloneable, Equatable, Serializable, json_type
-from base.utils import get_or_set
 from base import dates
 from trading.core import Interval
 from trading.core.news import Security
-from trading.core.pricing import PricingProvider
+from trading.core.pricing import PriceIndex, PricingProvider
 from trading.providers.aggregate import AggregateProvider
 
 
@@ -35,6 +35,7 @@ class SecurityTransaction(Transaction):
     
 
 class Position(Equatable, Cloneable):
+    """Positions are shared between portfolio states, so they must not be modified once in a state."""
     def __init__(self, security: Security, amount: int, price: float):
         self.security = security
         self.amount = amount
@@ -75,9 +76,9 @@ class Portfolio(Serializable):
     action_history: list[Action] # Primary source of truth
     state_history: list[State] # Calculated based on actions
     ideal_state_history: list[State]
-    def __init__(self, *, initial_state: State|None = None, actions: list[Action] = [], provider: PricingProvider = AggregateProvider.instance):
+    def __init__(self, *, initial_state: State|None = None, actions: list[Action] = [], provider: PricingProvider|None = None):
         """The initial state, if any, should precede any actions."""
-        self.provider = provider
+        self.provider = provider or AggregateProvider.instance
         self.action_history = actions[:]
         self.state_history = [initial_state or Portfolio.State(0, 0, [])]
         self.ideal_state_history = [initial_state or Portfolio.State(0, 0, [])]
@@ -91,6 +92,14 @@ class Portfolio(Serializable):
     def ideal_state(self) -> Portfolio.State: return self.ideal_state_history[-1]
 
     def action(self, action: Portfolio.Action) -> Portfolio:
+        if not self.action_history or action.unix_time > self.action_history[-1].unix_time:
+            # appended in time order, so only the new states are computed
+            if action.unix_time <= self.state_history[0].unix_time: raise Exception(f"Can't overwrite initial state.")
+            self.action_history.append(action)
+            self.state_history.extend(Portfolio._get_states(self.state, [action], include_fees=True))
+            self.ideal_state_history.extend(Portfolio._get_states(self.ideal_state, [action], include_fees=False))
+            self._invalidate_equity(action.unix_time)
+            return self
         i = binary_search(self.action_history, action.unix_time, lambda it: it.unix_time, side='GE')
         if i < len(self.action_history) and self.action_history[i].unix_time == action.unix_time:
             self.action_history[i] = self.action_history[i].merge(action)
@@ -113,33 +122,43 @@ class Portfolio(Serializable):
         actions = self.action_history[action_index:]
         self.state_history[state_index:] = Portfolio._get_states(self.state_history[state_index-1], actions, include_fees=True)
         self.ideal_state_history[ideal_state_index:] = Portfolio._get_states(self.ideal_state_history[ideal_state_index-1], actions, include_fees=False)
-        
-        #invalidate equity
-        for key in self.equity_ks_storage.keys():
-            self.equity_ks_storage.delete(key, unix_time-1, dates.unix())
+        self._invalidate_equity(unix_time)
+
+    def _invalidate_equity(self, unix_time: float):
+        """Invalidates the equity at and after unix_time, for the keys with equity computed that far."""
+        start = math.nextafter(unix_time, -math.inf)
+        spans = [self.equity_kv_storage.get(key, list[tuple[float,float]]) for key in self.equity_kv_storage.keys()]
+        if not any(it and it[-1][1] > start for it in spans): return
+        Portfolio._equity_history.invalidate_all(self, start, math.inf)
+        for key in list(self.equity_ks_storage.keys()): self.equity_ks_storage.delete(key, start, math.inf)
 
     @staticmethod
     def _get_states(state: State, actions: Iterable[Action], *, include_fees: bool) -> Iterable[State]:
+        """
+        Positions are copied on write, so the positions unchanged by an action are shared with the previous state.
+        """
         cash = state.cash
-        positions = {it.security: it.clone() for it in state.positions}
+        positions = {it.security: it for it in state.positions}
         for action in actions:
             if not include_fees and not action.transactions: continue
             if include_fees: cash -= sum(it.fees for it in action.transactions)
             for transaction in action.transactions:
                 if not isinstance(transaction, SecurityTransaction): continue
-                position = get_or_set(positions, transaction.security, lambda security: Position(security, 0, 0))
-                if position.amount * transaction.amount > 0:
+                position = positions.get(transaction.security)
+                amount, price = (position.amount, position.price) if position else (0, 0)
+                if amount * transaction.amount > 0:
                     # Adding to a position, so get the new position price average
-                    total_amount = position.amount + transaction.amount
-                    position.price = position.amount/total_amount*position.price + transaction.amount/total_amount*transaction.price
-                    position.amount = total_amount
+                    total_amount = amount + transaction.amount
+                    price = amount/total_amount*price + transaction.amount/total_amount*transaction.price
+                    amount = total_amount
                 else:
-                    if abs(position.amount) < abs(transaction.amount) or position.amount == 0:
-                        position.price = transaction.price
-                    position.amount += transaction.amount
+                    if abs(amount) < abs(transaction.amount) or amount == 0:
+                        price = transaction.price
+                    amount += transaction.amount
+                positions[transaction.security] = Position(transaction.security, amount, price)
                 cash -= transaction.amount*transaction.price
             
-            yield Portfolio.State(action.unix_time, cash, [it.clone() for it in positions.values() if it.amount])
+            yield Portfolio.State(action.unix_time, cash, [it for it in positions.values() if it.amount])
     
     def equity_history(self, unix_from: float, unix_to: float|None = None, interval: Interval = Interval.H1) -> Sequence[EquityFrame]:
         return self._equity_history(unix_from, unix_to or dates.unix(), interval, False)
@@ -157,12 +176,24 @@ class Portfolio(Serializable):
         return list(self._get_equity(self.ideal_state_history if ideal else self.state_history, unix_from, unix_to, interval))
 
     def _get_equity(self, states: Sequence[State], unix_from: float, unix_to: float, interval: Interval) -> Iterable[EquityFrame]:
+        """
+        Computes the whole equity curve with array operations.
+        The series of the securities held within the range are loaded once (PriceIndex), instead of fetching each price.
+        """
         if not states: return []
         unix_from = unix_from - unix_from % interval.time() + interval.time()
-        times = [unix_from+i*interval.time() for i in range(math.floor((unix_to-unix_from)/interval.time())+1)]
-        states = interpolate([it.unix_time for it in states], states, times, 'stair')
-        for unix_time, state in zip(times, states):
-            yield Portfolio.EquityFrame(unix_time, state.cash + sum(self.provider.get_pricing_at(unix_time, it.security)*it.amount for it in state.positions))
+        times = np.array([unix_from+i*interval.time() for i in range(math.floor((unix_to-unix_from)/interval.time())+1)])
+        if not len(times): return []
+        # the state at each time (stair interpolation)
+        indices = np.maximum(np.searchsorted([it.unix_time for it in states], times, side='right') - 1, 0)
+        equity = np.array([it.cash for it in states], dtype=np.float64)[indices]
+        securities = list({position.security: None for i in np.unique(indices) for position in states[i].positions})
+        prices = PriceIndex(self.provider).load(securities, float(times[0]), float(times[-1]))
+        for security in securities:
+            amounts = np.array([sum(it.amount for it in state.positions if it.security == security) for state in states], dtype=np.float64)[indices]
+            held = amounts != 0
+            equity[held] += prices.prices_at(security, times[held])*amounts[held]
+        return [Portfolio.EquityFrame(float(unix_time), float(value)) for unix_time, value in zip(times, equity)]
 
     @override
     def to_json(self) -> json_type:
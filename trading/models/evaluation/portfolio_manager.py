@@ -1,26 +1,107 @@
 import asyncio
-from typing import Iterable
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Iterable
 import logging
 from base import dates
+from base.stats import LatencyStats
+from trading.core import Interval
 from trading.core.pricing import PricingProvider
 from trading.core.securities import Security
+from trading.core.timing_config import worktime_spots
 from trading.models.evaluation.portfolio import Portfolio
 from trading.providers.aggregate import AggregateProvider
 
 logger = logging.getLogger(__name__)
 
 class PortfolioManager:
-    def __init__(self, portfolio: Portfolio|None = None):
+    """
+    Args:
+        provider: The provider refreshed by the live loop. Defaults to the provider of the portfolio.
+    """
+    STAGES = ['lag', 'refresh', 'suggest', 'action']
+    def __init__(self, portfolio: Portfolio|None = None, provider: PricingProvider|None = None):
         self.portfolio = portfolio or Portfolio()
+        self.provider = provider or self.portfolio.provider
+        self.stats = {stage: LatencyStats(prior_latency=0) for stage in PortfolioManager.STAGES}
 
     async def run_live(self, securities: Iterable[Security], interval: float):
+        """
+        Suggests and executes actions every interval seconds, until cancelled.
+        The ticks follow a fixed-rate clock, so the time spent evaluating does not delay the following ticks,
+        and the ticks missed during a slow evaluation are skipped rather than run back to back.
+        At each tick, the data of all securities is refreshed in the background (see refresh), without delaying the evaluation,
+        and a refresh still running from a previous tick is not restarted.
+        The evaluation (suggest) runs in a worker thread, and the suggested actions are executed through a queue.
+        Each evaluation waits for the previous actions to be executed, so it always sees the current portfolio state.
+        The latency of each stage is kept in stats:
+            lag: The delay of the tick after its scheduled time.
+            refresh: The duration of the data refresh.
+            suggest: The duration of the evaluation.
+            action: The time from the suggestion to the execution of the action.
+        """
         securities = set(securities)
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggest")
+        actions: asyncio.Queue[tuple[float, Portfolio.Action]] = asyncio.Queue()
+        executing = asyncio.create_task(self._execute_actions(actions))
+        refreshing: asyncio.Task|None = None
+        try:
+            async for unix_time in self._clock(interval):
+                if refreshing is None or refreshing.done():
+                    refreshing = asyncio.create_task(self._refresh(securities, unix_time))
+                else: logger.warning(f"Refresh still running at {dates.unix_to_str(unix_time)}.")
+                await actions.join()
+                action = await self._timed('suggest', loop.run_in_executor(executor, self.suggest, securities))
+                if action: actions.put_nowait((time.perf_counter(), action))
+                logger.debug(f"Live latencies: {', '.join(f'{stage}={stats.latency:.3f}s' for stage, stats in self.stats.items())}.")
+        finally:
+            executing.cancel()
+            if refreshing: refreshing.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _clock(self, interval: float) -> AsyncIterator[float]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = 0
         while True:
-            action = self.suggest(securities)
-            if action:
+            due = start + tick*interval
+            if due > loop.time(): await asyncio.sleep(due - loop.time())
+            self.stats['lag'].record(max(0, loop.time() - due), True)
+            yield dates.unix()
+            tick = max(tick + 1, math.ceil((loop.time() - start)/interval))
+
+    async def _timed[T](self, stage: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            result = await awaitable
+        except:
+            self.stats[stage].record(time.perf_counter() - start, False)
+            raise
+        self.stats[stage].record(time.perf_counter() - start, True)
+        return result
+
+    async def _refresh(self, securities: set[Security], unix_time: float):
+        try:
+            await self._timed('refresh', self.refresh(securities, unix_time))
+        except Exception:
+            logger.error(f"Failed to refresh the data at {dates.unix_to_str(unix_time)}.", exc_info=True)
+
+    async def _execute_actions(self, actions: asyncio.Queue[tuple[float, Portfolio.Action]]):
+        while True:
+            suggested, action = await actions.get()
+            try:
+                logger.info(f"Executing: {action}")
                 self.portfolio.action(action)
-            await asyncio.sleep(interval)
-            
+                self.stats['action'].record(time.perf_counter() - suggested, True)
+                logger.info(f"State {self.portfolio.state}")
+            except Exception:
+                self.stats['action'].record(time.perf_counter() - suggested, False)
+                logger.error(f"Failed to execute {action}.", exc_info=True)
+            finally:
+                actions.task_done()
+
     def run_historical(
         self,
         securities: Iterable[Security],
@@ -33,15 +114,20 @@ class PortfolioManager:
         securities = set(securities)
 
         assert self.portfolio.state.unix_time < unix_start
-        unix_time = unix_start
-        while unix_time < unix_end:
-            tradable = {it for it in securities if it.exchange.calendar.is_worktime(unix_time)}
+        # only the steps within the work time of some exchange, with all securities tradable at once
+        for unix_time, tradable in worktime_spots(securities, interval, unix_start, unix_end):
             action = self.suggest(tradable, unix_time)
             if action:
                 logger.info(f"Executing: {action}")
                 self.portfolio.action(action)
                 logger.info(f"State {self.portfolio.state}")
-            unix_time += interval
+
+    async def refresh(self, securities: set[Security], unix_time: float):
+        """
+        Refreshes the data suggest reads in the live loop, for all securities concurrently.
+        By default, fetches the minute pricing of the last day.
+        """
+        await self.provider.get_pricing_many_async(unix_time - 24*3600, unix_time, securities, Interval.M1)
 
     #region Abstract
     def suggest(self, securities: set[Security], unix_time: float|None=None) -> Portfolio.Action|None:
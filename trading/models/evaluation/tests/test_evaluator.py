@@ -0,0 +1,210 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import override
+from unittest.mock import patch
+import torch
+from torch import Tensor
+import injection
+from base import dates
+from trading.core import Interval
+from trading.core.securities import Exchange, Security, SecurityType
+from trading.core.timing_config import BasicTimingConfig
+from trading.providers.nasdaq import Nasdaq
+from trading.providers.synthetic import SyntheticPricingProvider
+from trading.models.base.abstract_model import AbstractModel
+from trading.models.base.model_config import Aggregation, BarValues, PriceEstimator
+from trading.models.generators.abstract_generator import AbstractGenerator
+from trading.models.generators.tests.test_abstract_generator import MockExchange
+from trading.models.evaluation.evaluator import Backtest, BacktestFrame, BacktestSlot, Evaluator, RandomSelector, Selector
+from trading.models.evaluation.output_cache import OutputCache
+
+securities = [Security(f"EVAL{i}", f"Evaluator Test {i}", SecurityType.STOCK, Nasdaq.instance) for i in range(10)]
+
+class MockModel(AbstractModel):
+    def __init__(self):
+        super().__init__(None) # type: ignore
+        self.norm = torch.nn.BatchNorm1d(num_features=1)
+        self.passes: list[int] = []
+    @override
+    def extract_tensors(self, example: dict[str, Tensor], with_output: bool = False) -> dict[str, Tensor]:
+        return {'data': example['data'][:,-3:]}
+    @override
+    def predict(self, example: dict[str, Tensor]) -> Tensor:
+        data = example['data']
+        self.passes.append(data.shape[0])
+        if (data < 0).any(): raise Exception(f"Negative input.")
+        return self.norm(data.mean(dim=1, keepdim=True))
+
+class MockGenerator(AbstractGenerator):
+    def __init__(self, fail: set[str] = set(), negative: set[str] = set()):
+        self.fail = fail
+        self.negative = negative
+    @override
+    def get_time_frame(self, it: Security|Exchange) -> tuple[float, float]: raise NotImplementedError()
+    @override
+    def get_folder(self) -> Path: raise NotImplementedError()
+    @override
+    def get_interval(self) -> Interval: return Interval.H1
+    @override
+    def get_batch_size(self) -> int: return 4
+    @override
+    def generate_example(self, security: Security, end_time: float, with_output: bool = True) -> dict[str, Tensor]:
+        if security.symbol in self.fail: raise Exception(f"Failing {security.symbol}.")
+        value = float(security.symbol[4:])
+        return {'data': torch.tensor([100, value, value, value], dtype=torch.float64) * (-1 if security.symbol in self.negative else 1)}
+
+class MockManager:
+    def __init__(self):
+        self.model = MockModel()
+        self.dtype = torch.float32
+        self.device = torch.device('cpu')
+
+class TestEvaluator(unittest.TestCase):
+    def _evaluator(self, generator: MockGenerator, **kwargs) -> Evaluator:
+        return Evaluator(MockManager(), generator, **kwargs) # type: ignore
+
+    def test_evaluate_many(self):
+        for workers in [0, 3]:
+            evaluator = self._evaluator(MockGenerator(fail={'EVAL2'}, negative={'EVAL7'}), batch_size=4, workers=workers)
+            batches = list(evaluator.evaluate_many(securities, unix_time=0))
+            self.assertEqual([[it[0] for it in batch] for batch in batches], [securities[0:4], securities[4:8], securities[8:10]])
+            outputs = dict(it for batch in batches for it in batch)
+            self.assertIsInstance(outputs[securities[2]], Exception)
+            self.assertIsInstance(outputs[securities[7]], Exception)
+            for i in [0, 1, 3, 4, 5, 6, 8, 9]:
+                self.assertAlmostEqual(i, outputs[securities[i]], places=4)
+            # one pass for the first batch, a failed pass and 3 single passes for the second, one pass for the last
+            self.assertEqual([3, 4, 1, 1, 1, 1, 2], evaluator.manager.model.passes)
+
+    def test_evaluate(self):
+        evaluator = self._evaluator(MockGenerator(fail={'EVAL2'}))
+        self.assertAlmostEqual(5, evaluator.evaluate(securities[5], unix_time=0), places=4)
+        with self.assertRaises(Exception):
+            evaluator.evaluate(securities[2], unix_time=0)
+
+    def test_select(self):
+        evaluator = self._evaluator(MockGenerator(fail={'EVAL2'}), batch_size=3)
+        selector = Selector()
+        updates: list[int] = []
+        evaluator.select(securities, unix_time=0, selector=selector, on_update=lambda it: updates.append(len(it.results)), log=False)
+        self.assertEqual([9, 8, 7, 6, 5, 4, 3, 1, 0], [round(it.output) for it in selector.get_selected()])
+        self.assertEqual([2, 5, 8, 9], updates)
+
+    def test_output_cache(self):
+        cache = OutputCache(memory=True)
+        evaluator = self._evaluator(MockGenerator(fail={'EVAL2'}), batch_size=4, output_cache=cache)
+        model = evaluator.manager.model
+        first = [it for batch in evaluator.evaluate_many(securities, unix_time=100) for it in batch]
+        self.assertEqual([3, 4, 2], model.passes)
+        model.passes.clear()
+        for selector in [Selector(), RandomSelector(3)]:
+            evaluator.select(securities, unix_time=100, selector=selector, log=False)
+            self.assertEqual(9, len(selector.results))
+        self.assertEqual([], model.passes)
+        second = [it for batch in evaluator.evaluate_many(securities, unix_time=100) for it in batch]
+        self.assertEqual({it for it in first if not isinstance(it[1], Exception)}, {it for it in second if not isinstance(it[1], Exception)})
+        self.assertEqual(securities[2], second[-1][0])
+        self.assertIsInstance(second[-1][1], Exception)
+        # a different time or model is evaluated again
+        evaluator.evaluate(securities[0], unix_time=200)
+        self.assertEqual([1], model.passes)
+        with torch.no_grad(): model.norm.weight.fill_(2)
+        self.assertAlmostEqual(8, evaluator.evaluate(securities[4], unix_time=100), places=4)
+        self.assertEqual([1, 1], model.passes)
+
+def _values(frames: list[BacktestFrame]) -> list[tuple[float, ...]]:
+    return [(it.win, it.total_win, it.real_win, it.total_real_win) for it in frames]
+
+class TestBacktest(unittest.TestCase):
+    securities = [Security(f"EVAL{i}", f"Backtest Test {i}", SecurityType.STOCK, MockExchange.instance) for i in range(4)]
+    estimator = PriceEstimator(BarValues.C, Interval.H1, slice(0, 2), Aggregation.LAST)
+    timing = BasicTimingConfig.Builder().at(hour=11, minute=0).build()
+    def setUp(self):
+        for patcher in [
+            patch.dict(injection.container.instances, {'aggregate_provider': SyntheticPricingProvider(local=True)}),
+            patch.dict(Exchange._get_index('mic'), {'XGEN': MockExchange.instance})
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.unix_to = dates.unix() - 30*24*3600
+        self.unix_from = self.unix_to - 10*24*3600
+
+    def _backtest(self, journal: Path, fail: set[str] = set(), commission: float = 0.0035, feature_cache: bool = False) -> Backtest:
+        evaluator = Evaluator(MockManager(), MockGenerator(fail=fail), feature_cache=feature_cache, workers=0) # type: ignore
+        return Backtest(evaluator, self.unix_from, self.unix_to, MockExchange.instance, self.timing, self.estimator, Selector(), commission, journal, securities=self.securities)
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as folder:
+            journal = Path(folder)/'backtest.db'
+            backtest = self._backtest(journal, fail={'EVAL3'})
+            times = backtest.get_times()
+            self.assertGreater(len(times), 4)
+            frames = iter(backtest.run())
+            first = [next(frames) for _ in range(3)]
+            frames.close()
+            slots = backtest.journal.get()
+            self.assertEqual(times[:3], [it.unix_time for it in slots])
+            self.assertTrue(all(it.security is self.securities[2] for it in slots))
+
+            resumed = self._backtest(journal, fail={'EVAL3'})
+            with patch.object(Backtest, 'run_slot', autospec=True, side_effect=Backtest.run_slot) as run_slot:
+                frames = list(resumed.run())
+            self.assertEqual(times[3:], [it.args[1] for it in run_slot.call_args_list])
+            self.assertEqual(len(times), len(frames))
+            self.assertEqual(_values(first), _values(frames[:3]))
+            expect = BacktestSlot.fold(resumed.journal.get(), 0.0035)
+            self.assertEqual(_values(expect), _values(frames))
+            self.assertEqual(_values(frames), _values(resumed.result().history))
+            with self.assertRaises(Exception):
+                self._backtest(journal, commission=0)
+
+    def test_journal_parameters(self):
+        with tempfile.TemporaryDirectory() as folder:
+            journal = Path(folder)/'backtest.db'
+            self._backtest(journal)
+            self._backtest(journal)
+            retrained = self._backtest(Path(folder)/'other.db').evaluator
+            with torch.no_grad(): retrained.manager.model.norm.weight.fill_(2)
+            timing = BasicTimingConfig.Builder().at(hour=12, minute=0).build()
+            for create in [
+                lambda: Backtest(retrained, self.unix_from, self.unix_to, MockExchange.instance, self.timing, self.estimator, Selector(), 0.0035, journal, securities=self.securities),
+                lambda: Backtest(self._backtest(Path(folder)/'other.db').evaluator, self.unix_from, self.unix_to, MockExchange.instance, timing, self.estimator, Selector(), 0.0035, journal, securities=self.securities),
+                lambda: Backtest(self._backtest(Path(folder)/'other.db').evaluator, self.unix_from, self.unix_to, MockExchange.instance, self.timing, self.estimator, Selector(), 0.0035, journal, securities=self.securities[:2])
+            ]:
+                with self.assertRaises(Exception): create()
+
+    def test_run_retry(self):
+        with tempfile.TemporaryDirectory() as folder:
+            journal = Path(folder)/'backtest.db'
+            backtest = self._backtest(journal, fail={it.symbol for it in self.securities})
+            self.assertEqual([], list(backtest.run()))
+            self.assertEqual(backtest.get_times(), [it.unix_time for it in backtest.journal.get() if it.error is not None])
+            # the failed slots are run again on resume, and replaced in the journal
+            resumed = self._backtest(journal)
+            frames = list(resumed.run())
+            self.assertEqual(len(resumed.get_times()), len(frames))
+            self.assertEqual(resumed.get_times(), [it.unix_time for it in resumed.journal.get()])
+            self.assertTrue(all(it.error is None for it in resumed.journal.get()))
+
+    def test_run_parallel(self):
+        with tempfile.TemporaryDirectory() as folder:
+            serial = list(self._backtest(Path(folder)/'serial.db', fail={'EVAL3'}).run())
+            backtest = self._backtest(Path(folder)/'parallel.db', fail={'EVAL3'})
+            frames = iter(backtest.run(workers=2))
+            first = [next(frames) for _ in range(2)]
+            frames.close()
+            resumed = self._backtest(Path(folder)/'parallel.db', fail={'EVAL3'})
+            self.assertEqual(_values(serial), _values(first + list(resumed.run(workers=3, max_pending=2))[2:]))
+            self.assertEqual([it.unix_time for it in resumed.journal.get()], resumed.get_times())
+            self.assertTrue(all(it.security is self.securities[2] for it in resumed.journal.get()))
+            with self.assertRaises(Exception):
+                next(iter(self._backtest(Path(folder)/'cached.db', feature_cache=True).run(workers=2)))
+
+    def test_fold(self):
+        slots = [BacktestSlot(1, self.securities[0], buy_price=10, sell_price=11), BacktestSlot(2, error='failed'), BacktestSlot(3, self.securities[1], buy_price=10, sell_price=9)]
+        frames = BacktestSlot.fold(slots, 0)
+        self.assertEqual(2, len(frames))
+        self.assertAlmostEqual(1.1, frames[0].total_win)
+        self.assertAlmostEqual(0.99, frames[1].total_win)
+        self.assertEqual(_values(frames), _values([BacktestFrame.create(10, 11, 0, None), BacktestFrame.create(10, 9, 0, frames[0])]))
@@ -106,3 +106,33 @@ class TestPortfolio(TestCase):
         
     
 
+
+    def test_out_of_order(self):
+        dates.set(1000)
+        provider = MockProvider({
+            s1: [(0, 10),(150,15),(200,20)],
+            s2: [(0, 20)]
+        })
+        transactions = [
+            (10, SecurityTransaction(s1, 10, 10, 1)),
+            (70, SecurityTransaction(s2, 5, 20, 1)),
+            (130, Transaction(2)),
+            (190, SecurityTransaction(s1, -5, 15, 1)),
+            (250, SecurityTransaction(s2, 5, 30, 1))
+        ]
+        expect = Portfolio(initial_state=Portfolio.State(0, 0, []), provider=provider)
+        for unix_time, transaction in transactions: expect.transaction(unix_time, transaction)
+        expect_history = expect.equity_history(0, 300, Interval.M1)
+
+        portfolio = Portfolio(initial_state=Portfolio.State(0, 0, []), provider=provider)
+        for unix_time, transaction in [*transactions[:2], *transactions[3:]]: portfolio.transaction(unix_time, transaction)
+        history = portfolio.equity_history(0, 300, Interval.M1)
+        self.assertNotEqual(expect_history, history)
+        portfolio.transaction(*transactions[2])
+        self.assertEqual(expect.state_history, portfolio.state_history)
+        self.assertEqual(expect.ideal_state_history, portfolio.ideal_state_history)
+        self.assertEqual(expect_history, portfolio.equity_history(0, 300, Interval.M1))
+        # positions unchanged by an action are shared with the previous state
+        self.assertIs(portfolio.state_history[2].positions[0], portfolio.state_history[1].positions[0])
+        self.assertIsNot(portfolio.state_history[4].positions[0], portfolio.state_history[3].positions[0])
+        self.assertEqual(Portfolio.State(10, -101, [Position(s1, 10, 10)]), portfolio.state_history[1])
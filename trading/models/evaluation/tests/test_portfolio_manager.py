@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import unittest
+from typing import Sequence, override
+from unittest.mock import patch
+from base import dates
+from trading.core import Interval
+from trading.core.pricing import OHLCV, PricingProvider
+from trading.core.securities import Security, SecurityType
+from trading.models.generators.tests.test_abstract_generator import MockExchange
+from trading.models.evaluation.portfolio import Portfolio, Transaction
+from trading.models.evaluation.portfolio_manager import PortfolioManager
+
+securities = [Security(f"LIVE{i}", f"Live Test {i}", SecurityType.STOCK, MockExchange.instance) for i in range(4)]
+
+class BlockedProvider(PricingProvider):
+    """Fetches of all securities must run at once, and do not complete until released."""
+    def __init__(self, count: int):
+        self.barrier = threading.Barrier(count, timeout=10)
+        self.release = threading.Event()
+        self.calls = 0
+        self.lock = threading.Lock()
+    @override
+    def get_pricing(self, unix_from, unix_to, security, interval, *, interpolate = False, max_fill_ratio = 1) -> Sequence[OHLCV]:
+        with self.lock: self.calls += 1
+        self.barrier.wait()
+        self.release.wait(timeout=10)
+        return []
+    @override
+    def get_intervals(self) -> set[Interval]: return set(Interval)
+    @override
+    def get_interval_start(self, interval: Interval) -> float: return 0
+
+class MockManager(PortfolioManager):
+    def __init__(self, provider: PricingProvider, count: int):
+        super().__init__(Portfolio(provider=provider))
+        self.count = count
+        self.seen: list[int] = []
+        self.done = threading.Event()
+    @override
+    def suggest(self, securities: set[Security], unix_time: float|None = None) -> Portfolio.Action|None:
+        self.seen.append(len(self.portfolio.action_history))
+        if len(self.seen) >= self.count: self.done.set()
+        return Portfolio.Action(dates.unix(), transactions=[Transaction(1)])
+
+class TestPortfolioManager(unittest.TestCase):
+    def test_run_live(self):
+        provider = BlockedProvider(len(securities))
+        manager = MockManager(provider, count=5)
+        async def run():
+            task = asyncio.create_task(manager.run_live(securities, 0.001))
+            await asyncio.to_thread(manager.done.wait, 10)
+            task.cancel()
+            try: await task
+            except asyncio.CancelledError: pass
+            refreshed = provider.calls
+            provider.release.set()
+            return refreshed
+        refreshed = asyncio.run(run())
+        self.assertTrue(manager.done.is_set())
+        # evaluations continue while the refresh is blocked, each seeing the actions suggested before it
+        self.assertEqual(list(range(len(manager.seen))), manager.seen)
+        self.assertIn(len(manager.portfolio.action_history), [len(manager.seen)-1, len(manager.seen)])
+        # all securities are refreshed at once, and the running refresh is not restarted
+        self.assertFalse(provider.barrier.broken)
+        self.assertEqual(len(securities), refreshed)
+        for stage in ['lag', 'suggest', 'action']:
+            self.assertGreater(manager.stats[stage].count, 0)
+
+    def test_clock(self):
+        manager = MockManager(BlockedProvider(1), count=0)
+        # the time spent after each tick
+        durations = [0, 3, 25, 0, 12]
+        async def run() -> list[float]:
+            now = 100.
+            async def sleep(delay: float):
+                nonlocal now
+                now += delay
+            loop = asyncio.get_running_loop()
+            ticks: list[float] = []
+            with patch.object(loop, 'time', lambda: now), patch('asyncio.sleep', sleep):
+                clock = manager._clock(10)
+                async for _ in clock:
+                    ticks.append(now)
+                    if len(ticks) > len(durations): break
+                    now += durations[len(ticks)-1]
+                await clock.aclose()
+            return ticks
+        # fixed rate, with the ticks missed during a slow evaluation skipped
+        self.assertEqual([100, 110, 120, 150, 160, 180], asyncio.run(run()))
+        self.assertEqual(6, manager.stats['lag'].count)
+        self.assertEqual(0, manager.stats['lag'].latency)
@@ -1,6 +1,11 @@
+from __future__ import annotations
 import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator
 import torch
-from tqdm import tqdm
 from torch import Tensor
 from pathlib import Path
 from base.algos import binary_search
@@ -9,11 +14,40 @@ from base.serialization import GenericSerializer
 from trading.core import Interval
 from trading.core.securities import Exchange, Security, SecurityType
 from trading.core.timing_config import TimingConfig
-from trading.models.base.batches import BatchFile
+from trading.models.base.batches import BatchFile, MemmapDataset
 
 logger = logging.getLogger(__name__)
 serializer = GenericSerializer(typed=False)
 
+def _worker_name() -> str:
+    process = multiprocessing.current_process().name
+    thread = threading.current_thread().name
+    return thread if process == 'MainProcess' else process
+
+def _generate(generator: AbstractGenerator, security: Security, end_times: list[float]) -> list[dict[str, Tensor]|None]:
+    """Generates the examples of a security, logging and swallowing any failure. Runs within the worker."""
+    try:
+        examples = generator.generate_examples(security, end_times, with_output=True)
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        examples = [e]*len(end_times)
+    result: list[dict[str, Tensor]|None] = []
+    for end_time, example in zip(end_times, examples):
+        time = security.exchange.calendar.unix_to_datetime(end_time)
+        if isinstance(example, Exception):
+            logger.error(f"Failed to generate example for {security.symbol} for {time} ({_worker_name()}).", exc_info=example)
+            result.append(None)
+        else:
+            logger.info(f"Generated example for {security.symbol} for end time {time} ({_worker_name()}).")
+            result.append(example)
+    return result
+
+def _completed[T](result: T) -> Future[T]:
+    future = Future[T]()
+    future.set_result(result)
+    return future
+
 class AbstractGenerator:
     STATE_FILE = '_state.db'
 
@@ -26,7 +60,47 @@ class AbstractGenerator:
     def plot_statistics(self, **kwargs): ...
     #endregion
 
-    def run(self, exchange: Exchange, timing: TimingConfig):
+    def generate_examples(self, security: Security, end_times: list[float], with_output: bool = True) -> list[dict[str, Tensor]|Exception]:
+        """
+        Generates the examples of a security for multiple end times.
+        Failures are returned in place of the examples, so that one bad window does not discard the rest.
+        Override to share the work between the end times.
+        """
+        result: list[dict[str, Tensor]|Exception] = []
+        for end_time in end_times:
+            try:
+                result.append(self.generate_example(security, end_time, with_output=with_output))
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                result.append(e)
+        return result
+
+    def run(
+        self,
+        exchange: Exchange,
+        timing: TimingConfig,
+        *,
+        workers: int = 0,
+        processes: bool = False,
+        max_pending: int|None = None,
+        slots: int = 1,
+        memmap: bool = False
+    ):
+        """
+        Generates examples for all stocks of the exchange, for each time slot matching the timing config,
+        and writes them in batches. Resumes from the last written batch of each time slot.
+        Args:
+            workers: The number of workers generating examples in parallel. If 0, examples are generated in the calling thread.
+            processes: If true, the workers are processes instead of threads. The generator must then be picklable.
+            max_pending: The maximum number of examples submitted ahead of the writer. Defaults to 4 per worker.
+            slots: The number of consecutive time slots generated together. The examples of each security
+                for all slots are generated by a single generate_examples call, and kept until the last slot is written.
+            memmap: If true, batches are appended to a MemmapDataset in the folder instead of written as batch files.
+        The output (batch files and state) is the same regardless of the number of workers, since
+        results are reassembled in submission order before being batched.
+        """
+        from tqdm import tqdm
         folder = self.get_folder()
         time_frame = self.get_time_frame(exchange)
         interval = self.get_interval()
@@ -35,6 +109,7 @@ class AbstractGenerator:
         securities.sort(key = lambda it: it.symbol)
         security_time_frame = {it:self.get_time_frame(it) for it in securities}
         storage = FileKVStorage(folder/AbstractGenerator.STATE_FILE)
+        dataset = MemmapDataset(folder) if memmap else None
 
         def key(time: float): return f"{exchange.mic}-{time}"
         def next_time(time: float) -> tuple[float, int]:
@@ -44,42 +119,88 @@ class AbstractGenerator:
                 if symbol is None: return time, 0
                 i = binary_search(securities, symbol, lambda it: it.symbol, side='GT')
                 if i < len(securities): return time, i
+        def is_active(security: Security, time: float) -> bool:
+            return security_time_frame[security][0] < time <= security_time_frame[security][1]
+        def chunks() -> Iterator[list[tuple[float, int]]]:
+            """Yields groups of consecutive time slots, with the index of the first security of each."""
+            chunk: list[tuple[float, int]] = []
+            time, i = next_time(time_frame[0])
+            while time < time_frame[1]:
+                chunk.append((time, i))
+                if len(chunk) >= slots:
+                    yield chunk
+                    chunk = []
+                time, i = next_time(time)
+            if chunk: yield chunk
+            logger.info(f"Finished generator execution. Time {exchange.calendar.unix_to_datetime(time)} is bigger than end time {exchange.calendar.unix_to_datetime(time_frame[1])}.")
+        def tasks() -> Iterator[tuple[float, int, Future[list[dict[str, Tensor]|None]]|None, int]]:
+            """
+            Yields the time, the index of the next security, the future of the security's examples and the position of this example in them.
+            The future is None at the end of each time slot.
+            The examples of a security are submitted when its first slot is reached.
+            """
+            for chunk in chunks():
+                end_times = {
+                    security: [time for time, i in chunk if index >= i and is_active(security, time)]
+                    for index, security in enumerate(securities)
+                }
+                futures: dict[Security, Future[list[dict[str, Tensor]|None]]] = {}
+                for time, i in chunk:
+                    for index in range(i, len(securities)):
+                        security = securities[index]
+                        if not is_active(security, time): continue
+                        if security not in futures:
+                            if executor: futures[security] = executor.submit(_generate, self, security, end_times[security])
+                            else: futures[security] = _completed(_generate(self, security, end_times[security]))
+                        yield time, index+1, futures[security], end_times[security].index(time)
+                    yield time, len(securities), None, 0
 
-        time, i = next_time(time_frame[0])
-        current: list[dict[str, Tensor]] = []
-        
         msg = f"""----Generating examples into {folder}
         Exchange: {exchange.name}
         Timing config: {serializer.serialize(timing)}
         Start time: {exchange.calendar.unix_to_datetime(time_frame[0])}
-        End time: {exchange.calendar.unix_to_datetime(time_frame[1])}"""
+        End time: {exchange.calendar.unix_to_datetime(time_frame[1])}
+        Workers: {workers}{' (processes)' if workers and processes else ''}"""
         logger.info(msg)
         print(msg)
-        while time < time_frame[1]:
-            with tqdm(total=batch_size, desc=f'Generating for {exchange.calendar.unix_to_datetime(time)}', leave=True) as bar:
-                while len(current) < batch_size and i < len(securities):
-                    security = securities[i]
-                    i += 1
-                    if security_time_frame[security][0] >= time or security_time_frame[security][1] < time:
-                        continue
-                    try:
-                        current.append(self.generate_example(security, time, with_output=True))
-                        logger.info(f"Generated example for {security.symbol} for end time {exchange.calendar.unix_to_datetime(time)}")
-                        bar.update(1)
-                    except KeyboardInterrupt:
-                        raise
-                    except:
-                        logger.error(f"Failed to generate example for {security.symbol} for {exchange.calendar.unix_to_datetime(time)}", exc_info=True)
-            
-            if current:
-                data = {key:torch.stack([it[key] for it in current], dim=0) for key in current[0].keys()}
+
+        executor: Executor|None = None
+        if workers: executor = ProcessPoolExecutor(max_workers=workers) if processes else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generator")
+        max_pending = max_pending or max(1, 4*workers)
+        pending: deque[tuple[float, int, Future[list[dict[str, Tensor]|None]]|None, int]] = deque()
+        current: list[dict[str, Tensor]] = []
+        bar: tqdm|None = None
+
+        def write(time: float, i: int):
+            data = {key:torch.stack([it[key] for it in current], dim=0) for key in current[0].keys()}
+            if dataset is not None:
+                dataset.append(exchange, time, i, data)
+            else:
                 batch_file = BatchFile.get(folder, time, i, exchange).path
                 if batch_file.exists(): raise Exception(f"Batch file {batch_file} already exists.")
                 torch.save(data, batch_file)
-                logger.info(f"Wrote batch for {exchange.calendar.unix_to_datetime(time)}.")
-                storage.set(key(time), securities[i-1].symbol)
-                current.clear()
-            
-            if i < len(securities): continue
-            time, i = next_time(time)
-        logger.info(f"Finished generator execution. Time {exchange.calendar.unix_to_datetime(time)} is bigger than end time {exchange.calendar.unix_to_datetime(time_frame[1])}.")
+            logger.info(f"Wrote batch for {exchange.calendar.unix_to_datetime(time)}.")
+            storage.set(key(time), securities[i-1].symbol)
+            current.clear()
+        def consume():
+            nonlocal bar
+            time, i, future, position = pending.popleft()
+            if bar is None: bar = tqdm(total=batch_size, desc=f'Generating for {exchange.calendar.unix_to_datetime(time)}', leave=True)
+            example = future.result()[position] if future else None
+            if example is not None:
+                current.append(example)
+                bar.update(1)
+            if current and (len(current) >= batch_size or future is None):
+                write(time, i)
+            if len(current) >= batch_size or future is None:
+                bar.close()
+                bar = None
+
+        try:
+            for task in tasks():
+                pending.append(task)
+                while len(pending) > max_pending: consume()
+            while pending: consume()
+        finally:
+            if bar is not None: bar.close()
+            if executor: executor.shutdown(wait=True, cancel_futures=True)
@@ -4,15 +4,15 @@ from sqlalchemy import modifier
 import torch
 import random
 import time
-from typing import override
-from matplotlib.axes import Axes
-from matplotlib import pyplot as plt
+from typing import TYPE_CHECKING, override
 from torch import Tensor
 from pathlib import Path
 
 import config
 from base import dates
+from base.reflection import lazy_import
 from trading.core import Interval
+from trading.core.pricing import PricingSeries
 from trading.core.securities import Exchange, Security
 from trading.core.timing_config import TimingConfig, BasicTimingConfig
 from trading.providers.aggregate import AggregateProvider
@@ -20,10 +20,16 @@ from trading.models.base.model_config import Aggregation, BarValues, AFTER, Pric
 from trading.models.base.tensors import check_tensors
 from trading.models.base.batches import BatchFile
 from trading.models.generators.abstract_generator import AbstractGenerator
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib import pyplot as plt
+else:
+    plt = lazy_import("matplotlib.pyplot")
 
 logger = logging.getLogger(__name__)
 
 class Generator(AbstractGenerator):
+    MAX_FILL_RATIO = 1/5
     def __init__(
         self,
         data_config: PricingDataConfig,
@@ -84,17 +90,17 @@ class Generator(AbstractGenerator):
         data = {}
         for interval, count in self.data_config.counts.items():
             start_time = security.exchange.calendar.add_intervals(end_time, interval, -count)
-            pricing = AggregateProvider.instance.get_pricing(start_time, end_time, security, interval, interpolate=True, max_fill_ratio=1/5)
+            pricing = AggregateProvider.instance.get_pricing(start_time, end_time, security, interval, interpolate=True, max_fill_ratio=Generator.MAX_FILL_RATIO)
             if len(pricing) != count: 
                 raise Exception(f"Unexpected number of timestamps for start_time {start_time} end time {end_time} interval {interval} count {count}. Got {len(pricing)}.")
-            data[interval.name] = [[it[quote.name] for quote in BarValues] for it in pricing]
+            data[interval.name] = torch.tensor([[it[quote.name] for quote in BarValues] for it in pricing], dtype=torch.float64)
         check_tensors(list(data.values()), allow_zeros=False)
         if not with_output: return data
 
         after_data = {}
         for interval, count in self.after_data_config.counts.items():
             start_time = security.exchange.calendar.add_intervals(end_time, interval, -count)
-            pricing = AggregateProvider.instance.get_pricing(start_time, end_time, security, interval, interpolate=True, max_fill_ratio=1/5)
+            pricing = AggregateProvider.instance.get_pricing(start_time, end_time, security, interval, interpolate=True, max_fill_ratio=Generator.MAX_FILL_RATIO)
             if len(pricing) != count:
                 raise Exception(f"Unexpected number of timestamps for start_time {start_time} end time {end_time} interval {interval} count {count}. Got {len(pricing)}.")
             
@@ -102,6 +108,38 @@ class Generator(AbstractGenerator):
         check_tensors(list(after_data.values()), allow_zeros=False)
         return {**data, **after_data}
 
+    @override
+    def generate_examples(
+        self,
+        security: Security,
+        end_times: list[float],
+        with_output: bool = True
+    ) -> list[dict[str, Tensor]|Exception]:
+        """
+        Loads the pricing of each interval once, for the range covering all windows, interpolated onto the calendar grid,
+        and cuts the input and output windows of each end time from it.
+        """
+        calendar = security.exchange.calendar
+        series: list[tuple[str, PricingSeries, int]] = []
+        configs = [(self.data_config, False), (self.after_data_config, True)] if with_output else [(self.data_config, False)]
+        for data_config, after in configs:
+            for interval, count in data_config.counts.items():
+                unix_from = calendar.add_intervals(min(end_times), interval, -count)
+                unix_to = max(end_times)
+                pricing = AggregateProvider.instance.get_pricing(unix_from, unix_to, security, interval)
+                key = f"{AFTER}_{interval.name}" if after else interval.name
+                series.append((key, PricingSeries(pricing, calendar.get_timestamps(unix_from, unix_to, interval), unix_from), count))
+
+        result: list[dict[str, Tensor]|Exception] = []
+        for end_time in end_times:
+            try:
+                example = {key: torch.tensor(it.window(end_time, count, Generator.MAX_FILL_RATIO)) for key, it, count in series}
+                check_tensors(example, allow_zeros=False)
+                result.append(example)
+            except Exception as e:
+                result.append(e)
+        return result
+
     @override
     def plot_statistics(
         self,
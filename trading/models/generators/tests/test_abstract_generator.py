@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+from typing import Sequence, override
+import torch
+from torch import Tensor
+from base import dates
+from trading.core import Interval
+from trading.core.securities import Exchange, Security, SecurityType
+from trading.core.timing_config import BasicTimingConfig
+from trading.core.work_calendar import BasicWorkCalendar, Hours, WorkSchedule
+from trading.models.base.batches import BatchFile, MemmapDataset
+from trading.models.generators.abstract_generator import AbstractGenerator
+
+calendar = BasicWorkCalendar(tz=dates.ET, work_schedule=WorkSchedule.Builder(Hours(9, 16, open_minute=30)).build())
+class MockExchange(Exchange):
+    def __init__(self):
+        super().__init__('XGEN', 'XGEN', 'XGEN', 'Generator Test', calendar)
+    @override
+    def get_listing(self) -> Sequence[Security]:
+        return [Security(f"S{i:02}", f"Security {i}", SecurityType.STOCK, MockExchange.instance) for i in range(10)]
+    @override
+    def securities(self) -> Sequence[Security]:
+        return self.get_listing()
+
+_START = calendar.unix_to_datetime(dates.str_to_unix('2024-01-02 09:30:00', tz=dates.ET)).timestamp()
+class MockGenerator(AbstractGenerator):
+    def __init__(self, folder: Path, fail: set[str] = set()):
+        self.folder = folder
+        self.fail = fail
+    @override
+    def get_time_frame(self, it: Security | Exchange) -> tuple[float, float]:
+        if isinstance(it, Exchange): return _START, _START + 3*3600
+        if it.symbol == 'S03': return _START + 3600, _START + 3*3600
+        return _START, _START + 3*3600
+    @override
+    def get_folder(self) -> Path: return self.folder
+    @override
+    def get_interval(self) -> Interval: return Interval.H1
+    @override
+    def get_batch_size(self) -> int: return 4
+    @override
+    def generate_example(self, security: Security, end_time: float, with_output: bool = True) -> dict[str, Tensor]:
+        if security.symbol in self.fail: raise Exception(f"Failing {security.symbol}.")
+        return {'data': torch.tensor([end_time, float(security.symbol[1:])], dtype=torch.float64)}
+
+def _read(folder: Path) -> list[tuple[str, list[list[float]]]]:
+    files = sorted(folder.glob('*.pt'), key=lambda it: tuple(map(int, BatchFile.PATTERN.fullmatch(it.name).groups()[1:])))
+    return [(it.name, torch.load(it, weights_only=True)['data'].tolist()) for it in files]
+
+class TestAbstractGenerator(unittest.TestCase):
+    timing = BasicTimingConfig.Builder().any().build()
+    def setUp(self):
+        patcher = patch.dict(Exchange._get_index('mic'), {'XGEN': MockExchange.instance})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, fail: set[str] = set(), **kwargs) -> list[tuple[str, list[list[float]]]]:
+        with tempfile.TemporaryDirectory() as folder:
+            MockGenerator(Path(folder), fail).run(MockExchange.instance, self.timing, **kwargs)
+            return _read(Path(folder))
+
+    def test_parallel(self):
+        expected = self._run({'S05'})
+        first = int(_START + 1800)
+        self.assertEqual([f'XGEN_{first}_5', f'XGEN_{first}_10', f'XGEN_{first+3600}_4'], [it[0].removesuffix('.pt') for it in expected[:3]])
+        self.assertEqual([[first, 0], [first, 1], [first, 2], [first, 4]], expected[0][1])
+        self.assertEqual([0, 1, 2, 3], [int(it[1]) for it in expected[2][1]])
+        self.assertEqual(expected, self._run({'S05'}, workers=3, max_pending=2))
+        self.assertEqual(expected, self._run({'S05'}, workers=4))
+        self.assertEqual(expected, self._run({'S05'}, workers=2, processes=True))
+        self.assertEqual(expected, self._run({'S05'}, slots=2))
+        self.assertEqual(expected, self._run({'S05'}, workers=3, slots=3))
+
+    def test_memmap(self):
+        expected = self._run({'S05'})
+        with tempfile.TemporaryDirectory() as folder:
+            MockGenerator(Path(folder), {'S05'}).run(MockExchange.instance, self.timing, workers=2, memmap=True)
+            dataset = MemmapDataset(Path(folder))
+            result = [(f"XGEN_{it.unix_time}_{it.entry}.pt", dataset.get([it])['data'].tolist()) for it in dataset.entries]
+        # stored as float32
+        self.assertEqual([(name, torch.tensor(data).float().tolist()) for name, data in expected], result)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as folder:
+            generator = MockGenerator(Path(folder))
+            generator.run(MockExchange.instance, self.timing, workers=2)
+            files = _read(Path(folder))
+            generator.run(MockExchange.instance, self.timing, workers=2)
+            self.assertEqual(files, _read(Path(folder)))
@@ -0,0 +1,37 @@
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import torch
+import injection
+from base import dates
+from trading.core import Interval
+from trading.core.tests.test_pricing import security
+from trading.models.base.model_config import AFTER, PricingDataConfig
+from trading.models.generators.generator import Generator
+from trading.providers.synthetic import SyntheticPricingProvider
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(injection.container.instances, {'aggregate_provider': SyntheticPricingProvider(local=True)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generate_examples(self):
+        generator = Generator(PricingDataConfig({Interval.H1: 10, Interval.D1: 5}), PricingDataConfig({Interval.H1: 7}), Path('.'))
+        calendar = security.exchange.calendar
+        end = calendar.get_timestamps(dates.unix() - 40*24*3600, dates.unix() - 30*24*3600, Interval.H1)
+        end_times = [end[0], end[1], end[8], end[-1]]
+        examples = generator.generate_examples(security, end_times)
+        for end_time, example in zip(end_times, examples):
+            assert not isinstance(example, Exception)
+            expect = generator.generate_example(security, end_time)
+            self.assertEqual({'H1', 'D1', f'{AFTER}_H1'}, set(example.keys()))
+            self.assertEqual((7, 5), example[f'{AFTER}_H1'].shape)
+            for key in expect:
+                self.assertEqual(expect[key].shape, example[key].shape)
+                self.assertTrue(torch.allclose(expect[key], example[key]))
+        # the output window ends at the end time, as the input window
+        first = examples[0]
+        assert not isinstance(first, Exception)
+        self.assertEqual(first[f'{AFTER}_H1'].tolist(), first['H1'][-7:].tolist())
+        self.assertEqual(['H1', 'D1'], sorted(generator.generate_examples(security, end_times[:1], with_output=False)[0].keys(), reverse=True))
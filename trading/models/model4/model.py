@@ -5,7 +5,8 @@ from trading.core.timing_config import TimingConfig
 from trading.core.securities import Exchange
 from trading.models.base.model_config import BaseModelConfig, PriceEstimator, PriceOutputTarget, PricingDataConfig, PriceModifier, BarValues
 from trading.models.base.abstract_model import AbstractModel
-from trading.models.base.tensors import get_moving_average, get_time_relativized, check_tensors, check_tensor
+from trading.models.base.tensors import check_tensors, check_tensor
+from trading.models.base.kernels import span_average_relativize
 
 class ModelConfig(BaseModelConfig):
     def __init__(
@@ -102,28 +103,16 @@ class Model(AbstractModel):
         if len(next(iter(example.values())).shape) < 3: # Make sure there's a batch dimension
             example = { key: example[key].unsqueeze(dim=0) for key in example }
 
-        def process(tensor: Tensor, count: int):
-            tensor = tensor[:,-count-self.config.mvg_window:,:5]
-            #1 Get high-low relative to low (relative span)
-            tensor[:,:,BarValues.O.value] = (tensor[:,:,BarValues.H.value] - tensor[:,:,BarValues.L.value]) / tensor[:,:,BarValues.L.value]
-            #2 Get moving averages for everything
-            mvg = get_moving_average(tensor, dim=1, window=self.config.mvg_window)
-            #3 Concat everything
-            tensor = torch.concat([tensor, mvg], dim=2)
-            #4 Relativize all except relative span
-            tensor[:,:,1:5] = get_time_relativized(tensor[:,:,1:5], dim=1)
-            tensor[:,:,6:10] = get_time_relativized(tensor[:,:,6:10], dim=1)
-            return tensor[:,-count:,:].transpose(1,2)
-        
+        # relative span, moving averages, and time relativized values, see span_average_relativize
         tensors = { 
-            key : process(example[key], self.config.pricing_data_config[key])
+            key : span_average_relativize(example[key], self.config.pricing_data_config[key], self.config.mvg_window)
             for key in example if key in {it.name for it in self.config.pricing_data_config.intervals}
         }
         check_tensors(tensors)
         if with_output:
             after = self.config.price_output_target.estimate(example)
             close = example[self.config.pricing_data_config.min_interval.name][:,-1,BarValues.C.value]
-            after = (after[:,-1] - close) / close
+            after = (after - close) / close
             after = self.config.price_output_target.modifier.modify(after)
             check_tensor(after)
             return tensors, after
@@ -1,10 +1,34 @@
-#2
-from .aggregate import AggregateProvider
-from .financialtimes import FinancialTimes
-from .forex import Forex
-from .globenewswire import GlobeNewswire
-from .nasdaq import Nasdaq
-from .nyse import NYSE
-from .seekingalpha import SeekingAlpha
-from .wallstreetjournal import WallStreetJournal
-from .yahoo import Yahoo
+#3
+# The providers are imported on first access, so that importing a single provider module
+# does not import (and configure) all of them.
+import importlib
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from .aggregate import AggregateProvider
+    from .financialtimes import FinancialTimes
+    from .forex import Forex
+    from .globenewswire import GlobeNewswire
+    from .nasdaq import Nasdaq
+    from .nyse import NYSE
+    from .seekingalpha import SeekingAlpha
+    from .wallstreetjournal import WallStreetJournal
+    from .yahoo import Yahoo
+    from .synthetic import SyntheticPricingProvider
+
+_EXPORTS = {
+    'AggregateProvider': 'aggregate',
+    'FinancialTimes': 'financialtimes',
+    'Forex': 'forex',
+    'GlobeNewswire': 'globenewswire',
+    'Nasdaq': 'nasdaq',
+    'NYSE': 'nyse',
+    'SeekingAlpha': 'seekingalpha',
+    'WallStreetJournal': 'wallstreetjournal',
+    'Yahoo': 'yahoo',
+    'SyntheticPricingProvider': 'synthetic'
+}
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str) -> Any:
+    if name in _EXPORTS: return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
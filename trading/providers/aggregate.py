@@ -1,9 +1,15 @@
 #3
 from __future__ import annotations
+import asyncio
 import logging
+import threading
 import time
-from typing import Callable, override, ParamSpec, TypeVar, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Awaitable, Callable, override, ParamSpec, TypeVar, Sequence
 from base import dates
+from base.stats import LatencyStats
+import config
+import injection
 from trading.core import Interval
 from trading.core.securities import Security, DataProvider
 from trading.core.pricing import PricingProvider, OHLCV
@@ -20,11 +26,52 @@ P = ParamSpec('P')
 T = TypeVar('T')
 
 class AggregateProvider(PricingProvider, NewsProvider, DataProvider):
-    def __init__(self, pricing_providers: Sequence[PricingProvider], news_providers: Sequence[NewsProvider], data_providers: Sequence[DataProvider]):
+    """
+    Delegates to the first provider that succeeds.
+    Args:
+        adaptive: If true, providers are tried in the order of their observed latency and success rate,
+            and if a provider does not respond within its p95 latency, the next one is invoked concurrently (hedged).
+            The first successful result is returned and the remaining invocations are cancelled or ignored.
+            Otherwise, providers are tried strictly in the given order.
+            For pricing, only the last 4 days are served by all providers, so older data always comes from the first one.
+            The recent bars may then come from a different provider than the older ones, even if the first one is healthy,
+            and interpolation is applied to each part separately. Off by default, see config.providers.adaptive.
+        prior_latency: The initial latency estimate for providers that were not invoked yet.
+    """
+    def __init__(
+        self,
+        pricing_providers: Sequence[PricingProvider],
+        news_providers: Sequence[NewsProvider],
+        data_providers: Sequence[DataProvider],
+        *,
+        adaptive: bool = False,
+        prior_latency: float = 1.0,
+        max_workers: int = 32
+    ):
         self.pricing_providers = pricing_providers
         self.news_providers = news_providers
         self.data_providers = data_providers
+        self.adaptive = adaptive
+        self.prior_latency = prior_latency
+        self.max_workers = max_workers
+        self.stats: dict[tuple[int, str], LatencyStats] = {}
+        self.stats_lock = threading.Lock()
+        self.executor: ThreadPoolExecutor|None = None
+    
+    def get_stats(self, method: Callable) -> LatencyStats:
+        key = (id(getattr(method, '__self__', None)), method.__name__)
+        with self.stats_lock:
+            if key not in self.stats: self.stats[key] = LatencyStats(prior_latency=self.prior_latency)
+            return self.stats[key]
+    def _get_order(self, methods: Sequence[Callable]) -> list[int]:
+        return sorted(range(len(methods)), key=lambda i: (self.get_stats(methods[i]).score(), i))
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self.stats_lock:
+            if not self.executor: self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="aggregate")
+            return self.executor
+
     def _delegate_call(self, methods: Sequence[Callable[P, T]], *args: P.args, **kwargs: P.kwargs) -> T:
+        if self.adaptive: return self._delegate_call_hedged(methods, *args, **kwargs)
         for i,method in enumerate(methods):
             try:
                 return method(*args, **kwargs)
@@ -32,14 +79,126 @@ class AggregateProvider(PricingProvider, NewsProvider, DataProvider):
                 logger.warning(f"Failed to invoke {method.__qualname__}.", exc_info=True)
                 if i == len(methods)-1: raise
         raise Exception("No methods to invoke.")
+    def _delegate_call_hedged(self, methods: Sequence[Callable[P, T]], *args: P.args, **kwargs: P.kwargs) -> T:
+        order = self._get_order(methods)
+        executor = self._get_executor()
+        pending: dict[Future[T], Callable[P, T]] = {}
+        def launch() -> float:
+            method = methods[order[len(pending) + finished]]
+            stats = self.get_stats(method)
+            start = time.perf_counter()
+            def on_done(future: Future[T]):
+                if future.cancelled(): return
+                stats.record(time.perf_counter() - start, future.exception() is None and future.result() is not None)
+            future = executor.submit(method, *args, **kwargs)
+            future.add_done_callback(on_done)
+            pending[future] = method
+            return stats.p95()
+        finished = 0
+        exception: BaseException|None = None
+        empty = False
+        timeout = launch()
+        while pending:
+            more = len(pending) + finished < len(order)
+            done, _ = wait(pending, timeout=timeout if more else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"Hedging {next(reversed(pending.values())).__qualname__} after {timeout:.3f}s.")
+                timeout = launch()
+                continue
+            for future in done:
+                method = pending.pop(future)
+                finished += 1
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    logger.warning(f"Failed to invoke {method.__qualname__}.", exc_info=True)
+                    exception = ex
+                    continue
+                if result is not None:
+                    for it in pending: it.cancel()
+                    return result
+                empty = True
+            if len(pending) + finished < len(order): timeout = launch()
+        if exception and not empty: raise exception
+        if empty: return None # type: ignore
+        raise Exception("No methods to invoke.")
+
+    async def _delegate_call_async(self, methods: Sequence[Callable[P, Awaitable[T]]], *args: P.args, **kwargs: P.kwargs) -> T:
+        if self.adaptive: return await self._delegate_call_hedged_async(methods, *args, **kwargs)
+        for i,method in enumerate(methods):
+            try:
+                return await method(*args, **kwargs)
+            except:
+                logger.warning(f"Failed to invoke {method.__qualname__}.", exc_info=True)
+                if i == len(methods)-1: raise
+        raise Exception("No methods to invoke.")
+    async def _delegate_call_hedged_async(self, methods: Sequence[Callable[P, Awaitable[T]]], *args: P.args, **kwargs: P.kwargs) -> T:
+        order = self._get_order(methods)
+        pending: dict[asyncio.Task[T], Callable[P, Awaitable[T]]] = {}
+        async def invoke(method: Callable[P, Awaitable[T]]) -> T:
+            stats = self.get_stats(method)
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except:
+                stats.record(time.perf_counter() - start, False)
+                raise
+            stats.record(time.perf_counter() - start, result is not None)
+            return result
+        def launch() -> float:
+            method = methods[order[len(pending) + finished]]
+            pending[asyncio.ensure_future(invoke(method))] = method
+            return self.get_stats(method).p95()
+        finished = 0
+        exception: BaseException|None = None
+        empty = False
+        timeout = launch()
+        try:
+            while pending:
+                more = len(pending) + finished < len(order)
+                done, _ = await asyncio.wait(pending, timeout=timeout if more else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"Hedging {next(reversed(pending.values())).__qualname__} after {timeout:.3f}s.")
+                    timeout = launch()
+                    continue
+                for task in done:
+                    method = pending.pop(task)
+                    finished += 1
+                    try:
+                        result = task.result()
+                    except Exception as ex:
+                        logger.warning(f"Failed to invoke {method.__qualname__}.", exc_info=True)
+                        exception = ex
+                        continue
+                    if result is not None: return result
+                    empty = True
+                if len(pending) + finished < len(order): timeout = launch()
+        finally:
+            for it in pending: it.cancel()
+        if exception and not empty: raise exception
+        if empty: return None # type: ignore
+        raise Exception("No methods to invoke.")
 
+    def _get_live_from(self, unix_from: float, unix_to: float, interval: Interval) -> float|None:
+        """The start of the part of the range that any pricing provider can serve, if any. Older data is only served by the first."""
+        if unix_to < dates.unix() - 4*24*3600 or interval > Interval.D1: return None
+        return max(dates.unix() - 4*24*3600, unix_from)
     @override
     def get_pricing(self, unix_from: float, unix_to: float, security: Security, interval: Interval, *, interpolate: bool = False, max_fill_ratio: float = 1) -> Sequence[OHLCV]:
+        if self.adaptive:
+            sep = self._get_live_from(unix_from, unix_to, interval)
+            if sep is None: return self.pricing_providers[0].get_pricing(unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            # the old part is fetched concurrently with the hedged recent part
+            old = self._get_executor().submit(self.pricing_providers[0].get_pricing, unix_from, sep, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio) if unix_from < sep else None
+            recent = self._delegate_call([it.get_pricing for it in self.pricing_providers], sep, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            return [*old.result(), *recent] if old else recent
         try:
             return self.pricing_providers[0].get_pricing(unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
         except:
-            if unix_to < dates.unix() - 4*24*3600 or interval > Interval.D1: raise
-            sep = max(dates.unix() - 4*24*3600, unix_from)
+            sep = self._get_live_from(unix_from, unix_to, interval)
+            if sep is None: raise
             if unix_from < sep:
                 old = self.pricing_providers[0].get_pricing(unix_from, sep, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
             else:
@@ -51,6 +210,34 @@ class AggregateProvider(PricingProvider, NewsProvider, DataProvider):
                 return result
             else:
                 return recent
+    @override
+    async def get_pricing_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval, *, interpolate: bool = False, max_fill_ratio: float = 1) -> Sequence[OHLCV]:
+        if self.adaptive:
+            sep = self._get_live_from(unix_from, unix_to, interval)
+            if sep is None: return await self.pricing_providers[0].get_pricing_async(unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            recent = self._delegate_call_async([it.get_pricing_async for it in self.pricing_providers], sep, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            if unix_from >= sep: return await recent
+            old, recent = await asyncio.gather(
+                self.pricing_providers[0].get_pricing_async(unix_from, sep, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio),
+                recent
+            )
+            return [*old, *recent]
+        try:
+            return await self.pricing_providers[0].get_pricing_async(unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+        except:
+            sep = self._get_live_from(unix_from, unix_to, interval)
+            if sep is None: raise
+            if unix_from < sep:
+                old = await self.pricing_providers[0].get_pricing_async(unix_from, sep, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            else:
+                old = None
+            recent = await self._delegate_call_async([it.get_pricing_async for it in self.pricing_providers], unix_from, unix_to, security, interval, interpolate=interpolate, max_fill_ratio=max_fill_ratio)
+            if old:
+                result = list(old)
+                result.extend(recent)
+                return result
+            else:
+                return recent
             
     @override
     def get_interval_start(self, interval: Interval) -> float:
@@ -59,6 +246,9 @@ class AggregateProvider(PricingProvider, NewsProvider, DataProvider):
     @override
     def get_news(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
         return self._delegate_call([it.get_news for it in self.news_providers], unix_from, unix_to, security)
+    @override
+    async def get_news_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        return await self._delegate_call_async([it.get_news_async for it in self.news_providers], unix_from, unix_to, security)
     
     @override
     def get_outstanding_parts(self, security: Security) -> float:
@@ -73,10 +263,17 @@ class AggregateProvider(PricingProvider, NewsProvider, DataProvider):
     def get_summary(self, security: Security) -> str:
         return self._delegate_call([it.get_summary for it in self.data_providers], security)
     
-    instance: AggregateProvider
-
-pricing_providers: list[PricingProvider] = [Yahoo(), WallStreetJournal(), FinancialTimes()]
-news_providers: list[NewsProvider] = [GlobeNewswire(), SeekingAlpha()]
-data_providers: list[DataProvider] = [Yahoo()]
+    instance: injection.Dependency[AggregateProvider] = injection.Dependency('aggregate_provider')
 
-AggregateProvider.instance = AggregateProvider(pricing_providers, news_providers, data_providers)
\ No newline at end of file
+# Providers are created on first use of AggregateProvider.instance
+injection.container.register('yahoo', Yahoo)
+injection.container.register('wallstreetjournal', WallStreetJournal)
+injection.container.register('financialtimes', FinancialTimes)
+injection.container.register('globenewswire', GlobeNewswire)
+injection.container.register('seekingalpha', SeekingAlpha)
+injection.container.register('aggregate_provider', lambda: AggregateProvider(
+    [injection.container.get(it) for it in ['yahoo', 'wallstreetjournal', 'financialtimes']],
+    [injection.container.get(it) for it in ['globenewswire', 'seekingalpha']],
+    [injection.container.get('yahoo')],
+    adaptive=getattr(config.providers, 'adaptive', False)
+))
\ No newline at end of file
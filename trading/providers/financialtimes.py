@@ -2,22 +2,24 @@
 import json
 import logging
 import math
+from functools import cached_property
 from typing import Sequence, TypedDict, override
 from base import dates
-from base.scraping import TooManyRequestsException, scraper, backup_timeout
+from base.scraping import TooManyRequestsException, scraper, async_scraper, backup_timeout
 from trading.core import Interval
 from trading.providers.forex import ForexSecurity
 from trading.providers.nyse import NYSE, NYSEAmerican, NYSEArca, NYSESecurity
 from trading.providers.utils import arrays_to_ohlcv, filter_ohlcv
 from base.caching import KeyValueStorage, cached_scalar
-from base.key_value_storage import SqlKVStorage
 from trading.core.securities import Security
-from trading.core.pricing import OHLCV, BasePricingProvider, MongoKVStorage
+from trading.core.pricing import OHLCV, BasePricingProvider
 from trading.providers.nasdaq import NasdaqSecurity, NasdaqGS, NasdaqMS, NasdaqCM
 import injection
 
 logger = logging.getLogger(__name__)
 _MODULE: str = __name__.split(".")[-1]
+_info_backup = backup_timeout()
+_pricing_backup = backup_timeout()
 
 def _get_identifiers(security: Security) -> list[str]:
     if isinstance(security, (NasdaqSecurity, NYSESecurity)):
@@ -44,13 +46,18 @@ def _get_interval(interval: Interval) -> tuple[str, int]:
     raise Exception(f"Unknown interval {interval}")
 
 class FinancialTimes(BasePricingProvider):
-    def __init__(self):
+    def __init__(self, local: bool = False):
         super().__init__(
-            native = [Interval.D1, Interval.M30, Interval.M15, Interval.M5, Interval.M1]
+            native = [Interval.D1, Interval.M30, Interval.M15, Interval.M5, Interval.M1],
+            local = local
         )
-        name = FinancialTimes.__name__.lower()
-        self.local_info_storage = SqlKVStorage(injection.local_db, f"{name}_info")
-        self.remote_info_storage = MongoKVStorage(injection.mongo_db[f"{name}_info"])
+
+    @cached_property
+    def local_info_storage(self) -> KeyValueStorage:
+        return injection.kv_storage(f"{self.name}_info", memory=self.local)
+    @cached_property
+    def remote_info_storage(self) -> KeyValueStorage:
+        return injection.kv_storage(f"{self.name}_info", remote=True, memory=self.local)
     
     #region info
     class _InfoDict(TypedDict):
@@ -60,15 +67,27 @@ class FinancialTimes(BasePricingProvider):
         symbol: str
         xid: str
         assetClass: str
-    @backup_timeout()
+    def _match_info(self, text: str, ids: list[str]) -> _InfoDict|None:
+        data = json.loads(text)
+        data = [it for it in data['data']['security'] if 'symbol' in it and it['symbol'] in ids]
+        return data[0] if data else None
+    @_info_backup
     def _fetch_info(self, security: Security) -> _InfoDict|None:
         url = f"https://markets.ft.com/data/searchapi/searchsecurities"
         ids = _get_identifiers(security)
         for id in ids:
             resp = scraper.get(url, params={'query': id})
-            data = json.loads(resp.text)
-            data = [it for it in data['data']['security'] if 'symbol' in it and it['symbol'] in ids]
-            if data: return data[0]
+            info = self._match_info(resp.text, ids)
+            if info: return info
+        raise Exception(f"Can't find info for {security.symbol}.")
+    @_info_backup
+    async def _fetch_info_async(self, security: Security) -> _InfoDict|None:
+        url = f"https://markets.ft.com/data/searchapi/searchsecurities"
+        ids = _get_identifiers(security)
+        for id in ids:
+            resp = await async_scraper.get(url, params={'query': id})
+            info = self._match_info(resp.text, ids)
+            if info: return info
         raise Exception(f"Can't find info for {security.symbol}.")
 
     def _get_info_key_fn(self, security: Security) -> str:
@@ -87,17 +106,21 @@ class FinancialTimes(BasePricingProvider):
         except:
             logger.warning(f"Setting info to None for {security.symbol}.", exc_info=True)
             return None
+    async def _load_info_async(self, security: Security) -> _InfoDict|None:
+        try:
+            return await self._fetch_info_async(security)
+        except TooManyRequestsException:
+            raise
+        except:
+            logger.warning(f"Setting info to None for {security.symbol}.", exc_info=True)
+            return None
+    async def _get_info_async(self, security: Security) -> _InfoDict|None:
+        return await FinancialTimes._get_info.cached_method_async(self, self._load_info_async, security)
     #endregion
 
     #region pricing
-    @backup_timeout()
-    def _fetch_pricing(self, xid: str, days: int, data_period: str, data_interval: int, realtime: bool):
-        """
-        FT timestamps represent the start of the relevant interval BUT
-        they are often a few milliseconds off!
-        """
-        url = "https://markets.ft.com/data/chartapi/series"
-        request = {
+    def _get_pricing_request(self, xid: str, days: int, data_period: str, data_interval: int, realtime: bool) -> dict:
+        return {
             "days": days,
             "dataNormalized": False,
             "dataPeriod": data_period,
@@ -124,7 +147,19 @@ class FinancialTimes(BasePricingProvider):
                 }
             ]
         }
-        resp = scraper.post(url, request)
+    @_pricing_backup
+    def _fetch_pricing(self, xid: str, days: int, data_period: str, data_interval: int, realtime: bool):
+        """
+        FT timestamps represent the start of the relevant interval BUT
+        they are often a few milliseconds off!
+        """
+        url = "https://markets.ft.com/data/chartapi/series"
+        resp = scraper.post(url, self._get_pricing_request(xid, days, data_period, data_interval, realtime))
+        return json.loads(resp.text)
+    @_pricing_backup
+    async def _fetch_pricing_async(self, xid: str, days: int, data_period: str, data_interval: int, realtime: bool):
+        url = "https://markets.ft.com/data/chartapi/series"
+        resp = await async_scraper.post(url, self._get_pricing_request(xid, days, data_period, data_interval, realtime))
         return json.loads(resp.text)
     
     def _fix_timestamps(self, timestamps: Sequence[float|None], interval: Interval, security: Security) -> list[float|None]:
@@ -154,20 +189,14 @@ class FinancialTimes(BasePricingProvider):
     @override
     def get_pricing_delay(self, security: Security, interval: Interval) -> float:
         return 16*60
-    @override
-    def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+    def _get_days(self, unix_from: float, security: Security) -> int:
         if isinstance(security, ForexSecurity): raise Exception(f"FinancialTimes returns sparse data for forex securities.")
         days = math.ceil((dates.unix() - unix_from)/(24*3600)) + 1
-        days = max(min(days, 15), 4)
-        info = self._get_info(security)
+        return max(min(days, 15), 4)
+    def _get_xid(self, info: _InfoDict|None, security: Security) -> str:
         if not info or 'xid' not in info or not info['xid']: raise Exception(f"No xid for '{security.symbol}'.")
-        try:
-            data = self._fetch_pricing(info['xid'], days, *_get_interval(interval), realtime=True)
-        except TooManyRequestsException:
-            raise
-        except:
-            logger.warning(f"Failed to fetch prices for {security.symbol} fro {dates.unix_to_str(unix_from)} to {dates.unix_to_str(unix_to)}. Returning [].", exc_info=True)
-            return []
+        return info['xid']
+    def _get_series(self, data: dict, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
         timestamps = self._fix_timestamps(data['Dates'], interval, security)
         elements = data['Elements']
         if len(elements) < 2:
@@ -181,4 +210,28 @@ class FinancialTimes(BasePricingProvider):
         data = {**extract_component_series_values(prices), **extract_component_series_values(volumes)}
         data['t'] = timestamps
         return filter_ohlcv(arrays_to_ohlcv(data), unix_from, unix_to)
+    @override
+    def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        days = self._get_days(unix_from, security)
+        xid = self._get_xid(self._get_info(security), security)
+        try:
+            data = self._fetch_pricing(xid, days, *_get_interval(interval), realtime=True)
+        except TooManyRequestsException:
+            raise
+        except:
+            logger.warning(f"Failed to fetch prices for {security.symbol} fro {dates.unix_to_str(unix_from)} to {dates.unix_to_str(unix_to)}. Returning [].", exc_info=True)
+            return []
+        return self._get_series(data, unix_from, unix_to, security, interval)
+    @override
+    async def get_pricing_raw_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        days = self._get_days(unix_from, security)
+        xid = self._get_xid(await self._get_info_async(security), security)
+        try:
+            data = await self._fetch_pricing_async(xid, days, *_get_interval(interval), realtime=True)
+        except TooManyRequestsException:
+            raise
+        except:
+            logger.warning(f"Failed to fetch prices for {security.symbol} fro {dates.unix_to_str(unix_from)} to {dates.unix_to_str(unix_to)}. Returning [].", exc_info=True)
+            return []
+        return self._get_series(data, unix_from, unix_to, security, interval)
     #endregion
\ No newline at end of file
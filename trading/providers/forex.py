@@ -5,7 +5,6 @@ from typing import Sequence, override
 from datetime import datetime, timedelta
 from base.types import Singleton
 from base import dates
-from base.utils import cached
 from trading.core.interval import Interval
 from trading.core.securities import Security, Exchange, SecurityType
 from trading.core.work_calendar import BasicWorkCalendar, Hours
@@ -15,6 +14,7 @@ class ForexSecurity(Security):
     class Subtype(Enum):
         MAJOR = auto()
         MINOR = auto()
+    __slots__ = ('base', 'quote', 'subtype')
     def __init__(self, base: str, quote: str, subtype: Subtype):
         super().__init__(f"{base}{quote}", f"{base}/{quote}", SecurityType.FX, Forex.instance)
         self.base = base
@@ -40,12 +40,12 @@ class ForexWorkCalendar(BasicWorkCalendar, Singleton):
         return super()._get_next_timestamp(time, interval)
 
 class Forex(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XFX', 'XFX', 'XFX', 'Forex Exchange', ForexWorkCalendar.instance)
 
     @override
-    @cached
-    def securities(self) -> Sequence[ForexSecurity]:
+    def get_listing(self) -> Sequence[ForexSecurity]:
         majors = [
             ForexSecurity(base, quote, ForexSecurity.Subtype.MAJOR) for base,quote in [
                 ('EUR','USD'),
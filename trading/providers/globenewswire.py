@@ -1,18 +1,24 @@
-#2
+#3
+from __future__ import annotations
+import asyncio
 import logging
-from typing import Sequence, override
+from typing import TYPE_CHECKING, Sequence, override
 from urllib import parse
-from bs4 import BeautifulSoup
-from base.scraping import scraper, backup_timeout
+from base.reflection import lazy_import
+from base.scraping import scraper, async_scraper, backup_timeout
 from trading.core.securities import Security
 from trading.core.news import News, BaseNewsProvider
 from trading.providers.nyse import NYSESecurity
 from trading.providers.utils import filter_news
 from trading.providers.nasdaq import Nasdaq, NasdaqSecurity
 
+if TYPE_CHECKING: import bs4
+else: bs4 = lazy_import("bs4")
+
 logger = logging.getLogger(__name__)
 _MODULE = __name__.split(".")[-1]
 _BASE_URL = "https://www.globenewswire.com"
+_news_backup = backup_timeout()
 def _format_for_url(input: str) -> str:
     input = input.replace('.', '§').replace(',', 'δ')
     return parse.quote(input)
@@ -33,8 +39,7 @@ def _get_org(security: Security) -> str:
 
 class GlobeNewswire(BaseNewsProvider):
 
-    @backup_timeout()
-    def _fetch_news(self,  unix_from: float, unix_to: float, orgs: list[str], keywords: list[str]) -> list[GlobeNewswireNews]:
+    def _get_search_url(self, unix_from: float, unix_to: float, orgs: list[str], keywords: list[str]) -> str:
         url = f"{_BASE_URL}/en/search/"
         if orgs:
             url += "organization/"
@@ -46,34 +51,70 @@ class GlobeNewswire(BaseNewsProvider):
             date_from = Nasdaq.instance.calendar.unix_to_datetime(unix_from).strftime("%Y-%m-%d")
             date_to = Nasdaq.instance.calendar.unix_to_datetime(unix_to + 24*3600 - 0.0001).strftime("%Y-%m-%d")
             url += f"date/[{date_from}%2520TO%2520{date_to}]/"
-        url = url[:-1]
+        return url[:-1]
+    def _get_page_request(self, url: str, page: int) -> tuple[str, dict]:
+        if page > 1: return f"{url}/load/more", {'pageSize': 50, 'page': page}
+        else: return url, {'pageSize': 50}
+    def _parse_item(self, div) -> tuple[float, str, str, str]:
+        """Returns the time, title, preview and article link of a search result."""
+        time_span = div.select_one("div.date-source > span")
+        title_link_a = div.select_one("div.mainLink > a")
+        preview_span = div.select_one("div.newsTxt > p")
+        unix_time = Nasdaq.instance.calendar.str_to_unix(time_span.text.strip(), format="%B %d, %Y %H:%M ET")
+        preview = preview_span.text.strip()
+        title = title_link_a.text
+        link: str = title_link_a['href']
+        link = f"{_BASE_URL}{link}" if link.startswith("/") else f"{_BASE_URL}/{link}"
+        return unix_time, title, preview, link
+    def _parse_article(self, text: str) -> str:
+        article = bs4.BeautifulSoup(text, "html.parser")
+        article = article.select_one("div.article-body") or article.select_one("div.main-body-container") or article.select_one("body")
+        assert article
+        return article.text
+    def _has_next_page(self, soup: bs4.BeautifulSoup) -> bool:
+        return soup.select_one('div.pagnition-next > a') is not None
+
+    @_news_backup
+    def _fetch_news(self,  unix_from: float, unix_to: float, orgs: list[str], keywords: list[str]) -> list[GlobeNewswireNews]:
+        url = self._get_search_url(unix_from, unix_to, orgs, keywords)
         result: list[GlobeNewswireNews] = []
         page = 1
         while True:
-            if page > 1:
-                resp = scraper.get(f"{url}/load/more", params={'pageSize': 50, 'page': page})
-            else:
-                resp = scraper.get(url, params={'pageSize': 50})
-            
-            soup = BeautifulSoup(resp.text, 'html.parser')
+            page_url, params = self._get_page_request(url, page)
+            resp = scraper.get(page_url, params=params)
+            soup = bs4.BeautifulSoup(resp.text, 'html.parser')
             divs = soup.find_all("div", class_="newsLink")
             for div in divs:
                 try:
-                    time_span = div.select_one("div.date-source > span")
-                    title_link_a = div.select_one("div.mainLink > a")
-                    preview_span = div.select_one("div.newsTxt > p")
-                    unix_time = Nasdaq.instance.calendar.str_to_unix(time_span.text.strip(), format="%B %d, %Y %H:%M ET")
-                    preview = preview_span.text.strip()
-                    title = title_link_a.text
-                    link: str = title_link_a['href']
-                    link = f"{_BASE_URL}{link}" if link.startswith("/") else f"{_BASE_URL}/{link}"
-                    article = BeautifulSoup(scraper.get(link).text, "html.parser")
-                    article = article.select_one("div.article-body") or article.select_one("div.main-body-container") or article.select_one("body")
-                    assert article
-                    result.append(GlobeNewswireNews(unix_time, title, article.text, link, preview))
+                    unix_time, title, preview, link = self._parse_item(div)
+                    content = self._parse_article(scraper.get(link).text)
+                    result.append(GlobeNewswireNews(unix_time, title, content, link, preview))
                 except:
                     logger.error(f"Failed to parse div:\n{div.decode_contents()}", exc_info=True)
-            if soup.select_one('div.pagnition-next > a'): page += 1
+            if self._has_next_page(soup): page += 1
+            else: break
+        return result
+    @_news_backup
+    async def _fetch_news_async(self,  unix_from: float, unix_to: float, orgs: list[str], keywords: list[str]) -> list[GlobeNewswireNews]:
+        """Same as _fetch_news, but the articles of each page are fetched concurrently."""
+        url = self._get_search_url(unix_from, unix_to, orgs, keywords)
+        result: list[GlobeNewswireNews] = []
+        async def fetch_item(div) -> GlobeNewswireNews|None:
+            try:
+                unix_time, title, preview, link = self._parse_item(div)
+                content = self._parse_article((await async_scraper.get(link)).text)
+                return GlobeNewswireNews(unix_time, title, content, link, preview)
+            except:
+                logger.error(f"Failed to parse div:\n{div.decode_contents()}", exc_info=True)
+                return None
+        page = 1
+        while True:
+            page_url, params = self._get_page_request(url, page)
+            resp = await async_scraper.get(page_url, params=params)
+            soup = bs4.BeautifulSoup(resp.text, 'html.parser')
+            items = await asyncio.gather(*(fetch_item(div) for div in soup.find_all("div", class_="newsLink")))
+            result.extend(it for it in items if it)
+            if self._has_next_page(soup): page += 1
             else: break
         return result
 
@@ -82,4 +123,8 @@ class GlobeNewswire(BaseNewsProvider):
     def get_news_raw(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
         result = self._fetch_news(unix_from, unix_to, [_get_org(security)], [])
         return filter_news(result, unix_from=unix_from, unix_to=unix_to)
+    @override
+    async def get_news_raw_async(self, unix_from: float, unix_to: float, security: Security) -> Sequence[News]:
+        result = await self._fetch_news_async(unix_from, unix_to, [_get_org(security)], [])
+        return filter_news(result, unix_from=unix_from, unix_to=unix_to)
     #endregion
\ No newline at end of file
@@ -1,15 +1,15 @@
 #1
 from __future__ import annotations
+import hashlib
 import logging
 from pathlib import Path
 import re
 from typing import Sequence, override
 from enum import Enum
-from base.key_value_storage import FileKVStorage
+from base.key_value_storage import FolderKVStorage
 import config
 from base import dates
 from base.types import Singleton
-from base.utils import cached
 from base.caching import cached_scalar
 from base.scraping import scraper
 from base.serialization import Serializable
@@ -18,6 +18,8 @@ from trading.core.securities import Security, SecurityType, Exchange
 
 logger = logging.getLogger(__name__)
 _MODULE: str = __name__.split(".")[-1]
+# The raw listing and its hash are stored in separate files, so that the hash is read without the listing
+_listing_storage = FolderKVStorage(Path(config.storage.local_root_path)/_MODULE/"listing")
 
 class NasdaqCalendar(BasicWorkCalendar, Singleton):
     def __init__(self):
@@ -54,20 +56,30 @@ class NasdaqCalendar(BasicWorkCalendar, Singleton):
         )
 
 class Nasdaq(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XNAS', 'XNAS', 'XNAS', 'Nasdaq All Markets', NasdaqCalendar.instance)
     
     @cached_scalar( #type: ignore
-        storage=FileKVStorage(Path(config.storage.local_root_path)/_MODULE/"listed"),
+        key=lambda self: "hash",
+        storage=lambda self: _listing_storage,
         refresh_interval=7*24*3600
     )
-    def _fetch_listed(self) -> list[str]:
+    def _fetch_listing_hash(self) -> str:
+        """Fetches the raw listing and stores it next to its hash, so that the hash is computed once per fetch."""
         response = scraper.get("https://www.nasdaqtrader.com/dynamic/symdir/nasdaqlisted.txt")
-        return response.text.splitlines(False)
+        lines = response.text.splitlines(False)
+        _listing_storage.set("listed", lines)
+        return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+    def _fetch_listed(self) -> list[str]:
+        self._fetch_listing_hash() # fetches the raw listing again if expired
+        return _listing_storage.get("listed", list)
 
     @override
-    @cached
-    def securities(self) -> Sequence[NasdaqSecurity]:
+    def get_listing_hash(self) -> str:
+        return self._fetch_listing_hash()
+    @override
+    def get_listing(self) -> Sequence[NasdaqSecurity]:
         result: list[NasdaqSecurity] = []
         tests = 0
         failed = 0
@@ -86,32 +98,20 @@ class Nasdaq(Exchange):
         return result
 
 class NasdaqGS(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XNAS', 'XNGS', 'XNAS', 'Nasdaq Global Select', NasdaqCalendar.instance)
 
-    @override
-    @cached
-    def securities(self) -> Sequence[Security]:
-        return [it for it in Nasdaq.instance.securities() if it.exchange is NasdaqGS.instance]
-
 class NasdaqMS(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XNAS', 'XNMS', 'XNAS', 'Nasdaq Global Market', NasdaqCalendar.instance)
 
-    @override
-    @cached
-    def securities(self) -> Sequence[Security]:
-        return [it for it in Nasdaq.instance.securities() if it.exchange is NasdaqMS.instance]
-
 class NasdaqCM(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XNAS', 'XNCM', 'XNAS', 'Nasdaq Capital Market', NasdaqCalendar.instance)
 
-    @override
-    @cached
-    def securities(self) -> Sequence[Security]:
-        return [it for it in Nasdaq.instance.securities() if it.exchange is NasdaqCM.instance]
-
 class FinancialStatus(Enum):
     NORMAL = 'N'
     DEFICIENT = 'D'
@@ -119,6 +119,7 @@ class FinancialStatus(Enum):
     BANKRUPT = 'Q'
 
 class NasdaqSecurity(Security, Serializable):
+    __slots__ = ('status',)
     def __init__(self, symbol: str, name: str, type: SecurityType, exchange: Exchange, status: FinancialStatus):
         super().__init__(symbol, name, type, exchange)
         self.status = status
@@ -1,9 +1,10 @@
+import hashlib
 import json
 import logging
 from itertools import chain
 from pathlib import Path
 from typing import Literal, Sequence, TypedDict, override
-from base.key_value_storage import FileKVStorage
+from base.key_value_storage import FolderKVStorage
 import config
 from base.types import Singleton
 from base.caching import cached_scalar
@@ -14,12 +15,15 @@ from trading.providers.nasdaq import NasdaqCalendar
 
 logger = logging.getLogger(__name__)
 _MODULE: str = __name__.split(".")[-1]
+# The raw listings and their hash are stored in separate files, so that the hash is read without the listings
+_listing_storage = FolderKVStorage(Path(config.storage.local_root_path)/_MODULE/"listing")
 
 class NYSECalendar(NasdaqCalendar):
     def __init__(self):
         super().__init__()
 
 class NYSESecurity(Security):
+    __slots__ = ()
     def __init__(self, symbol: str, name: str, type: SecurityType, exchange: Exchange):
         super().__init__(symbol, name, type, exchange)
 
@@ -46,12 +50,8 @@ class NYSEScraper(Singleton):
         symbolEsignalTicker: str
         instrumentName: str
         micCode: str
-    @cached_scalar( #type: ignore
-        storage=FileKVStorage(Path(config.storage.local_root_path)/_MODULE/"listed"),
-        refresh_interval=7*24*3600
-    )
     @backup_timeout()
-    def _fetch_listed(self, instrumentType: _FilterInsturmentType) -> list[_FetchResult]:
+    def _fetch_listed_raw(self, instrumentType: _FilterInsturmentType) -> list[_FetchResult]:
         pageSize = 500
         page = 1
         request = {
@@ -76,6 +76,25 @@ class NYSEScraper(Singleton):
             except:
                 logger.warning(f"Unexpected error when fetching NYSE stocks.", exc_info=True)
         return data
+    @cached_scalar( #type: ignore
+        key=lambda self: "hash",
+        storage=lambda self: _listing_storage,
+        refresh_interval=7*24*3600
+    )
+    def _fetch_listing_hash(self) -> str:
+        """
+        Fetches the raw listings of both instrument types and stores them next to their common hash,
+        so that the hash is computed once per fetch, and shared by all NYSE exchanges.
+        """
+        listed = [self._fetch_listed_raw('EQUITY'), self._fetch_listed_raw('EXCHANGE_TRADED_FUND')]
+        _listing_storage.set('EQUITY', listed[0])
+        _listing_storage.set('EXCHANGE_TRADED_FUND', listed[1])
+        return hashlib.sha256(json.dumps(listed, sort_keys=True).encode()).hexdigest()
+    def _fetch_listed(self, instrumentType: _FilterInsturmentType) -> list[_FetchResult]:
+        self._fetch_listing_hash() # fetches the raw listings again if expired
+        return _listing_storage.get(instrumentType, list)
+    def get_listing_hash(self) -> str:
+        return self._fetch_listing_hash()
     @cached
     def get_securities(self) -> Sequence[NYSESecurity]:
         result = []
@@ -93,25 +112,34 @@ class NYSEScraper(Singleton):
         return result
 
 class NYSE(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XNYS', 'XNYS', 'XNYS', 'NYSE', NYSECalendar.instance)
     @override
-    @cached
-    def securities(self) -> Sequence[NYSESecurity]:
+    def get_listing_hash(self) -> str:
+        return NYSEScraper.instance.get_listing_hash()
+    @override
+    def get_listing(self) -> Sequence[NYSESecurity]:
         return [it for it in NYSEScraper.instance.get_securities() if it.exchange == NYSE.instance]
 
 class NYSEAmerican(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('XASE', 'XASE', 'XNYS', 'NYSE American', NYSECalendar.instance)
     @override
-    @cached
-    def securities(self) -> Sequence[NYSESecurity]:
+    def get_listing_hash(self) -> str:
+        return NYSEScraper.instance.get_listing_hash()
+    @override
+    def get_listing(self) -> Sequence[NYSESecurity]:
         return [it for it in NYSEScraper.instance.get_securities() if it.exchange == NYSEAmerican.instance]
     
 class NYSEArca(Exchange):
+    __slots__ = ()
     def __init__(self):
         super().__init__('ARCX', 'ARCX', 'XNYS', 'NYSE Arca', NYSECalendar.instance)
     @override
-    @cached
-    def securities(self) -> Sequence[NYSESecurity]:
+    def get_listing_hash(self) -> str:
+        return NYSEScraper.instance.get_listing_hash()
+    @override
+    def get_listing(self) -> Sequence[NYSESecurity]:
         return [it for it in NYSEScraper.instance.get_securities() if it.exchange == NYSEArca.instance]
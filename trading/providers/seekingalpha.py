@@ -1,10 +1,11 @@
-#2
+#3
+import asyncio
 import json
 import logging
-from typing import TypedDict, override
+from typing import TYPE_CHECKING, TypedDict, override
 from datetime import datetime
-from bs4 import BeautifulSoup
-from base.scraping import scraper, backup_timeout
+from base.reflection import lazy_import
+from base.scraping import scraper, async_scraper, backup_timeout
 from trading.core.securities import Security
 from trading.core.news import BaseNewsProvider, News
 from trading.providers.forex import ForexSecurity
@@ -12,6 +13,9 @@ from trading.providers.nasdaq import NasdaqSecurity
 from trading.providers.nyse import NYSESecurity
 from trading.providers.utils import filter_news
 
+if TYPE_CHECKING: import bs4
+else: bs4 = lazy_import("bs4")
+
 logger = logging.getLogger(__name__)
 _MODULE: str = __name__.split(".")[-1]
 
@@ -35,12 +39,28 @@ class _NewsResponse(TypedDict):
     links: _NewsLinks
 
 _BASE_URL = "https://seekingalpha.com"
+_news_backup = backup_timeout()
 _COOKIES = {'_px3': 'af68f8fb5b5ccac7de1bcd1e9557a64ca5b54a306698c0183f442b892e57d595:dKFZkKZdn5YMhnVe9/z6Mmeu0Vwm9hHxkSUA12xuWMNzrzBEhvWN72yAkcs/21uiP2FNRzAYmXdyl1IhWgTqig==:1000:XTwygXvwwmUUlYgT7A6afuaPKRfJfP1V/ubqBfweaOzdYj2FzrwVIEpS1yYWXwHLg2Hdu8M4pe1w6fKMCzre5OEMW3L/9/vFIfRzFIQtOXysmQuLcIU33BSX4fmq4wtEMaSHXZ70WNml3AY90zQCEDe/xiIN0Q6JcQNtnFJzkmwCeU3vqCzGsti1r4SuxMkeyr0MVTrVnwWee1wEWlPGdeB57SWQIZ+Dt71z86HzN7I='}
 class SeekingAlpha(BaseNewsProvider):
 
-    @backup_timeout()
+    def _get_news_url(self, unix_from: float, unix_to: float, symbol: str) -> str:
+        return f"{_BASE_URL}/api/v3/symbols/{symbol}/news?filter[since]={int(unix_from-1000)}&filter[until]={int(unix_to+1000)}&id={symbol}&include=author&isMounting=true&page[size]=50&page[number]="
+    def _get_content_link(self, item: _NewsResponse) -> str|None:
+        att = item['attributes']
+        if not att['isLockedPro'] and not att['isPaywalled'] and 'self' in item['links']:
+            return f"{_BASE_URL}{item['links']['self']}"
+        return None
+    def _parse_content(self, text: str) -> str:
+        content_div = bs4.BeautifulSoup(text, "html.parser").find("div", attrs={"data-test-id": "content-container"})
+        assert content_div
+        return content_div.text
+    def _to_news(self, item: _NewsResponse, content: str|None) -> News:
+        att = item['attributes']
+        return News(datetime.fromisoformat(att['publishOn']).timestamp(), att['title'], content)
+
+    @_news_backup
     def _fetch_news(self, unix_from: float, unix_to: float, symbol: str) -> list[News]:
-        url = f"{_BASE_URL}/api/v3/symbols/{symbol}/news?filter[since]={int(unix_from-1000)}&filter[until]={int(unix_to+1000)}&id={symbol}&include=author&isMounting=true&page[size]=50&page[number]="
+        url = self._get_news_url(unix_from, unix_to, symbol)
         i = 1
         ret: list[News] = []
         while True:
@@ -48,19 +68,15 @@ class SeekingAlpha(BaseNewsProvider):
             data: list[_NewsResponse] = json.loads(result.text)['data']
             for item in data:
                 try:
-                    att = item['attributes']
-                    if not att['isLockedPro'] and not att['isPaywalled'] and 'self' in item['links']:
+                    link = self._get_content_link(item)
+                    if link:
                         try:
-                            link = f"{_BASE_URL}{item['links']['self']}"
-                            tmp = scraper.get(link, cookies=_COOKIES)
-                            content_div = BeautifulSoup(tmp.text, "html.parser").find("div", attrs={"data-test-id": "content-container"})
-                            assert content_div
-                            content = content_div.text
+                            content = self._parse_content(scraper.get(link, cookies=_COOKIES).text)
                         except:
                             logger.warning(f"Failed to fetch news content from {item['links']}", exc_info=True)
                             content = None
                     else: content = None
-                    ret.append(News(datetime.fromisoformat(att['publishOn']).timestamp(), att['title'], content))
+                    ret.append(self._to_news(item, content))
                 except:
                     logger.warning(f"Failed to parse news item: {item}.", exc_info=True)
                     pass
@@ -68,9 +84,41 @@ class SeekingAlpha(BaseNewsProvider):
                 break
             i += 1
         return ret
+    @_news_backup
+    async def _fetch_news_async(self, unix_from: float, unix_to: float, symbol: str) -> list[News]:
+        """Same as _fetch_news, but the contents of each page are fetched concurrently."""
+        url = self._get_news_url(unix_from, unix_to, symbol)
+        async def fetch_item(item: _NewsResponse) -> News|None:
+            try:
+                link = self._get_content_link(item)
+                if link:
+                    try:
+                        content = self._parse_content((await async_scraper.get(link, cookies=_COOKIES)).text)
+                    except:
+                        logger.warning(f"Failed to fetch news content from {item['links']}", exc_info=True)
+                        content = None
+                else: content = None
+                return self._to_news(item, content)
+            except:
+                logger.warning(f"Failed to parse news item: {item}.", exc_info=True)
+                return None
+        i = 1
+        ret: list[News] = []
+        while True:
+            result = await async_scraper.get(url + str(i), cookies=_COOKIES)
+            data: list[_NewsResponse] = json.loads(result.text)['data']
+            items = await asyncio.gather(*(fetch_item(item) for item in data))
+            ret.extend(it for it in items if it)
+            if len(data) < 50:
+                break
+            i += 1
+        return ret
     
     #region Overrides
     @override
     def get_news_raw(self, unix_from: float, unix_to: float, security: Security) -> list[News]:
         return filter_news(self._fetch_news(unix_from, unix_to, _get_symbol(security)), unix_from, unix_to)
+    @override
+    async def get_news_raw_async(self, unix_from: float, unix_to: float, security: Security) -> list[News]:
+        return filter_news(await self._fetch_news_async(unix_from, unix_to, _get_symbol(security)), unix_from, unix_to)
     #endregion
\ No newline at end of file
@@ -0,0 +1,197 @@
+#1
+import asyncio
+import logging
+import math
+import random
+import time
+import zlib
+from datetime import datetime, timedelta, time as dtime
+from typing import override
+import numpy as np
+from base import dates
+from trading.core import Interval
+from trading.core.securities import Security, DataProvider
+from trading.core.pricing import OHLCV, BasePricingProvider
+
+logger = logging.getLogger(__name__)
+_MINUTE = 60
+_DAY_MINUTES = 24*60
+_ERA_DAYS = 1024
+_YEAR = 365*24*3600
+_REFERENCE_DAY = 18262 # 2020-01-01, when each security is at its initial price
+_FIRST_TRADE_TIME = 946684800.0 # 2000-01-01
+
+class SyntheticPricingProvider(BasePricingProvider, DataProvider):
+    """
+    Generates deterministic pricing data locally, without any network access.
+    Each security follows a geometric Brownian motion sampled every minute,
+    and bars are aggregated from the minutes within the exchange's work hours only,
+    so all intervals are native and mutually consistent (e.g. a D1 close is the last M1 close of the day).
+    The same seed always produces the same series, regardless of the queried ranges.
+    Args:
+        drift: The annual drift of the log price.
+        volatility: The annual volatility of the log price.
+        history: How far back from now the data is available, in seconds.
+        latency: The artificial delay of each raw fetch, in seconds.
+        failure_rate: The probability of each raw fetch failing.
+        delay: The live delay of the data, in seconds.
+    """
+    def __init__(
+        self,
+        seed: int = 0,
+        *,
+        drift: float = 0.05,
+        volatility: float = 0.3,
+        history: float = 10*_YEAR,
+        latency: float = 0,
+        failure_rate: float = 0,
+        delay: float = 0,
+        local: bool = False
+    ):
+        BasePricingProvider.__init__(
+            self,
+            native = [Interval.L1, Interval.W1, Interval.D1, Interval.H1, Interval.M30, Interval.M15, Interval.M5, Interval.M1],
+            merge = {},
+            local = local
+        )
+        DataProvider.__init__(self)
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+        self.history = history
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delay = delay
+        self.random = random.Random(seed)
+        self._era_bases: dict[tuple[int, int], float] = {}
+        self._era_returns_cache: dict[tuple[int, int], np.ndarray] = {}
+
+    #region Generation
+    def _hash(self, security: Security) -> int:
+        return zlib.crc32(f"{security.exchange.mic}:{security.symbol}".encode())
+    def _rng(self, security_hash: int, *path: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, security_hash, *path])
+    def _initial_price(self, security_hash: int) -> float:
+        return float(10*math.exp(self._rng(security_hash, 2).uniform(0, math.log(50))))
+    def _base_volume(self, security_hash: int) -> float:
+        return float(10**self._rng(security_hash, 3).uniform(2, 4))
+
+    def _era_returns(self, security_hash: int, era: int) -> np.ndarray:
+        """The cumulative log returns at the start of each day of the given era, and at its end."""
+        if (security_hash, era) not in self._era_returns_cache:
+            day = 24*3600/_YEAR
+            totals = self._rng(security_hash, 1, era).normal(size=_ERA_DAYS)*self.volatility*math.sqrt(day) + (self.drift - self.volatility**2/2)*day
+            self._era_returns_cache[(security_hash, era)] = np.concatenate([[0], np.cumsum(totals)])
+        return self._era_returns_cache[(security_hash, era)]
+    def _era_base(self, security_hash: int, era: int) -> float:
+        """The log price at the start of the given era."""
+        if (security_hash, era) not in self._era_bases:
+            self._era_bases[(security_hash, era)] = 0.0 if era <= 0 else self._era_base(security_hash, era-1) + float(self._era_returns(security_hash, era-1)[-1])
+        return self._era_bases[(security_hash, era)]
+    def _day_path(self, security_hash: int, day: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the log prices at the start and end of each minute of the given (UTC) day, and the minute volumes.
+        The minute returns are sampled conditionally on the total return of the day (a brownian bridge),
+        so that days can be generated independently of each other.
+        """
+        era, index = divmod(day, _ERA_DAYS)
+        returns = self._era_returns(security_hash, era)
+        total = float(returns[index+1] - returns[index])
+        rng = self._rng(security_hash, 0, day)
+        z = rng.normal(size=_DAY_MINUTES)
+        increments = (z - z.mean())*self.volatility*math.sqrt(_MINUTE/_YEAR) + total/_DAY_MINUTES
+        end = self._era_base(security_hash, era) + float(returns[index]) + np.cumsum(increments)
+        volume = self._base_volume(security_hash)*np.exp(rng.normal(size=_DAY_MINUTES)*0.5)
+        return end - increments, end, volume
+    def _path(self, security: Security, minute_ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the start prices, end prices and volumes of the minutes ending at the given (sorted, whole minute) times."""
+        security_hash = self._hash(security)
+        minutes = (minute_ends // _MINUTE).astype(np.int64) - 1
+        days = minutes // _DAY_MINUTES
+        start, end, volume = np.empty(len(minutes)), np.empty(len(minutes)), np.empty(len(minutes))
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for lo, hi in zip([0, *bounds], [*bounds, len(minutes)]):
+            day_start, day_end, day_volume = self._day_path(security_hash, int(days[lo]))
+            index = minutes[lo:hi] % _DAY_MINUTES
+            start[lo:hi], end[lo:hi], volume[lo:hi] = day_start[index], day_end[index], day_volume[index]
+        era, index = divmod(_REFERENCE_DAY, _ERA_DAYS)
+        reference = self._era_base(security_hash, era) + float(self._era_returns(security_hash, era)[index])
+        initial = self._initial_price(security_hash)
+        return initial*np.exp(start - reference), initial*np.exp(end - reference), volume
+    def _work_minutes(self, unix_from: float, unix_to: float, security: Security) -> np.ndarray:
+        """The ends of all work minutes within (unix_from, unix_to]."""
+        calendar = security.exchange.calendar
+        result: list[np.ndarray] = []
+        day = calendar.unix_to_datetime(unix_from).date()
+        end = calendar.unix_to_datetime(unix_to).date()
+        while day <= end:
+            noon = datetime.combine(day, dtime(12), tzinfo=calendar.tz)
+            if not calendar.is_off(noon):
+                session_open = max(calendar.set_open(noon).timestamp(), unix_from)
+                session_close = min(calendar.set_close(noon).timestamp(), unix_to)
+                if session_close > session_open:
+                    result.append(np.arange(math.floor(session_open/_MINUTE)+1, math.floor(session_close/_MINUTE)+1)*_MINUTE)
+            day += timedelta(days=1)
+        return np.concatenate(result).astype(np.float64) if result else np.empty(0)
+
+    def _generate(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        calendar = security.exchange.calendar
+        unix_from = max(unix_from, self.get_interval_start(interval))
+        if unix_to <= unix_from: return []
+        timestamps = np.array(calendar.get_timestamps(unix_from, unix_to, interval))
+        if not len(timestamps): return []
+        starts = np.concatenate([[calendar.add_intervals(timestamps[0], interval, -1)], timestamps[:-1]])
+        minutes = self._work_minutes(starts[0], timestamps[-1], security)
+        if not len(minutes): return []
+        o, c, v = self._path(security, minutes)
+        lo = np.searchsorted(minutes, starts, side='right')
+        hi = np.searchsorted(minutes, timestamps, side='right')
+        nonempty = hi > lo
+        lo, hi, timestamps = lo[nonempty], hi[nonempty], timestamps[nonempty]
+        extremes = np.maximum(o, c), np.minimum(o, c)
+        h = np.maximum.reduceat(extremes[0][:hi[-1]], lo)
+        l = np.minimum.reduceat(extremes[1][:hi[-1]], lo)
+        volume = np.add.reduceat(v[:hi[-1]], lo)
+        return [
+            OHLCV(float(t), float(o[i]), float(hh), float(ll), float(c[j-1]), float(vv))
+            for t, i, j, hh, ll, vv in zip(timestamps, lo, hi, h, l, volume)
+        ]
+    def _fail(self, security: Security):
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise Exception(f"Synthetic failure for {security.symbol}.")
+    #endregion
+
+    #region Overrides
+    @override
+    def get_interval_start(self, interval: Interval) -> float:
+        return dates.unix() - self.history
+    @override
+    def get_pricing_delay(self, security: Security, interval: Interval) -> float:
+        return self.delay
+    @override
+    def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        if self.latency: time.sleep(self.latency)
+        self._fail(security)
+        return self._generate(unix_from, unix_to, security, interval)
+    @override
+    async def get_pricing_raw_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        if self.latency: await asyncio.sleep(self.latency)
+        self._fail(security)
+        return self._generate(unix_from, unix_to, security, interval)
+
+    @override
+    def get_outstanding_parts(self, security: Security) -> float:
+        return float(round(10**self._rng(self._hash(security), 4).uniform(6, 10)))
+    @override
+    def get_summary(self, security: Security) -> str:
+        return f"{security.name} is a synthetic security with seed {self.seed}."
+    @override
+    def get_first_trade_time(self, security: Security) -> float:
+        return _FIRST_TRADE_TIME
+    @override
+    def get_market_cap(self, security: Security) -> float:
+        now = dates.unix() - self.delay
+        pricing = self.get_pricing(now - 10*24*3600, now, security, Interval.D1)
+        if not pricing: raise Exception(f"No recent pricing for {security.symbol}.")
+        return self.get_outstanding_parts(security)*pricing[-1].c
+    #endregion
@@ -0,0 +1,88 @@
+import functools
+import os
+import unittest
+from pathlib import Path
+from base import dates
+from base.scraping import Cassette, scraper
+from trading.core.securities import Security, SecurityType
+from trading.providers.forex import ForexSecurity
+from trading.providers.nasdaq import FinancialStatus, NasdaqCM, NasdaqGS, NasdaqMS, NasdaqSecurity
+from trading.providers.nyse import NYSE, NYSEAmerican, NYSEArca, NYSESecurity
+
+CASSETTES = Path(__file__).parent/'cassettes'
+RECORD = 'RECORD_CASSETTES'
+
+class CassetteTestCase(unittest.TestCase):
+    """
+    Serves the http requests of the test case from a cassette named after the test case, without touching the network.
+    If the cassette does not exist, the test case fails. To record it from the live responses, run the whole
+    test case with the RECORD_CASSETTES environment variable set. The recording is written to a temporary file,
+    which replaces the cassette only if all tests of the case passed.
+    The clock is frozen at the time of the recording, so that requests relative to the current time are repeated exactly.
+    The tested providers should keep their storages in memory (local), so that each run makes the same requests.
+    """
+    failed = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls):
+            method = getattr(cls, name)
+            if name.startswith('test') and callable(method) and not hasattr(method, 'tracked'):
+                setattr(cls, name, CassetteTestCase._track(method))
+
+    @staticmethod
+    def _track(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except unittest.SkipTest:
+                raise
+            except BaseException:
+                type(self).failed = True
+                raise
+        wrapper.tracked = True # type: ignore
+        return wrapper
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.failed = False
+        cls.path = CASSETTES/f"{cls.__module__.split('.')[-1]}.{cls.__name__}.db"
+        cls.recording = bool(os.environ.get(RECORD))
+        if cls.recording:
+            cls.tmp_path = cls.path.with_name(f"{cls.path.name}.tmp")
+            cls.tmp_path.unlink(missing_ok=True)
+            cassette = Cassette.at(cls.tmp_path)
+            scraper.record(cassette)
+            cassette.set_time(dates.unix())
+        else:
+            if not cls.path.exists():
+                raise Exception(f"The cassette {cls.path} does not exist. Run the test case with {RECORD}=1 and network access to record it.")
+            cassette = Cassette.at(cls.path)
+            scraper.replay(cassette)
+        dates.set(cassette.get_time())
+        cls.addClassCleanup(dates.set, None)
+        cls.addClassCleanup(scraper.live)
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.recording:
+            if cls.failed: cls.tmp_path.unlink(missing_ok=True)
+            else: cls.tmp_path.replace(cls.path)
+        super().tearDownClass()
+
+def get_pricing_securities() -> list[tuple[Security, float]]:
+    """
+    The securities of the provider pricing tests, with the minimum ratio of returned bars.
+    Created directly rather than looked up, since the listings are not part of the cassettes.
+    """
+    return [
+        (NasdaqSecurity('NVDA', 'NVIDIA Corporation - Common Stock', SecurityType.STOCK, NasdaqGS.instance, FinancialStatus.NORMAL), 0.8),
+        (NasdaqSecurity('LUNR', 'Intuitive Machines, Inc. - Class A Common Stock', SecurityType.STOCK, NasdaqMS.instance, FinancialStatus.NORMAL), 0.8),
+        (NasdaqSecurity('RGTI', 'Rigetti Computing, Inc. - Common Stock', SecurityType.STOCK, NasdaqCM.instance, FinancialStatus.NORMAL), 0.7),
+        (NYSESecurity('KO', 'Coca-Cola Company (The)', SecurityType.STOCK, NYSE.instance), 0.8),
+        (NYSESecurity('IMO', 'Imperial Oil Limited', SecurityType.STOCK, NYSEAmerican.instance), 0.5),
+        (NYSESecurity('SPY', 'SPDR S&P 500 ETF Trust', SecurityType.ETF, NYSEArca.instance), 0.8),
+        (ForexSecurity('EUR', 'USD', ForexSecurity.Subtype.MAJOR), 0.8)
+    ]
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import unittest
+from typing import Sequence, override
+from base import dates
+from trading.core.interval import Interval
+from trading.core.pricing import OHLCV, PricingProvider
+from trading.core.tests.test_pricing import security
+from trading.providers.aggregate import AggregateProvider
+from trading.providers.synthetic import SyntheticPricingProvider
+
+class BlockedProvider(PricingProvider):
+    """Does not respond until released."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+    @override
+    def get_pricing(self, unix_from, unix_to, security, interval, *, interpolate = False, max_fill_ratio = 1) -> Sequence[OHLCV]:
+        self.started.set()
+        self.release.wait(timeout=10)
+        return []
+    @override
+    async def get_pricing_async(self, unix_from, unix_to, security, interval, *, interpolate = False, max_fill_ratio = 1) -> Sequence[OHLCV]:
+        self.started.set()
+        await asyncio.Event().wait()
+        return []
+    @override
+    def get_intervals(self) -> set[Interval]: return set(Interval)
+    @override
+    def get_interval_start(self, interval: Interval) -> float: return 0
+
+class TestAggregate(unittest.TestCase):
+    def get_range(self) -> tuple[float, float]:
+        unix_to = dates.unix()
+        return unix_to - 3*24*3600, unix_to
+    
+    def test_hedged(self):
+        slow = BlockedProvider()
+        self.addCleanup(slow.release.set)
+        fast = SyntheticPricingProvider(local=True)
+        aggregate = AggregateProvider([slow, fast], [], [], adaptive=True, prior_latency=0.01)
+        unix_from, unix_to = self.get_range()
+        # the first provider is blocked, so the result can only come from the hedged call
+        result = aggregate.get_pricing(unix_from, unix_to, security, Interval.H1)
+        self.assertTrue(slow.started.is_set())
+        self.assertFalse(slow.release.is_set())
+        self.assertEqual(fast.get_pricing(unix_from, unix_to, security, Interval.H1), result)
+        slow.release.set()
+        aggregate._get_executor().shutdown(wait=True)
+        # the fast provider is now preferred
+        self.assertLess(aggregate.get_stats(fast.get_pricing).score(), aggregate.get_stats(slow.get_pricing).score())
+        self.assertEqual([1, 0], aggregate._get_order([slow.get_pricing, fast.get_pricing]))
+
+    def test_hedged_old(self):
+        first = SyntheticPricingProvider(local=True)
+        slow = BlockedProvider()
+        self.addCleanup(slow.release.set)
+        aggregate = AggregateProvider([first, slow], [], [], adaptive=True, prior_latency=10)
+        unix_to = dates.unix()
+        unix_from = unix_to - 10*24*3600
+        result = aggregate.get_pricing(unix_from, unix_to, security, Interval.H1)
+        self.assertFalse(slow.started.is_set())
+        self.assertEqual(first.get_pricing(unix_from, unix_to, security, Interval.H1), result)
+        self.assertEqual(result, asyncio.run(aggregate.get_pricing_async(unix_from, unix_to, security, Interval.H1)))
+
+    def test_hedged_failure(self):
+        failing = SyntheticPricingProvider(failure_rate=1, local=True)
+        working = SyntheticPricingProvider(local=True)
+        # the prior latency is never reached, so the second provider is invoked because the first failed
+        aggregate = AggregateProvider([failing, working], [], [], adaptive=True, prior_latency=1000)
+        unix_from, unix_to = self.get_range()
+        result = aggregate.get_pricing(unix_from, unix_to, security, Interval.H1)
+        self.assertEqual(working.get_pricing(unix_from, unix_to, security, Interval.H1), result)
+        self.assertLess(aggregate.get_stats(failing.get_pricing).success, 1)
+        aggregate = AggregateProvider([failing], [], [], adaptive=True)
+        self.assertRaises(Exception, lambda: aggregate.get_pricing(unix_from, unix_to, security, Interval.H1))
+
+    def test_hedged_async(self):
+        slow = BlockedProvider()
+        fast = SyntheticPricingProvider(local=True)
+        aggregate = AggregateProvider([slow, fast], [], [], adaptive=True, prior_latency=0.01)
+        unix_from, unix_to = self.get_range()
+        result = asyncio.run(aggregate.get_pricing_async(unix_from, unix_to, security, Interval.H1))
+        self.assertTrue(slow.started.is_set())
+        self.assertEqual(fast.get_pricing(unix_from, unix_to, security, Interval.H1), result)
@@ -4,20 +4,12 @@ from trading.core.pricing import PricingProvider
 from trading.core.securities import Security
 from trading.core.tests.test_pricing import TestPricingProvider
 from trading.providers.financialtimes import FinancialTimes
-from trading.providers.nasdaq import NasdaqGS, NasdaqMS, NasdaqCM
-from trading.providers.nyse import NYSE, NYSEAmerican, NYSEArca
+from trading.providers.tests.cassettes import CassetteTestCase, get_pricing_securities
 
-class TestFinancialtimes(TestPricingProvider):
+class TestFinancialtimes(CassetteTestCase, TestPricingProvider):
     @override
     def get_provider(self) -> PricingProvider:
-        return FinancialTimes()
+        return FinancialTimes(local=True)
     @override
     def get_securities(self) -> list[tuple[Security, float]]:
-        return [
-            (NasdaqGS.instance.get_security('NVDA'), 0.8),
-            (NasdaqMS.instance.get_security('LUNR'), 0.8),
-            (NasdaqCM.instance.get_security('RGTI'), 0.7),
-            (NYSE.instance.get_security('KO'), 0.8),
-            (NYSEAmerican.instance.get_security('IMO'), 0.5),
-            (NYSEArca.instance.get_security('SPY'), 0.8)
-        ]
\ No newline at end of file
+        return get_pricing_securities()[:-1] # no forex
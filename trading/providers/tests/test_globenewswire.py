@@ -1,11 +1,12 @@
-import unittest
 import config
+from trading.core.securities import SecurityType
 from trading.providers.globenewswire import GlobeNewswire
-from trading.providers.nasdaq import Nasdaq
+from trading.providers.nasdaq import FinancialStatus, Nasdaq, NasdaqSecurity
+from trading.providers.tests.cassettes import CassetteTestCase
 
-security = Nasdaq.instance.get_security("NVDA")
-provider = GlobeNewswire()
-class TestGlobenewswire(unittest.TestCase):
+security = NasdaqSecurity('NVDA', 'NVIDIA Corporation - Common Stock', SecurityType.STOCK, Nasdaq.instance, FinancialStatus.NORMAL)
+provider = GlobeNewswire(local=True)
+class TestGlobenewswire(CassetteTestCase):
     def test_get_news(self):
         start_time = security.exchange.calendar.str_to_unix('2023-01-01 00:00:00')
         end_time = security.exchange.calendar.str_to_unix('2023-03-01 00:00:00')
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+_ROOT = Path(__file__).parents[3]
+_BUDGET = 2.0 # seconds, cumulative import time of the module
+_DEFERRED = ['matplotlib', 'yfinance', 'bs4', 'torchinfo', 'tqdm', 'torch']
+
+def import_times(module: str) -> dict[str, float]:
+    """Returns the cumulative import time of each module imported by importing the given one, in seconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=_ROOT, capture_output=True, text=True)
+    if result.returncode: raise Exception(f"Failed to import {module}.\n{result.stderr}")
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line: continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)/1e6
+    return times
+
+class TestImports(unittest.TestCase):
+    def test_aggregate_import_time(self):
+        times = import_times('trading.providers.aggregate')
+        self.assertLess(times['trading.providers.aggregate'], _BUDGET)
+        self.assertEqual([], [it for it in _DEFERRED if it in times])
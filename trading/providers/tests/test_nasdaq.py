@@ -1,5 +1,8 @@
+import hashlib
 from typing import override
 import unittest
+from unittest.mock import MagicMock, patch
+from base.key_value_storage import MemoryKVStorage
 from base.serialization import GenericSerializer
 from trading.core.securities import Exchange, SecurityType
 from trading.providers.nasdaq import NasdaqSecurity, Nasdaq, NasdaqGS
@@ -20,6 +23,17 @@ class TestNasdaq(unittest.TestCase):
         self.assertEqual(SecurityType.WARRANT, abblw.type)
         self.assertIs(NasdaqGS.instance, nvda.exchange)
 
+    def test_listing_hash(self):
+        text = 'Symbol|Security Name|Market Category|Test Issue|Financial Status|Round Lot Size|ETF|NextShares\nNVDA|NVIDIA Corporation - Common Stock|Q|N|N|100|N|N'
+        get = MagicMock(return_value=MagicMock(text=text))
+        with patch('trading.providers.nasdaq._listing_storage', MemoryKVStorage()), patch('trading.providers.nasdaq.scraper.get', get):
+            expect = hashlib.sha256(text.encode()).hexdigest()
+            self.assertEqual(expect, Nasdaq.instance.get_listing_hash())
+            self.assertEqual(expect, Nasdaq.instance.get_listing_hash())
+            self.assertEqual(['NVDA'], [it.symbol for it in Nasdaq.instance.get_listing()])
+            # the listing is fetched once, and the hash is read from the storage afterwards
+            self.assertEqual(1, get.call_count)
+
     def test_serialization(self):
         serializer = GenericSerializer()
         serialized = serializer.serialize(Nasdaq.instance)
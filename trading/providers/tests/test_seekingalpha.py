@@ -1,13 +1,14 @@
 import config
-import unittest
-from trading.providers.nasdaq import Nasdaq
+from trading.core.securities import SecurityType
+from trading.providers.nasdaq import FinancialStatus, Nasdaq, NasdaqSecurity
 from trading.providers.seekingalpha import SeekingAlpha
+from trading.providers.tests.cassettes import CassetteTestCase
 
-security = Nasdaq.instance.get_security('NVDA')
+security = NasdaqSecurity('NVDA', 'NVIDIA Corporation - Common Stock', SecurityType.STOCK, Nasdaq.instance, FinancialStatus.NORMAL)
 calendar = Nasdaq.instance.calendar
-provider = SeekingAlpha()
+provider = SeekingAlpha(local=True)
 
-class TestSeekingAlpha(unittest.TestCase):
+class TestSeekingAlpha(CassetteTestCase):
     def test_news(self):
         unix_from = calendar.str_to_unix('2020-01-01 00:00:00')
         unix_to = calendar.str_to_unix('2020-01-20 00:00:00')
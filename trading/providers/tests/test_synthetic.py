@@ -0,0 +1,53 @@
+from typing import override
+from base import dates
+from trading.core.interval import Interval
+from trading.core.pricing import PricingProvider
+from trading.core.securities import Security
+from trading.core.tests.test_pricing import TestPricingProvider, security, calendar
+from trading.providers.aggregate import AggregateProvider
+from trading.providers.synthetic import SyntheticPricingProvider
+
+provider = SyntheticPricingProvider(local=True)
+
+class TestSynthetic(TestPricingProvider):
+    @override
+    def get_provider(self) -> PricingProvider:
+        return provider
+    @override
+    def get_securities(self) -> list[tuple[Security, float]]:
+        return [(security, 1)]
+    
+    def test_deterministic(self):
+        unix_to = dates.unix()
+        unix_from = unix_to - 10*24*3600
+        expect = SyntheticPricingProvider(seed=1, local=True).get_pricing(unix_from, unix_to, security, Interval.M15)
+        other = SyntheticPricingProvider(seed=1, local=True)
+        other.get_pricing(unix_from - 3*24*3600, unix_from + 24*3600, security, Interval.M15)
+        self.assertEqual(expect, other.get_pricing(unix_from, unix_to, security, Interval.M15))
+        self.assertNotEqual(expect, SyntheticPricingProvider(seed=2, local=True).get_pricing(unix_from, unix_to, security, Interval.M15))
+
+    def test_consistent_intervals(self):
+        unix_to = calendar.to_zero(dates.unix() - 24*3600)
+        unix_from = unix_to - 7*24*3600
+        d1 = provider.get_pricing(unix_from, unix_to, security, Interval.D1)
+        m1 = provider.get_pricing(unix_from, unix_to, security, Interval.M1)
+        self.assertTrue(d1)
+        for day in d1:
+            minutes = [it for it in m1 if it.t > day.t - 24*3600 and it.t <= day.t]
+            self.assertEqual(day.o, minutes[0].o)
+            self.assertEqual(day.c, minutes[-1].c)
+            self.assertEqual(day.h, max(it.h for it in minutes))
+            self.assertEqual(day.l, min(it.l for it in minutes))
+            self.assertAlmostEqual(day.v, sum(it.v for it in minutes), 3)
+
+    def test_failure_rate(self):
+        failing = SyntheticPricingProvider(failure_rate=1, local=True)
+        unix_to = dates.unix()
+        self.assertRaises(Exception, lambda: failing.get_pricing(unix_to - 24*3600, unix_to, security, Interval.H1))
+
+    def test_aggregate(self):
+        aggregate = AggregateProvider([provider], [], [provider])
+        unix_to = dates.unix()
+        expect = provider.get_pricing(unix_to - 5*24*3600, unix_to, security, Interval.M5)
+        self.assertEqual(expect, aggregate.get_pricing(unix_to - 5*24*3600, unix_to, security, Interval.M5))
+        self.assertEqual(provider.get_first_trade_time(security), aggregate.get_first_trade_time(security))
@@ -3,32 +3,23 @@ import unittest
 from base import dates
 from trading.core.interval import Interval
 from trading.core.pricing import PricingProvider
-from trading.core.securities import Security
+from trading.core.securities import Security, SecurityType
 from trading.core.tests.test_pricing import TestPricingProvider
 from trading.providers.yahoo import Yahoo
-from trading.providers.nasdaq import Nasdaq, NasdaqGS, NasdaqMS, NasdaqCM
-from trading.providers.forex import Forex
-from trading.providers.nyse import NYSE, NYSEAmerican, NYSEArca
+from trading.providers.nasdaq import FinancialStatus, Nasdaq, NasdaqSecurity
+from trading.providers.tests.cassettes import CassetteTestCase, get_pricing_securities
 
-stock = Nasdaq.instance.get_security('NVDA')
+stock = NasdaqSecurity('NVDA', 'NVIDIA Corporation - Common Stock', SecurityType.STOCK, Nasdaq.instance, FinancialStatus.NORMAL)
 calendar = Nasdaq.instance.calendar
-provider = Yahoo()
+provider = Yahoo(local=True)
 
-class TestYahoo(TestPricingProvider):
+class TestYahoo(CassetteTestCase, TestPricingProvider):
     @override
     def get_provider(self) -> PricingProvider:
         return provider
     @override
     def get_securities(self) -> list[tuple[Security, float]]:
-        return [
-            (NasdaqGS.instance.get_security('NVDA'), 0.8),
-            (NasdaqMS.instance.get_security('LUNR'), 0.8),
-            (NasdaqCM.instance.get_security('RGTI'), 0.7),
-            (NYSE.instance.get_security('KO'), 0.8),
-            (NYSEAmerican.instance.get_security('IMO'), 0.5),
-            (NYSEArca.instance.get_security('SPY'), 0.8),
-            (Forex.instance.get_security('EURUSD'), 0.8)
-        ]
+        return get_pricing_securities()
     
     def test_pricing_l1(self):
         data = provider.get_pricing(
@@ -92,7 +83,7 @@ class TestYahoo(TestPricingProvider):
         self.assertAlmostEqual(111.19764, data[0].c, 4)
     
     def test_info(self):
-        tnya = Nasdaq.instance.get_security('TNYA')
+        tnya = NasdaqSecurity('TNYA', 'Tenaya Therapeutics, Inc. - Common Stock', SecurityType.STOCK, Nasdaq.instance, FinancialStatus.NORMAL)
         self.assertEqual(1627651800, provider.get_first_trade_time(tnya))
 
         result = provider.get_market_cap(tnya)
@@ -7,7 +7,7 @@ from datetime import timedelta
 from requests import TooManyRedirects
 from base.caching import KeySeriesStorage
 from base import dates
-from base.scraping import TooManyRequestsException, scraper, backup_timeout
+from base.scraping import TooManyRequestsException, scraper, async_scraper, backup_timeout
 from trading.core.interval import Interval
 from trading.core.securities import Security, SecurityType
 from trading.core.pricing import OHLCV, BasePricingProvider
@@ -21,6 +21,7 @@ _TOKEN_KEY='Dylan2010.Entitlementtoken'
 _TOKEN_VALUE='57494d5ed7ad44af85bc59a51dd87c90'
 _CKEY='57494d5ed7'
 _MODULE: str = __name__.split(".")[-1]
+_pricing_backup = backup_timeout()
 
 _security_types = {
     SecurityType.STOCK: 'STOCK',
@@ -38,18 +39,13 @@ def _get_symbol(security: Security) -> str:
     raise Exception(f"Unsupported security {security}.")
 
 class WallStreetJournal(BasePricingProvider):
-    def __init__(self):
+    def __init__(self, local: bool = False):
         super().__init__(
-            native = [Interval.D1, Interval.M30, Interval.M15, Interval.M5, Interval.M1]
+            native = [Interval.D1, Interval.M30, Interval.M15, Interval.M5, Interval.M1],
+            local = local
         )
 
-    @backup_timeout()
-    def _fetch_pricing(self, key: str, step: str, time_frame: Literal['D5', 'D10'], **kwargs):
-        """
-        WSJ timestamps represent the start of the relevant interval.
-        1 hour data is provided at full hours (10:00, 11:00...).
-        """
-        url = "https://api.wsj.net/api/michelangelo/timeseries/history"
+    def _get_pricing_params(self, key: str, step: str, time_frame: Literal['D5', 'D10']) -> dict:
         request = {
             "Step": step,
             "TimeFrame": time_frame,
@@ -78,7 +74,20 @@ class WallStreetJournal(BasePricingProvider):
                 }
             ]
         }
-        resp = scraper.get(url, params={'json': json.dumps(request), 'ckey': _CKEY}, headers={_TOKEN_KEY: _TOKEN_VALUE})
+        return {'json': json.dumps(request), 'ckey': _CKEY}
+    @_pricing_backup
+    def _fetch_pricing(self, key: str, step: str, time_frame: Literal['D5', 'D10'], **kwargs):
+        """
+        WSJ timestamps represent the start of the relevant interval.
+        1 hour data is provided at full hours (10:00, 11:00...).
+        """
+        url = "https://api.wsj.net/api/michelangelo/timeseries/history"
+        resp = scraper.get(url, params=self._get_pricing_params(key, step, time_frame), headers={_TOKEN_KEY: _TOKEN_VALUE})
+        return json.loads(resp.text)
+    @_pricing_backup
+    async def _fetch_pricing_async(self, key: str, step: str, time_frame: Literal['D5', 'D10'], **kwargs):
+        url = "https://api.wsj.net/api/michelangelo/timeseries/history"
+        resp = await async_scraper.get(url, params=self._get_pricing_params(key, step, time_frame), headers={_TOKEN_KEY: _TOKEN_VALUE})
         return json.loads(resp.text)
     
     def _get_interval(self, interval: Interval) -> str:
@@ -124,6 +133,15 @@ class WallStreetJournal(BasePricingProvider):
     @override
     def get_pricing_delay(self, security, interval) -> float:
         return 120
+    def _get_series(self, data: dict, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        def extract_data_points(series: dict) -> dict:
+            return {key: [it[index] for it in series['DataPoints']] for index,key in enumerate(series['DesiredDataPoints'])}
+        quotes = {'Timestamp': self._fix_timestamps(data['TimeInfo']['Ticks'], interval, security)}
+        for series in data['Series']:
+            quotes = {**quotes, **extract_data_points(series)}
+        quotes['Close'] = quotes['Last']
+        del quotes['Last']
+        return filter_ohlcv(arrays_to_ohlcv(quotes), unix_from, unix_to)
     @override
     def get_pricing_raw(self, unix_from, unix_to, security, interval) -> list[OHLCV]:
         time_frame = 'D5'
@@ -134,11 +152,15 @@ class WallStreetJournal(BasePricingProvider):
         except:
             logger.warning(f"Failed to fetch pricing for {security.symbol} from {dates.unix_to_str(unix_from)} to {dates.unix_to_str(unix_to)}. Returning [].")
             return []
-        def extract_data_points(series: dict) -> dict:
-            return {key: [it[index] for it in series['DataPoints']] for index,key in enumerate(series['DesiredDataPoints'])}
-        quotes = {'Timestamp': self._fix_timestamps(data['TimeInfo']['Ticks'], interval, security)}
-        for series in data['Series']:
-            quotes = {**quotes, **extract_data_points(series)}
-        quotes['Close'] = quotes['Last']
-        del quotes['Last']
-        return filter_ohlcv(arrays_to_ohlcv(quotes), unix_from, unix_to)
+        return self._get_series(data, unix_from, unix_to, security, interval)
+    @override
+    async def get_pricing_raw_async(self, unix_from, unix_to, security, interval) -> list[OHLCV]:
+        time_frame = 'D5'
+        try:
+            data = await self._fetch_pricing_async(_get_symbol(security), self._get_interval(interval), time_frame)
+        except TooManyRequestsException:
+            raise
+        except:
+            logger.warning(f"Failed to fetch pricing for {security.symbol} from {dates.unix_to_str(unix_from)} to {dates.unix_to_str(unix_to)}. Returning [].")
+            return []
+        return self._get_series(data, unix_from, unix_to, security, interval)
@@ -1,23 +1,24 @@
 #2
+import asyncio
 import json
-import yfinance # type: ignore
 import logging
 import time
 import math
-from typing import Literal, Mapping, override
+from functools import cached_property
+from typing import Literal, Mapping, Sequence, override
 from base.db import sqlite_engine
 from base.key_series_storage import MemoryKSStorage, SqlKSStorage
 from base.key_value_storage import FolderKVStorage, MemoryKVStorage, SqlKVStorage
 import config
 from base import dates
 from base.algos import binary_search
+from base.utils import get_or_set
 from base.caching import KeySeriesStorage, KeyValueStorage, cached_scalar
-from base.scraping import scraper, backup_timeout, BadResponseException, TooManyRequestsException
+from base.scraping import scraper, async_scraper, backup_timeout, BadResponseException, TooManyRequestsException
 import injection
 from trading.core import Interval
-from trading.core.news import MongoKVStorage
 from trading.core.securities import Security, DataProvider, SecurityType
-from trading.core.pricing import OHLCV, BasePricingProvider
+from trading.core.pricing import OHLCV, AdjustmentEvent, BasePricingProvider, adjust_pricing
 from trading.providers.nasdaq import NasdaqSecurity
 from trading.providers.nyse import NYSESecurity
 from trading.providers.utils import arrays_to_ohlcv, filter_ohlcv
@@ -28,7 +29,8 @@ from trading.providers.forex import ForexSecurity
 logger = logging.getLogger(__name__)
 _MODULE: str = __name__.split(".")[-1]
 _MIN_AFTER_FIRST_TRADE = 14*24*3600 # The minimum time after the first trade time to query for prices
-_ADJUSTMENT_PERIOD = 10*24*3600
+_DIVIDEND_LOOKBACK = 10*24*3600 # To include the close before each dividend
+_pricing_backup = backup_timeout()
 
 class Yahoo(BasePricingProvider, DataProvider):
     """
@@ -44,12 +46,23 @@ class Yahoo(BasePricingProvider, DataProvider):
             local = local
         )
         DataProvider.__init__(self)
+        self.first_trade_times: dict[str, float] = {}
 
-        name = Yahoo.__name__.lower()
-        self.local_info_storage = SqlKVStorage(injection.local_db, f"{name}_info")
-        self.remote_info_storage = MongoKVStorage(injection.mongo_db[f"{name}_info"])
+    # Like the pricing storages, the info storages are kept in memory when local (before, the local one was always in sqlite)
+    @cached_property
+    def local_info_storage(self) -> KeyValueStorage:
+        return injection.kv_storage(f"{self.name}_info", memory=self.local)
+    @cached_property
+    def remote_info_storage(self) -> KeyValueStorage:
+        return injection.kv_storage(f"{self.name}_info", remote=True, memory=self.local)
 
-    @backup_timeout()
+    def _get_pricing_url(self, start_time: float, end_time: float, symbol: str, interval: str, events: list[str], include_pre_post: bool) -> str:
+        result =  f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+        result += f"?period1={int(start_time)}&period2={math.ceil(end_time)}&interval={interval}"
+        result += f"&incldePrePost={str(include_pre_post).lower()}&events={"|".join(events)}"
+        result += f"&&lang=en-US&region=US"
+        return result
+    @_pricing_backup
     def _fetch_pricing(
         self,
         start_time: float, #unix
@@ -59,11 +72,19 @@ class Yahoo(BasePricingProvider, DataProvider):
         events: list[str] = [],
         include_pre_post = False
     ) -> dict:
-        result =  f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
-        result += f"?period1={int(start_time)}&period2={math.ceil(end_time)}&interval={interval}"
-        result += f"&incldePrePost={str(include_pre_post).lower()}&events={"|".join(events)}"
-        result += f"&&lang=en-US&region=US"
-        resp = scraper.get(result)
+        resp = scraper.get(self._get_pricing_url(start_time, end_time, symbol, interval, events, include_pre_post))
+        return json.loads(resp.text)
+    @_pricing_backup
+    async def _fetch_pricing_async(
+        self,
+        start_time: float, #unix
+        end_time: float, #unix
+        symbol: str,
+        interval: str,
+        events: list[str] = [],
+        include_pre_post = False
+    ) -> dict:
+        resp = await async_scraper.get(self._get_pricing_url(start_time, end_time, symbol, interval, events, include_pre_post))
         return json.loads(resp.text)
 
     def _get_interval(self, interval: Interval) -> str:
@@ -124,45 +145,105 @@ class Yahoo(BasePricingProvider, DataProvider):
     def get_pricing_delay(self, security: Security, interval: Interval) -> float:
         return 60
     @override
-    def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
-        first_trade_time = self.get_first_trade_time(security) if not security.type == SecurityType.FX else 0
-        now = dates.unix()
+    def get_pricing_max_batch(self, security: Security, interval: Interval) -> float|None:
+        # The largest spans the chart api serves in a single request
+        if interval >= Interval.D1: return float('inf')
+        if interval == Interval.H1: return 729*24*3600
+        if interval in {Interval.M30, Interval.M15, Interval.M5}: return 59*24*3600
+        if interval == Interval.M1: return 7*24*3600
+        raise Exception(f"Unsupported interval {interval}.")
+    def _get_first_trade_time(self, security: Security) -> float:
+        if security.type == SecurityType.FX: return 0
+        return get_or_set(self.first_trade_times, security.symbol, lambda _: self.get_first_trade_time(security))
+    def _get_query_span(self, unix_from: float, unix_to: float, security: Security, interval: Interval, first_trade_time: float) -> tuple[float, float]|None:
         query_from = max(unix_from - interval.time(), first_trade_time + _MIN_AFTER_FIRST_TRADE)
         query_from = max(query_from, self.get_interval_start(interval))
         query_to = unix_to
-        if query_to <= query_from: return []
+        if query_to <= query_from: return None
+        return query_from, query_to
+    def _get_series(self, data: dict, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        data = data['chart']['result'][0]
+        if 'timestamp' not in data or not data['timestamp']: return []
+        arrays: dict = data['indicators']['quote'][0]
+        arrays['timestamp'] = self._fix_timestamps(data['timestamp'], interval, security)
         try:
-            data = self._fetch_pricing(query_from, query_to, self._get_symbol(security), self._get_interval(interval))
+            arrays['close'] = data['indicators']['adjclose'][0]['adjclose']
+        except:
+            pass
+        return filter_ohlcv(arrays_to_ohlcv(arrays), unix_from, unix_to)
+    def _unadjust(self, series: list[OHLCV], events: Sequence[AdjustmentEvent]) -> list[OHLCV]:
+        """Intraday bars come split adjusted as of the fetch, so the known splits are reverted before caching."""
+        return adjust_pricing(series, [AdjustmentEvent(it.t, 1/it.factor, True) for it in events if it.split])
+    def _get_adjustment_events(self, data: dict, unix_from: float, unix_to: float, security: Security) -> list[AdjustmentEvent]:
+        data = data['chart']['result'][0]
+        events = data.get('events', {})
+        timestamps: list[float|None] = data.get('timestamp', [])
+        closes: list[float|None] = data['indicators']['quote'][0].get('close', []) if timestamps else []
+        result: list[AdjustmentEvent] = []
+        for it in events.get('splits', {}).values():
+            result.append(AdjustmentEvent(security.exchange.calendar.set_open(it['date']), it['denominator']/it['numerator'], True))
+        for it in events.get('dividends', {}).values():
+            i = binary_search(timestamps, it['date'], key=lambda x: x or 0, side='LT')
+            if i < 0 or not closes[i]:
+                logger.warning(f"No close before the dividend of {security.symbol} at {it['date']}. Skipping.")
+                continue
+            result.append(AdjustmentEvent(security.exchange.calendar.set_open(it['date']), 1 - it['amount']/closes[i]))
+        return sorted([it for it in result if unix_from < it.t <= unix_to], key=lambda it: it.t)
+
+    @override
+    def get_pricing_raw(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        first_trade_time = self._get_first_trade_time(security)
+        span = self._get_query_span(unix_from, unix_to, security, interval, first_trade_time)
+        if not span: return []
+        try:
+            data = self._fetch_pricing(*span, self._get_symbol(security), self._get_interval(interval))
+        except BadResponseException:
+            logger.error(f"Bad response for {security.symbol} from {unix_from} to {unix_to} at {interval}. PERMANENT EMPTY RETURN!", exc_info=True)
+            return []
+        series = self._get_series(data, unix_from, unix_to, security, interval)
+        if series and interval in self.get_adjusted_intervals() and security.type != SecurityType.FX:
+            series = self._unadjust(series, self._get_adjustments(series[0].t-1, dates.unix(), security))
+        return series
+    @override
+    async def get_pricing_raw_async(self, unix_from: float, unix_to: float, security: Security, interval: Interval) -> list[OHLCV]:
+        first_trade_time = await asyncio.to_thread(self._get_first_trade_time, security)
+        span = self._get_query_span(unix_from, unix_to, security, interval, first_trade_time)
+        if not span: return []
+        try:
+            data = await self._fetch_pricing_async(*span, self._get_symbol(security), self._get_interval(interval))
         except BadResponseException:
             logger.error(f"Bad response for {security.symbol} from {unix_from} to {unix_to} at {interval}. PERMANENT EMPTY RETURN!", exc_info=True)
             return []
-        def get_series(data: dict, unix_from: float, unix_to: float, interval: Interval) -> list[OHLCV]:
-            data = data['chart']['result'][0]
-            if 'timestamp' not in data or not data['timestamp']: return []
-            arrays: dict = data['indicators']['quote'][0]
-            arrays['timestamp'] = self._fix_timestamps(data['timestamp'], interval, security)
-            try:
-                arrays['close'] = data['indicators']['adjclose'][0]['adjclose']
-            except:
-                pass
-            return filter_ohlcv(arrays_to_ohlcv(arrays), unix_from, unix_to)
-        def try_adjust(series: list[OHLCV]) -> list[OHLCV]:
-            try:
-                d1data = self.get_pricing(unix_to - _ADJUSTMENT_PERIOD, unix_to, security, Interval.D1)
-                close = d1data[-1]['c']
-                time = security.exchange.calendar.set_close(d1data[-1]['t'])
-                i = binary_search(series, time, lambda x: x.t)
-                if i is not None:
-                    factor = close / series[i]['c']
-                    return [it.adjust(factor)  for it in series ]
-                raise Exception(f"No suitable timestamp found.")
-            except:
-                logger.error(f"Failed to adjust {security.symbol}.", exc_info=True)
-                return series
-        series = get_series(data, unix_from, unix_to, interval)
-        if interval <= Interval.H1 and unix_to < now - 15*24*3600 and security.type != SecurityType.FX:
-            return try_adjust(series)
+        series = self._get_series(data, unix_from, unix_to, security, interval)
+        if series and interval in self.get_adjusted_intervals() and security.type != SecurityType.FX:
+            series = self._unadjust(series, await self._get_adjustments_async(series[0].t-1, dates.unix(), security))
         return series
+    @override
+    def get_adjusted_intervals(self) -> set[Interval]:
+        # Daily and longer bars are adjusted by yahoo (adjclose)
+        return {it for it in self.get_intervals() if it <= Interval.H1}
+    @override
+    def get_adjustments_raw(self, unix_from: float, unix_to: float, security: Security) -> list[AdjustmentEvent]:
+        if security.type == SecurityType.FX: return []
+        query_from = max(unix_from - _DIVIDEND_LOOKBACK, self.get_interval_start(Interval.D1))
+        if unix_to <= query_from: return []
+        try:
+            data = self._fetch_pricing(query_from, unix_to, self._get_symbol(security), self._get_interval(Interval.D1), ['div', 'split'])
+        except BadResponseException:
+            logger.error(f"Bad response for {security.symbol} adjustments from {unix_from} to {unix_to}. PERMANENT EMPTY RETURN!", exc_info=True)
+            return []
+        return self._get_adjustment_events(data, unix_from, unix_to, security)
+    @override
+    async def get_adjustments_raw_async(self, unix_from: float, unix_to: float, security: Security) -> list[AdjustmentEvent]:
+        if security.type == SecurityType.FX: return []
+        query_from = max(unix_from - _DIVIDEND_LOOKBACK, self.get_interval_start(Interval.D1))
+        if unix_to <= query_from: return []
+        try:
+            data = await self._fetch_pricing_async(query_from, unix_to, self._get_symbol(security), self._get_interval(Interval.D1), ['div', 'split'])
+        except BadResponseException:
+            logger.error(f"Bad response for {security.symbol} adjustments from {unix_from} to {unix_to}. PERMANENT EMPTY RETURN!", exc_info=True)
+            return []
+        return self._get_adjustment_events(data, unix_from, unix_to, security)
 
     def _get_info_key(self, security: Security) -> str:
         return security.symbol
@@ -173,8 +254,13 @@ class Yahoo(BasePricingProvider, DataProvider):
         storage=_get_info_storage
     )
     def _get_info(self, security: Security) -> dict:
+        def fetch_info() -> dict:
+            import yfinance # type: ignore
+            return yfinance.Ticker(symbol).info
+        symbol = self._get_symbol(security)
         try:
-            info = yfinance.Ticker(self._get_symbol(security)).info
+            # yfinance uses its own session, so the call is recorded and replayed separately
+            info = scraper.call(f"yfinance://info/{symbol}", fetch_info)
         except json.JSONDecodeError:
             raise TooManyRequestsException()
         mock_time = int(dates.unix() - 15*24*3600)